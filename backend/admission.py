@@ -0,0 +1,152 @@
+"""Filters applied to incoming rows before anything is stored.
+
+Duplicates (same session, type, timestamp and payload as a recently
+admitted event) and events over a session's rate limit are dropped and
+counted instead of written.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DUPLICATE = "duplicate"
+RATE_LIMITED = "rate_limited"
+
+
+class DedupFilter:
+    """Keys of recently admitted events, least recently seen evicted first"""
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self._keys: "OrderedDict[int, None]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def seen(self, key: int) -> bool:
+        """Whether key was admitted before; otherwise remember it"""
+        if key in self._keys:
+            self._keys.move_to_end(key)
+            return True
+        self._keys[key] = None
+        if len(self._keys) > self.max_entries:
+            self._keys.popitem(last=False)
+        return False
+
+    def forget(self, keys: Iterable[int]):
+        for key in keys:
+            self._keys.pop(key, None)
+
+
+def dedup_key(row: tuple, client_timestamp: Optional[int]) -> Optional[int]:
+    """Key of an events table row as the client sent it, or None if it can't be told from a retry.
+
+    The row's timestamp may be server time (missing or skewed client
+    timestamps are replaced), so the key uses the client's; an event sent
+    without one has no key and is never treated as a duplicate.
+    """
+    if not client_timestamp:
+        return None
+    return hash((row[0], row[1], client_timestamp, row[3], row[4], row[5]))
+
+
+class TokenBucketLimiter:
+    """Per-session token buckets: `rate` events per second, bursts up to `burst`"""
+
+    def __init__(self, rate: float, burst: float, max_sessions: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_sessions = max_sessions
+        # session_id -> [tokens, last refill (monotonic seconds)]
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def allow(self, session_id: str, now: Optional[float] = None) -> bool:
+        if now is None:
+            now = time.monotonic()
+        bucket = self._buckets.get(session_id)
+        if bucket is None:
+            bucket = self._buckets[session_id] = [self.burst, now]
+            if len(self._buckets) > self.max_sessions:
+                # A session evicted here comes back with a full bucket
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(session_id)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+
+class IngestFilter:
+    """Dedup for every event type, then rate limiting for the noisy ones.
+
+    Rows are events table rows (event_type, payload, timestamp, session_id,
+    paste_length, tab_id), each with a key from dedup_key(), so retries of
+    the same event (same client timestamp and payload) are caught.
+    """
+
+    def __init__(self, dedup: Optional[DedupFilter], limiter: Optional[TokenBucketLimiter],
+                 limited_types: Iterable[str] = (), top_sessions: int = 1000):
+        self.dedup = dedup
+        self.limiter = limiter
+        self.limited_types = frozenset(limited_types)
+        self.top_sessions = top_sessions
+        # (reason, event_type) -> count
+        self.rejected: Dict[Tuple[str, str], int] = {}
+        # session_id -> count for the last top_sessions sessions with rejections
+        self.rejected_sessions: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def admit(
+        self, rows: List[tuple], row_keys: List[Optional[int]]
+    ) -> Tuple[List[tuple], List[Optional[int]], List[Optional[str]]]:
+        """Returns (admitted rows, their dedup keys, per-row verdict: None or the reason it was dropped)"""
+        admitted, keys, verdicts = [], [], []
+        with self._lock:
+            now = time.monotonic()
+            for row, key in zip(rows, row_keys):
+                if self.dedup is not None and key is not None and self.dedup.seen(key):
+                    verdict = DUPLICATE
+                elif self.limiter is not None and row[0] in self.limited_types and not self.limiter.allow(row[3], now):
+                    verdict = RATE_LIMITED
+                    if self.dedup is not None and key is not None:
+                        # Not stored, so a later retry isn't a duplicate
+                        self.dedup.forget((key,))
+                else:
+                    verdict = None
+                    admitted.append(row)
+                    keys.append(key)
+                if verdict is not None:
+                    self._count(verdict, row[0], row[3])
+                verdicts.append(verdict)
+        return admitted, keys, verdicts
+
+    def release(self, keys: List[Optional[int]]):
+        """Forget the keys of admitted rows that failed to store, so their retries get in"""
+        if self.dedup is not None:
+            with self._lock:
+                self.dedup.forget(key for key in keys if key is not None)
+
+    def _count(self, reason: str, event_type: str, session_id: str):
+        self.rejected[(reason, event_type)] = self.rejected.get((reason, event_type), 0) + 1
+        self.rejected_sessions[session_id] = self.rejected_sessions.pop(session_id, 0) + 1
+        if len(self.rejected_sessions) > self.top_sessions:
+            self.rejected_sessions.popitem(last=False)
+
+    def stats(self, top: int = 10) -> dict:
+        with self._lock:
+            by_reason: Dict[str, Dict[str, int]] = {}
+            for (reason, event_type), count in self.rejected.items():
+                by_reason.setdefault(reason, {})[event_type] = count
+            sessions = sorted(self.rejected_sessions.items(), key=lambda item: item[1], reverse=True)[:top]
+            return {
+                "rejected": by_reason,
+                "top_sessions": [{"session_id": session_id, "rejected": count} for session_id, count in sessions],
+                "dedup_entries": len(self.dedup) if self.dedup is not None else 0,
+                "tracked_sessions": len(self.limiter) if self.limiter is not None else 0
+            }
@@ -0,0 +1,216 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, List, Optional
+
+
+class EventCounters:
+    """In-memory per-type event counts, updated on insert instead of scanning the table"""
+
+    def __init__(self):
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    async def rebuild(self, reader):
+        """Reload the counts from the rollup totals, which cover raw and compacted events (used at startup)"""
+        counts = await reader.rollup_totals()
+        with self._lock:
+            self._counts = counts
+
+    def add(self, event_types: Iterable[str]):
+        with self._lock:
+            for event_type in event_types:
+                self._counts[event_type] = self._counts.get(event_type, 0) + 1
+
+    def add_count(self, event_type: str, count: int):
+        with self._lock:
+            self._counts[event_type] = self._counts.get(event_type, 0) + count
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def check(self, expected: Dict[str, int]) -> Dict[str, dict]:
+        """Compare the in-memory counts with counts read from the database"""
+        actual = self.snapshot()
+        return {
+            event_type: {"memory": actual.get(event_type, 0), "database": expected.get(event_type, 0)}
+            for event_type in sorted(set(expected) | set(actual))
+            if actual.get(event_type, 0) != expected.get(event_type, 0)
+        }
+
+
+class RecentEvents:
+    """The most recently inserted events, kept as stored rows for the debug page"""
+
+    def __init__(self, size: int = 20):
+        # (id, event_type, data, timestamp, paste_length, tab_id), oldest first
+        self._events = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, ids, rows):
+        """Record inserted rows (event_type, data, timestamp, session_id, paste_length, tab_id)"""
+        size = self._events.maxlen
+        with self._lock:
+            for event_id, row in zip(ids[-size:], rows[-size:]):
+                self._events.append((event_id, row[0], row[1], row[2], row[4], row[5]))
+
+    @property
+    def latest_id(self) -> int:
+        with self._lock:
+            return self._events[-1][0] if self._events else 0
+
+    def snapshot(self) -> list:
+        """Newest first"""
+        with self._lock:
+            return list(reversed(self._events))
+
+    async def rebuild(self, reader):
+        rows = await reader.latest_events(self._events.maxlen)
+        with self._lock:
+            self._events.clear()
+            self._events.extend(reversed(rows))
+
+
+# Supported ?window= values, in minutes
+WINDOWS = {"5m": 5, "15m": 15, "1h": 60}
+
+
+def minute_of(timestamp_ms: float) -> int:
+    return int(timestamp_ms // 60000)
+
+
+class MinuteRing:
+    """Per-minute event-type counts for the last `size` minutes"""
+
+    __slots__ = ("minutes", "counts", "latest")
+
+    def __init__(self, size: int):
+        self.minutes = [-1] * size
+        self.counts: List[Dict[str, int]] = [{} for _ in range(size)]
+        self.latest = -1
+
+    def add(self, minute: int, event_type: str, count: int = 1):
+        size = len(self.minutes)
+        if minute <= self.latest - size:
+            return  # older than the ring covers; still kept in the rollup table
+        slot = minute % size
+        if self.minutes[slot] != minute:
+            self.minutes[slot] = minute
+            self.counts[slot] = {}
+        bucket = self.counts[slot]
+        bucket[event_type] = bucket.get(event_type, 0) + count
+        self.latest = max(self.latest, minute)
+
+    def buckets(self, now_minute: int, window: int):
+        """Yield (age_in_minutes, counts) for the buckets inside the window"""
+        size = len(self.minutes)
+        for age in range(min(window, size)):
+            minute = now_minute - age
+            slot = minute % size
+            if self.minutes[slot] == minute:
+                yield age, self.counts[slot]
+
+
+class RollingWindows:
+    """Per-session and global minute rings backing windowed and decayed risk.
+
+    Kept current on insert and rebuilt from the event_rollups table, so a
+    window query walks at most one bucket per minute instead of raw events.
+    Buckets more than max_ahead_minutes past the current minute are ignored:
+    the rings follow their latest minute, so one far-future timestamp would
+    otherwise push every current event out of the window.
+    """
+
+    GLOBAL = None
+
+    def __init__(self, horizon_minutes: int = 60, max_sessions: int = 10000, max_ahead_minutes: int = 5):
+        self.horizon = horizon_minutes
+        self.max_sessions = max_sessions
+        self.max_ahead = max_ahead_minutes
+        self._rings: "OrderedDict[Optional[str], MinuteRing]" = OrderedDict()
+        self._rings[self.GLOBAL] = MinuteRing(horizon_minutes)
+        self._lock = threading.Lock()
+
+    def _ring(self, session_id: Optional[str]) -> MinuteRing:
+        ring = self._rings.get(session_id)
+        if ring is None:
+            ring = self._rings[session_id] = MinuteRing(self.horizon)
+        elif session_id is not self.GLOBAL:
+            self._rings.move_to_end(session_id)
+        return ring
+
+    def _evict(self, now_minute: int):
+        # Sessions are kept in update order; the global ring is pinned first
+        while len(self._rings) > 1:
+            session_id, ring = next(
+                (key, value) for key, value in self._rings.items() if key is not self.GLOBAL
+            )
+            if len(self._rings) - 1 <= self.max_sessions and ring.latest > now_minute - self.horizon:
+                break
+            del self._rings[session_id]
+
+    def add(self, session_id: str, event_type: str, minute: int, count: int = 1):
+        now_minute = minute_of(time.time() * 1000)
+        if minute > now_minute + self.max_ahead:
+            return
+        with self._lock:
+            self._rings[self.GLOBAL].add(minute, event_type, count)
+            self._ring(session_id).add(minute, event_type, count)
+            self._evict(now_minute)
+
+    def has_session(self, session_id: str) -> bool:
+        return session_id in self._rings
+
+    def counts(self, session_id: Optional[str], window: int, now_minute: Optional[int] = None) -> Dict[str, int]:
+        """Event counts over the last `window` minutes"""
+        if now_minute is None:
+            now_minute = minute_of(time.time() * 1000)
+        totals: Dict[str, int] = {}
+        with self._lock:
+            ring = self._rings.get(session_id)
+            if ring is not None:
+                for _, bucket in ring.buckets(now_minute, window):
+                    for event_type, count in bucket.items():
+                        totals[event_type] = totals.get(event_type, 0) + count
+        return totals
+
+    def decayed_counts(self, session_id: Optional[str], half_life: float,
+                       now_minute: Optional[int] = None) -> Dict[str, float]:
+        """Event counts over the horizon, each bucket weighted by 0.5 ** (age / half_life)"""
+        if now_minute is None:
+            now_minute = minute_of(time.time() * 1000)
+        totals: Dict[str, float] = {}
+        with self._lock:
+            ring = self._rings.get(session_id)
+            if ring is not None:
+                for age, bucket in ring.buckets(now_minute, self.horizon):
+                    decay = 0.5 ** (age / half_life)
+                    for event_type, count in bucket.items():
+                        totals[event_type] = totals.get(event_type, 0.0) + count * decay
+        return totals
+
+    async def load_session(self, reader, session_id: str):
+        """Load one session's recent buckets from the rollups (e.g. after eviction)"""
+        now_minute = minute_of(time.time() * 1000)
+        rows = await reader.rollups(now_minute - self.horizon, session_id)
+        with self._lock:
+            if session_id in self._rings:
+                return
+            ring = self._ring(session_id)
+            for _, minute, event_type, count in rows:
+                if minute <= now_minute + self.max_ahead:
+                    ring.add(minute, event_type, count)
+
+    async def rebuild(self, reader):
+        """Reload the last horizon of buckets from the rollups (used at startup)"""
+        now_minute = minute_of(time.time() * 1000)
+        rows = await reader.rollups(now_minute - self.horizon)
+        with self._lock:
+            self._rings = OrderedDict()
+            self._rings[self.GLOBAL] = MinuteRing(self.horizon)
+            for session_id, minute, event_type, count in rows:
+                if minute > now_minute + self.max_ahead:
+                    continue
+                self._rings[self.GLOBAL].add(minute, event_type, count)
+                self._ring(session_id).add(minute, event_type, count)
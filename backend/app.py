@@ -1,20 +1,87 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime
+import asyncio
+import csv
+import io
 import json
-import sqlite3
+import logging
+import math
 import time
 import os
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 import uvicorn
 
+from admission import DUPLICATE, RATE_LIMITED, DedupFilter, IngestFilter, TokenBucketLimiter, dedup_key
+from aggregates import WINDOWS, EventCounters, RecentEvents, RollingWindows
+from codec import format_timestamp, get_codec, load_payload, split_payload
+from dashboard import DebugDashboard
+from db import rollup_rows
+from eventlog import LogConsumer, SegmentLog
+from features import FEATURE_NAMES, FeatureStore
+from ingest import BATCH_SCHEMA, EVENT_SCHEMA, EventResponse, decode_body, parse_events
+from keystrokes import KeystrokeAggregator, summary_record
+from maintenance import run_periodically
+from metrics import MetricsMiddleware, Registry
+from model_service import BehaviorModel, PredictionBatcher
+from postgres import PostgresEventStore
+from realtime import RiskBroadcaster
+from risk import DEFAULT_CONFIG_PATH, RiskConfig
+from sequences import SequenceAnalyzer, load_rules
+from shared import SharedAggregates, SharedEventCounters
+from storage import EventStore, SQLiteEventStore
+from writer import EventWriter
+from writer_service import WriterClient
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the database, start background tasks, and flush the write-behind queue on shutdown"""
+    await open_storage()
+    risk_broadcaster.start()
+    # Load the behavior model in the background so startup isn't blocked on it
+    asyncio.ensure_future(behavior_model.ensure_loaded())
+    if event_writer is not None:
+        event_writer.start()
+    if event_log is not None:
+        event_log.start_syncing()
+        log_consumer.start()
+    background_tasks = [asyncio.ensure_future(risk_config.watch(RISK_CONFIG_POLL_S, risk_broadcaster.notify))]
+    if keystroke_aggregator is not None and event_log is None:
+        # In log mode summaries are stored with each materialized batch instead
+        background_tasks.append(
+            asyncio.ensure_future(keystroke_aggregator.run(store_keystroke_summaries, KEYSTROKE_FLUSH_INTERVAL_S))
+        )
+    if writer_client is not None:
+        background_tasks.append(asyncio.ensure_future(follow_writer(FOLLOW_INTERVAL_MS / 1000)))
+    elif EVENT_RETENTION_HOURS > 0:
+        background_tasks.append(asyncio.ensure_future(run_periodically(store.compact, MAINTENANCE_INTERVAL_S)))
+    yield
+    for task in background_tasks:
+        task.cancel()
+    if event_writer is not None:
+        await event_writer.stop()
+    if event_log is not None:
+        await event_log.close()
+        await log_consumer.stop()
+    if keystroke_aggregator is not None:
+        try:
+            await keystroke_aggregator.flush(store_keystroke_summaries)
+        except Exception:
+            logger.exception("Failed to flush %d keystrokes at shutdown", len(keystroke_aggregator))
+    risk_broadcaster.stop()
+    await close_storage()
+
 # Initialize app
 app = FastAPI(
     title="AI Interview Monitor API",
     version="1.0",
-    description="Backend API for detecting AI-assisted behavior in interviews"
+    description="Backend API for detecting AI-assisted behavior in interviews",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -26,24 +93,187 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Database setup
-conn = sqlite3.connect('interview_data.db', check_same_thread=False)
-cursor = conn.cursor()
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS events (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    event_type TEXT NOT NULL,
-    data TEXT,
-    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-    session_id TEXT DEFAULT 'default'
+# Prometheus metrics, served at /metrics
+metrics = Registry()
+app.add_middleware(
+    MetricsMiddleware,
+    latency=metrics.histogram("http_request_duration_seconds", "Request latency by route", ("method", "route")),
+    responses=metrics.counter("http_responses_total", "Responses by route and status", ("method", "route", "status"))
 )
-''')
-conn.commit()
+db_latency = metrics.histogram(
+    "db_operation_duration_seconds", "Write lock wait, execute, commit and read pool wait times", ("op",)
+)
+events_ingested = metrics.counter("events_ingested_total", "Events stored, by type", ("type",))
+events_rejected = metrics.counter(
+    "events_rejected_total", "Events dropped before storage, by reason (duplicate, rate_limited) and type", ("reason", "type")
+)
+sequence_findings = metrics.counter("sequence_findings_total", "Event sequences flagged, by rule", ("rule",))
+
+# Ingestion settings
+# INGEST_MODE=sync writes each request before responding; INGEST_MODE=queue
+# validates, scores and enqueues the event, and a background task flushes it.
+# INGEST_MODE=log appends the event to a durable on-disk log (see eventlog.py)
+# and answers once it is fsynced; a consumer then stores it.
+INGEST_MODE = os.environ.get("INGEST_MODE", "sync")
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 1000))
+EVENT_FLUSH_INTERVAL_MS = int(os.environ.get("EVENT_FLUSH_INTERVAL_MS", 200))
+EVENT_FLUSH_MAX_BATCH = int(os.environ.get("EVENT_FLUSH_MAX_BATCH", 500))
+EVENT_QUEUE_MAX = int(os.environ.get("EVENT_QUEUE_MAX", 10000))
+# Retries of a failing queued batch before it is logged and dropped
+EVENT_FLUSH_MAX_RETRIES = int(os.environ.get("EVENT_FLUSH_MAX_RETRIES", 5))
+# KEYSTROKE_MODE=aggregate folds keystrokes into per-session, per-minute
+# summaries (see keystrokes.py), written every KEYSTROKE_FLUSH_INTERVAL_S,
+# instead of storing one row each; KEYSTROKE_MODE=raw stores every keystroke
+KEYSTROKE_MODE = os.environ.get("KEYSTROKE_MODE", "raw")
+KEYSTROKE_FLUSH_INTERVAL_S = float(os.environ.get("KEYSTROKE_FLUSH_INTERVAL_S", 5))
+# Recently admitted events remembered for duplicate detection (0 disables)
+DEDUP_MAX_ENTRIES = int(os.environ.get("DEDUP_MAX_ENTRIES", 100000))
+# Per-session token bucket for the noisy event types (RATE_LIMIT_PER_S=0 disables)
+RATE_LIMIT_PER_S = float(os.environ.get("RATE_LIMIT_PER_S", 50))
+RATE_LIMIT_BURST = float(os.environ.get("RATE_LIMIT_BURST", 1000))
+RATE_LIMITED_TYPES = [
+    event_type for event_type in os.environ.get("RATE_LIMITED_TYPES", "KEYSTROKE,WINDOW_BLUR,TAB_SWITCH").split(",")
+    if event_type
+]
+# Upper bound on pushed summary updates per second, per subscriber
+RISK_PUSH_MAX_RATE = float(os.environ.get("RISK_PUSH_MAX_RATE", 4))
+# Sessions idle longer than this are dropped from the in-memory feature store
+FEATURE_IDLE_TTL_S = int(os.environ.get("FEATURE_IDLE_TTL_S", 3600))
+FEATURE_MAX_SESSIONS = int(os.environ.get("FEATURE_MAX_SESSIONS", 10000))
+# Event type weights and risk level thresholds, reloaded when the file changes
+RISK_CONFIG_PATH = os.environ.get("RISK_CONFIG_PATH", DEFAULT_CONFIG_PATH)
+RISK_CONFIG_POLL_S = float(os.environ.get("RISK_CONFIG_POLL_S", 5))
+# JSON file of event sequence rules (see sequences.DEFAULT_RULES for the format)
+SEQUENCE_RULES_PATH = os.environ.get("SEQUENCE_RULES_PATH")
+# Half-life, in minutes, of the exponentially decayed risk score
+RISK_DECAY_HALF_LIFE_MIN = float(os.environ.get("RISK_DECAY_HALF_LIFE_MIN", 10))
+# Raw events older than this are compacted into event_rollups (0 disables the job)
+EVENT_RETENTION_HOURS = float(os.environ.get("EVENT_RETENTION_HOURS", 168))
+MAINTENANCE_INTERVAL_S = float(os.environ.get("MAINTENANCE_INTERVAL_S", 3600))
+MAINTENANCE_BATCH_SIZE = int(os.environ.get("MAINTENANCE_BATCH_SIZE", 5000))
+# How long a rendered /debug page is reused before checking for new events
+DEBUG_CACHE_TTL_S = float(os.environ.get("DEBUG_CACHE_TTL_S", 2))
+# Client timestamps further than this ahead of server time are replaced with
+# the server time, so a wrong clock can't move the per-minute windows forward
+MAX_CLOCK_SKEW_S = float(os.environ.get("MAX_CLOCK_SKEW_S", 300))
+# Session used for events that don't carry a session_id (older extension builds)
+DEFAULT_SESSION_ID = os.environ.get("DEFAULT_SESSION_ID", "session_1")
+
+# Storage, opened in lifespan: the SQLite file at DATABASE_PATH (a single
+# writer connection plus a pool of WAL readers), or Postgres when DATABASE_URL
+# is a postgres:// or postgresql:// URL
+DATABASE_PATH = os.environ.get("DATABASE_PATH", "interview_data.db")
+DATABASE_URL = os.environ.get("DATABASE_URL", "")
+store: Optional[EventStore] = None
+
+# Multi-worker mode (see serve.py): set when a separate writer process owns
+# the database; this worker then opens it read-only and sends rows there
+WRITER_SOCKET = os.environ.get("WRITER_SOCKET")
+WRITER_AUTHKEY = bytes.fromhex(os.environ.get("WRITER_AUTHKEY", ""))
+SHARED_AGGREGATES_PATH = os.environ.get("SHARED_AGGREGATES_PATH")
+# How often workers check for events committed through other workers
+FOLLOW_INTERVAL_MS = int(os.environ.get("FOLLOW_INTERVAL_MS", 50))
+writer_client: Optional[WriterClient] = None
+shared_aggregates: Optional[SharedAggregates] = None
 
-class EventData(BaseModel):
-    type: str
-    timestamp: Optional[int] = None
-    data: Dict = {}
+# Payload encoding for the data column (PAYLOAD_CODEC=msgpack|json); hot
+# fields such as paste length and tab id are stored as typed columns
+payload_codec = get_codec()
+
+# Per-type counts served by the summary endpoints, rebuilt from the table at
+# startup (or read from the writer process's shared totals in multi-worker mode)
+event_counters = SharedEventCounters() if WRITER_SOCKET else EventCounters()
+# Running per-session behavior features for the model, updated on insert
+feature_store = FeatureStore(
+    idle_ttl=FEATURE_IDLE_TTL_S, max_sessions=FEATURE_MAX_SESSIONS, summarized_timing=KEYSTROKE_MODE == "aggregate"
+)
+
+# Per-minute buckets for ?window= and decayed risk, backed by event_rollups
+rolling_windows = RollingWindows(
+    horizon_minutes=max(WINDOWS.values()),
+    max_sessions=FEATURE_MAX_SESSIONS,
+    max_ahead_minutes=math.ceil(MAX_CLOCK_SKEW_S / 60)
+)
+
+# The one source of risk weights for per-event scores and summaries
+risk_config = RiskConfig(RISK_CONFIG_PATH)
+
+# Duplicate and rate-limit checks, applied before rows reach storage
+ingest_filter = IngestFilter(
+    DedupFilter(DEDUP_MAX_ENTRIES) if DEDUP_MAX_ENTRIES > 0 else None,
+    TokenBucketLimiter(RATE_LIMIT_PER_S, RATE_LIMIT_BURST, FEATURE_MAX_SESSIONS) if RATE_LIMIT_PER_S > 0 else None,
+    RATE_LIMITED_TYPES
+)
+
+# Per-session sequence rules (e.g. tab switch then a large paste), updated on insert
+sequence_analyzer = SequenceAnalyzer(
+    load_rules(SEQUENCE_RULES_PATH),
+    idle_ttl=FEATURE_IDLE_TTL_S,
+    max_sessions=FEATURE_MAX_SESSIONS,
+    horizon_minutes=max(WINDOWS.values())
+)
+
+# Keystrokes waiting for the next summary flush, in KEYSTROKE_MODE=aggregate
+keystroke_aggregator = KeystrokeAggregator(FEATURE_MAX_SESSIONS) if KEYSTROKE_MODE == "aggregate" else None
+
+# Segment log and its consumer, in INGEST_MODE=log (opened in open_storage)
+event_log = SegmentLog() if INGEST_MODE == "log" else None
+log_consumer: Optional[LogConsumer] = None
+
+# Last few inserted events, shown on the debug page
+recent_events = RecentEvents(size=20)
+
+# Highest event id applied to the in-memory state, in multi-worker mode
+applied_id = 0
+follow_lock = asyncio.Lock()
+
+def create_store() -> EventStore:
+    """The EventStore selected by DATABASE_URL (Postgres) or DATABASE_PATH (SQLite)"""
+    observe = lambda op, seconds: db_latency.observe(seconds, op)  # noqa: E731
+    retention = {"retention_hours": EVENT_RETENTION_HOURS, "maintenance_batch_size": MAINTENANCE_BATCH_SIZE}
+    if DATABASE_URL.startswith(("postgres://", "postgresql://")):
+        return PostgresEventStore(DATABASE_URL, observe=observe, **retention)
+    return SQLiteEventStore(DATABASE_PATH, observe=observe, writer_client=writer_client, **retention)
+
+async def open_storage():
+    """Open the database and load the in-memory state from it"""
+    global store, writer_client, shared_aggregates, applied_id, log_consumer
+    if WRITER_SOCKET:
+        writer_client = WriterClient(
+            WRITER_SOCKET, WRITER_AUTHKEY, observe=lambda op, seconds: db_latency.observe(seconds, op)
+        )
+        shared_aggregates = SharedAggregates.attach(SHARED_AGGREGATES_PATH)
+        event_counters.attach(shared_aggregates)
+    store = create_store()
+    await store.open()
+
+    # One snapshot, so the state matches applied_id exactly
+    async with store.snapshot() as reader:
+        applied_id = await reader.max_event_id()
+        await event_counters.rebuild(reader)
+        await feature_store.rebuild(reader)
+        await rolling_windows.rebuild(reader)
+        await recent_events.rebuild(reader)
+        await sequence_analyzer.rebuild(reader)
+
+    if event_log is not None:
+        # Resume after the last offset committed with the stored rows
+        checkpoint = await store.log_checkpoint()
+        await asyncio.to_thread(event_log.open, checkpoint)
+        if not event_log.start <= checkpoint <= event_log.end:
+            raise RuntimeError(
+                f"The database has materialized the event log up to offset {checkpoint}, but {event_log.directory} "
+                f"holds offsets {event_log.start}-{event_log.end}; rebuild the database with replay.py"
+            )
+        log_consumer = LogConsumer(
+            event_log, materialize, checkpoint,
+            max_batch=EVENT_FLUSH_MAX_BATCH, poll_interval=EVENT_FLUSH_INTERVAL_MS / 1000
+        )
+
+async def close_storage():
+    await store.close()
+    if shared_aggregates is not None:
+        shared_aggregates.close()
 
 @app.get("/")
 async def root():
@@ -63,153 +293,599 @@ async def health_check():
         "timestamp": datetime.now().isoformat()
     }
 
-@app.post("/api/events")
-async def receive_event(event: EventData):
-    """Receive events from Chrome extension"""
+def event_row(event: tuple) -> tuple:
+    """Build the events table row for an incoming (type, timestamp, data, session_id) event"""
+    event_type, timestamp, data, session_id = event
+    data, paste_length, tab_id = split_payload(event_type, data)
+    now = int(time.time() * 1000)
+    if not timestamp or timestamp > now + MAX_CLOCK_SKEW_S * 1000:
+        timestamp = now
+    return (
+        event_type,
+        payload_codec.encode(data),
+        timestamp,
+        session_id or DEFAULT_SESSION_ID,
+        paste_length,
+        tab_id
+    )
+
+def response_timestamp(timestamp_ms: int) -> str:
+    return datetime.fromtimestamp(timestamp_ms / 1000).isoformat()
+
+def apply_events(ids: List[int], rows: List[tuple], increments=None):
+    """Update the in-memory aggregates with stored rows"""
+    if increments is None:
+        increments = rollup_rows(rows)
+    event_counters.add(row[0] for row in rows)
+    for session_id, minute, event_type, count in increments:
+        rolling_windows.add(session_id, event_type, minute, count)
+    for row in rows:
+        feature_store.update(row[3], row[0], row[2])
+        for rule in sequence_analyzer.update(row[3], row[0], row[2], row[4]):
+            sequence_findings.inc(rule)
+        events_ingested.inc(row[0])
+    recent_events.add(ids, rows)
+
+async def catch_up() -> bool:
+    """Multi-worker mode: apply events committed since applied_id, whichever worker sent them"""
+    global applied_id
+    applied = False
+    async with follow_lock:
+        while True:
+            stored = await store.select_events(after_id=applied_id, limit=5000)
+            if not stored:
+                return applied
+            rows = [
+                (event_type, data, timestamp, session_id, paste_length, tab_id)
+                for _, session_id, event_type, data, timestamp, paste_length, tab_id in stored
+            ]
+            apply_events([row[0] for row in stored], rows)
+            applied_id = stored[-1][0]
+            applied = True
+
+async def follow_writer(interval: float):
+    """Multi-worker mode: pick up events stored through other workers"""
+    while True:
+        try:
+            if shared_aggregates.last_id > applied_id and await catch_up():
+                risk_broadcaster.notify()
+        except Exception:
+            logger.exception("Failed to apply events from the writer process")
+        await asyncio.sleep(interval)
+
+async def insert_events(rows: List[tuple], log_offset: Optional[int] = None, summaries: List[tuple] = ()) -> List[int]:
+    """Insert rows (and the event log checkpoint and keystroke summaries) in one transaction, returning their ids"""
+    ids = await store.insert(rows, log_offset, summaries)
+    if writer_client is not None:
+        # Read back through the shared path so this worker sees its own events immediately
+        await catch_up()
+    else:
+        apply_events(ids, rows)
+    if summaries:
+        apply_keystroke_summaries(summaries)
+    risk_broadcaster.notify()
+    return ids
+
+async def store_keystroke_summaries(summaries: List[tuple]):
+    """Write flushed keystroke summaries, then count them in the in-memory aggregates"""
+    await store.insert_keystroke_summaries(summaries)
+    apply_keystroke_summaries(summaries)
+    risk_broadcaster.notify()
+
+def apply_keystroke_summaries(summaries: List[tuple]):
+    """Update the in-memory aggregates with stored keystroke summaries"""
+    for summary in summaries:
+        if summary[2]:
+            event_counters.add_count("KEYSTROKE", summary[2])
+            rolling_windows.add(summary[0], "KEYSTROKE", summary[1], summary[2])
+            events_ingested.inc("KEYSTROKE", amount=summary[2])
+    feature_store.add_timing(summaries)
+
+def is_aggregated(row: tuple) -> bool:
+    """Whether a row goes to the keystroke summaries instead of the events table"""
+    return keystroke_aggregator is not None and row[0] == "KEYSTROKE"
+
+def admit_rows(rows: List[tuple], events: List[tuple]):
+    """Drop duplicates and over-limit events; returns (admitted rows, their dedup keys, per-row verdicts)"""
+    # Keyed on the client's timestamp, not the one event_row may have filled in
+    admitted, keys, verdicts = ingest_filter.admit(rows, [dedup_key(row, event[1]) for row, event in zip(rows, events)])
+    if len(admitted) < len(rows):
+        for row, verdict in zip(rows, verdicts):
+            if verdict is not None:
+                events_rejected.inc(verdict, row[0])
+    return admitted, keys, verdicts
+
+async def store_rows(rows: List[tuple], keys: List[Optional[int]]) -> List[Optional[int]]:
+    """Log, insert, queue or aggregate admitted rows; their dedup keys are released if that fails"""
     try:
-        timestamp = event.timestamp or int(time.time() * 1000)
-        event_time = datetime.fromtimestamp(timestamp / 1000)
-        
-        cursor.execute(
-            "INSERT INTO events (event_type, data, timestamp, session_id) VALUES (?, ?, ?, ?)",
-            (event.type, json.dumps(event.data), event_time, "session_1")
-        )
-        conn.commit()
-        
-        # Simple risk calculation
-        risk_score = calculate_simple_risk(event.type)
-        
-        return {
-            "status": "success",
-            "risk_score": risk_score,
-            "event_id": cursor.lastrowid,
-            "timestamp": event_time.isoformat()
-        }
-        
+        if event_log is not None:
+            # Durable once appended; log_consumer stores them
+            await event_log.append(rows)
+            return [None] * len(rows)
+        return await materialize(rows, keys=keys)
+    except HTTPException:
+        ingest_filter.release(keys)
+        raise
     except Exception as e:
+        ingest_filter.release(keys)
         raise HTTPException(status_code=500, detail=str(e))
 
+async def materialize(
+    rows: List[tuple], log_offset: Optional[int] = None, keys: Optional[List[Optional[int]]] = None
+) -> List[Optional[int]]:
+    """Store rows, or fold them into the keystroke summaries in KEYSTROKE_MODE=aggregate; returns their ids"""
+    if keystroke_aggregator is None:
+        return await store_raw_rows(rows, log_offset, keys)
+    stored = [row for row in rows if row[0] != "KEYSTROKE"]
+    if log_offset is None:
+        if keys is not None:
+            keys = [key for row, key in zip(rows, keys) if row[0] != "KEYSTROKE"]
+        ids = iter(await store_raw_rows(stored, keys=keys))
+        # Every row adds its timing to the summaries; keystrokes are stored only there
+        keystroke_aggregator.add(rows)
+    else:
+        # The checkpoint only moves past keystrokes in the same transaction as their
+        # summaries; the session state advances once that commits, so retries are exact
+        summaries, sessions = keystroke_aggregator.summarize(rows)
+        ids = iter(await insert_events(stored, log_offset, summaries))
+        keystroke_aggregator.advance(sessions)
+    return [None if row[0] == "KEYSTROKE" else next(ids) for row in rows]
+
+async def store_raw_rows(
+    rows: List[tuple], log_offset: Optional[int] = None, keys: Optional[List[Optional[int]]] = None
+) -> List[Optional[int]]:
+    if event_writer is not None:
+        enqueue_events(rows, keys)
+        return [None] * len(rows)
+    return await insert_events(rows, log_offset) if rows or log_offset is not None else []
+
+def ingest_status(row: Optional[tuple] = None) -> str:
+    """Status reported for admitted rows: logged, aggregated, queued or success"""
+    if event_log is not None:
+        return "logged"
+    if row is not None and is_aggregated(row):
+        return "aggregated"
+    return "queued" if event_writer is not None else "success"
+
+def enqueue_events(rows: List[tuple], keys: Optional[List[Optional[int]]] = None):
+    """Hand rows (and their dedup keys) to the write-behind queue, or raise 429 when it is full"""
+    if not event_writer.has_room(len(rows)):
+        raise HTTPException(
+            status_code=429,
+            detail=f"Event queue is full ({event_writer.depth} pending), retry later"
+        )
+    for row, key in zip(rows, keys or [None] * len(rows)):
+        event_writer.submit(row, key)
+
+# The ingestion routes read the raw body (see ingest.py) and return
+# EventResponse directly, skipping FastAPI's model parsing and jsonable_encoder
+
+@app.post("/api/events", openapi_extra={
+    "requestBody": {"required": True, "content": {"application/json": {"schema": EVENT_SCHEMA}}}
+})
+async def receive_event(request: Request):
+    """Receive events from Chrome extension"""
+    event = parse_events(decode_body(await request.body()))[0]
+    row = event_row(event)
+    
+    # Simple risk calculation
+    risk_score = calculate_simple_risk(row[0])
+    
+    admitted, keys, verdicts = admit_rows([row], [event])
+    if verdicts[0] == RATE_LIMITED:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many {row[0]} events for session {row[3]}, retry later",
+            headers={"Retry-After": "1"}
+        )
+    if verdicts[0] == DUPLICATE:
+        status = "duplicate"
+        event_id = None
+    else:
+        event_id = (await store_rows(admitted, keys))[0]
+        status = ingest_status(row)
+    
+    return EventResponse({
+        "status": status,
+        "risk_score": risk_score,
+        "event_id": event_id,
+        "timestamp": response_timestamp(row[2])
+    })
+
+@app.post("/api/events/batch", openapi_extra={
+    "requestBody": {"required": True, "content": {"application/json": {"schema": BATCH_SCHEMA}}}
+})
+async def receive_event_batch(request: Request):
+    """Receive a batch of events and store them in one transaction"""
+    body = decode_body(await request.body())
+    if type(body) is list and len(body) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(body)} events (max {MAX_BATCH_SIZE})"
+        )
+    events = parse_events(body, batch=True)
+    if not events:
+        return EventResponse({"status": "success", "count": 0, "events": []})
+    
+    rows = [event_row(event) for event in events]
+    admitted, keys, verdicts = admit_rows(rows, events)
+    stored_ids = iter(await store_rows(admitted, keys))
+    
+    results = []
+    for row, verdict in zip(rows, verdicts):
+        result = {
+            "event_id": next(stored_ids) if verdict is None else None,
+            "risk_score": calculate_simple_risk(row[0]),
+            "timestamp": response_timestamp(row[2])
+        }
+        if verdict is not None:
+            # Dropped before storage: "duplicate" or "rate_limited"
+            result["status"] = verdict
+        elif ingest_status(row) == "aggregated":
+            result["status"] = "aggregated"
+        results.append(result)
+    
+    return EventResponse({
+        "status": ingest_status(),
+        "count": len(rows),
+        "duplicates": verdicts.count(DUPLICATE),
+        "rate_limited": verdicts.count(RATE_LIMITED),
+        "events": results
+    })
+
 def calculate_simple_risk(event_type: str) -> float:
     """Calculate simple risk score"""
-    risk_scores = {
-        "PASTE_EVENT": 0.6,
-        "TAB_SWITCH": 0.4,
-        "WINDOW_BLUR": 0.3,
-        "KEYSTROKE": 0.1,
-        "COPY_EVENT": 0.5,
-        "CUT_EVENT": 0.2,
-        "TEST_EVENT": 0.0
-    }
-    return risk_scores.get(event_type, 0.2)
+    return risk_config.current.weight(event_type)
 
-@app.get("/api/risk-summary")
-async def get_risk_summary():
-    """Get overall risk summary"""
-    cursor.execute("SELECT event_type, COUNT(*) FROM events GROUP BY event_type")
-    events = cursor.fetchall()
-    
+# Background writer, only used when INGEST_MODE=queue
+event_writer = None
+if INGEST_MODE == "queue":
+    event_writer = EventWriter(
+        insert_events,
+        flush_interval=EVENT_FLUSH_INTERVAL_MS / 1000,
+        max_batch=EVENT_FLUSH_MAX_BATCH,
+        max_queue=EVENT_QUEUE_MAX,
+        max_retries=EVENT_FLUSH_MAX_RETRIES,
+        # A dropped batch was never stored, so its retries aren't duplicates
+        on_drop=ingest_filter.release
+    )
+
+def summarize_counts(counts, findings: Optional[Dict[str, float]] = None) -> dict:
+    """Build a risk summary from (event_type, count) pairs and sequence findings ({rule: count})"""
     event_counts = {}
     total_risk = 0.0
     total_events = 0
+    weights = risk_config.current
     
-    risk_weights = {
-        "PASTE_EVENT": 0.6,
-        "TAB_SWITCH": 0.4,
-        "WINDOW_BLUR": 0.3,
-        "KEYSTROKE": 0.1,
-        "COPY_EVENT": 0.5,
-        "CUT_EVENT": 0.2
-    }
-    
-    for event_type, count in events:
+    for event_type, count in counts:
         event_counts[event_type] = count
-        weight = risk_weights.get(event_type, 0.2)
-        total_risk += min(count * weight, 1.0)
+        total_risk += min(count * weights.weight(event_type), weights.per_type_cap)
         total_events += count
     
     # Calculate overall risk
     if total_events > 0:
-        overall_risk = min(total_risk / (total_events * 0.5), 1.0)
+        overall_risk = min(total_risk / (total_events * weights.normalizer), 1.0)
     else:
         overall_risk = 0.0
     
+    # A flagged sequence outweighs the per-type mix it is made of
+    sequence_risk = sequence_analyzer.risk(findings) if findings else 0.0
+    overall_risk = max(overall_risk, sequence_risk)
+    
     # Determine risk level
-    if overall_risk > 0.7:
-        risk_level = "HIGH"
-    elif overall_risk > 0.4:
-        risk_level = "MEDIUM"
-    else:
-        risk_level = "LOW"
+    risk_level = weights.level(overall_risk)
     
     return {
         "event_counts": event_counts,
         "total_events": total_events,
         "overall_risk": round(overall_risk, 3),
         "risk_level": risk_level,
+        "sequence_findings": findings or {},
+        "sequence_risk": round(sequence_risk, 3),
         "last_updated": datetime.now().isoformat()
     }
 
-@app.get("/debug")
-async def debug_page():
-    """Debug dashboard"""
-    cursor.execute("SELECT * FROM events ORDER BY timestamp DESC LIMIT 20")
-    events = cursor.fetchall()
-    
-    cursor.execute("SELECT event_type, COUNT(*) FROM events GROUP BY event_type")
-    counts = cursor.fetchall()
-    
-    total_events = len(events)
-    
-    html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Debug - AI Interview Monitor</title>
-        <style>
-            body {{ font-family: Arial; padding: 20px; }}
-            table {{ border-collapse: collapse; width: 100%; }}
-            th, td {{ border: 1px solid #ddd; padding: 8px; }}
-            th {{ background-color: #667eea; color: white; }}
-        </style>
-    </head>
-    <body>
-        <h1>AI Interview Monitor - Debug</h1>
-        <p>Total Events: {total_events}</p>
-        
-        <h3>Event Counts:</h3>
-        <table>
-            <tr><th>Event Type</th><th>Count</th></tr>
-    """
-    
-    for event_type, count in counts:
-        html += f"<tr><td>{event_type}</td><td>{count}</td></tr>"
-    
-    html += """
-        </table>
-        
-        <h3>Recent Events:</h3>
-        <table>
-            <tr><th>ID</th><th>Type</th><th>Data</th><th>Timestamp</th></tr>
-    """
+def window_minutes(window: Optional[str]) -> Optional[int]:
+    """Validate a ?window= value (5m, 15m or 1h)"""
+    if window is None:
+        return None
+    if window not in WINDOWS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported window {window!r}, expected one of {', '.join(WINDOWS)}"
+        )
+    return WINDOWS[window]
+
+def windowed_summary(session_id: Optional[str], window: Optional[str], all_time_counts, all_time_findings) -> dict:
+    """Risk summary over a window (or all time), plus the exponentially decayed risk"""
+    minutes = window_minutes(window)
+    if minutes is None:
+        summary = summarize_counts(all_time_counts, all_time_findings)
+    else:
+        summary = summarize_counts(
+            rolling_windows.counts(session_id, minutes).items(),
+            sequence_analyzer.windows.counts(session_id, minutes)
+        )
+    summary["window"] = window
+    decayed = rolling_windows.decayed_counts(session_id, RISK_DECAY_HALF_LIFE_MIN)
+    decayed_findings = sequence_analyzer.windows.decayed_counts(session_id, RISK_DECAY_HALF_LIFE_MIN)
+    summary["decayed_risk"] = summarize_counts(decayed.items(), decayed_findings)["overall_risk"]
+    return summary
+
+@app.get("/api/risk-summary")
+async def get_risk_summary(window: Optional[str] = None):
+    """Get overall risk summary, optionally over the last 5m, 15m or 1h"""
+    return windowed_summary(None, window, event_counters.snapshot().items(), sequence_analyzer.findings())
+
+# Live summary updates for the dashboard, coalesced under RISK_PUSH_MAX_RATE
+risk_broadcaster = RiskBroadcaster(
+    lambda: summarize_counts(event_counters.snapshot().items(), sequence_analyzer.findings()),
+    max_rate=RISK_PUSH_MAX_RATE
+)
+
+@app.websocket("/ws/risk")
+async def risk_websocket(websocket: WebSocket):
+    """Push risk summary updates: one snapshot, then deltas of changed counts"""
+    await websocket.accept()
+    subscriber = risk_broadcaster.subscribe()
+
+    async def wait_for_disconnect():
+        # Inbound frames (pings, text) are ignored; only a disconnect ends the stream
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    # Watch for the client going away while we wait for updates
+    disconnected = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        while True:
+            update = asyncio.ensure_future(subscriber.next())
+            done, _ = await asyncio.wait({update, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                update.cancel()
+                break
+            await websocket.send_json(update.result())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        disconnected.cancel()
+        risk_broadcaster.unsubscribe(subscriber)
+
+@app.get("/api/risk-summary/stream")
+async def risk_summary_stream(request: Request):
+    """Server-sent events fallback for /ws/risk"""
+    subscriber = risk_broadcaster.subscribe()
     
-    for event in events:
-        html += f"""
-            <tr>
-                <td>{event[0]}</td>
-                <td>{event[1]}</td>
-                <td><pre>{event[2] if event[2] else '{}'}</pre></td>
-                <td>{event[3]}</td>
-            </tr>
-        """
+    async def stream():
+        try:
+            while not await request.is_disconnected():
+                update = await subscriber.next(timeout=15)
+                if update is None:
+                    # Keep proxies from closing an idle stream
+                    yield ": ping\n\n"
+                else:
+                    yield f"data: {json.dumps(update)}\n\n"
+        finally:
+            risk_broadcaster.unsubscribe(subscriber)
     
-    html += """
-        </table>
-        <script>setTimeout(() => location.reload(), 5000);</script>
-    </body>
-    </html>
-    """
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Trained behavior model; concurrent scoring requests share one predict_proba call
+behavior_model = BehaviorModel()
+prediction_batcher = PredictionBatcher(behavior_model)
+
+async def load_session_activity(session_id: str, all_time: bool = True):
+    """Per-type counts, sequence findings and behavior features for a session"""
+    # Served from the session indexes and the rollup primary key without
+    # touching other sessions' rows
+    counts = (await store.type_counts(session_id)).items() if all_time else []
+    findings = sequence_analyzer.findings(session_id) if all_time else {}
+    if findings is None:
+        findings = await sequence_analyzer.load_session(store, session_id)
+    if not rolling_windows.has_session(session_id):
+        await rolling_windows.load_session(store, session_id)
+    features = feature_store.features(session_id)
+    if features is None:
+        # Evicted or idle since startup: recompute from the session index
+        features = await feature_store.load_session(store, session_id)
+    return counts, findings, features
+
+@app.get("/api/sessions/{session_id}/risk-summary")
+async def get_session_risk_summary(session_id: str, window: Optional[str] = None):
+    """Get the risk summary for a single session, optionally over the last 5m, 15m or 1h"""
+    window_minutes(window)
+    counts, findings, features = await load_session_activity(session_id, window is None)
     
-    return HTMLResponse(content=html)
+    summary = windowed_summary(session_id, window, counts, findings)
+    summary["session_id"] = session_id
+    summary["features"] = dict(zip(FEATURE_NAMES, features))
+    summary["ai_probability"] = await prediction_batcher.score(features)
+    return summary
+
+@app.get("/api/sessions/{session_id}/keystrokes")
+async def get_session_keystrokes(session_id: str, since_minute: Optional[int] = None):
+    """Per-minute keystroke summaries for a session (KEYSTROKE_MODE=aggregate); flushed minutes only"""
+    rows = await store.keystroke_summaries(session_id, since_minute)
+    return {
+        "session_id": session_id,
+        "mode": KEYSTROKE_MODE,
+        "minutes": [summary_record(row) for row in rows],
+        "count": len(rows)
+    }
+
+@app.get("/api/sessions/{session_id}/events")
+async def get_session_events(
+    session_id: str, limit: int = 50, before: Optional[int] = None, before_id: Optional[int] = None
+):
+    """Get a session's most recent events, newest first"""
+    limit = max(1, min(limit, 1000))
+    # (before, before_id) is the epoch-ms timestamp and id of the last event seen;
+    # `before` alone returns everything older than that millisecond
+    rows = await store.session_events(session_id, before, limit, before_id)
+    # Pass back as ?before=&before_id= for the next page
+    next_before = {"before": rows[-1][3], "before_id": rows[-1][0]} if len(rows) == limit else None
+
+    return {
+        "session_id": session_id,
+        "events": [
+            {
+                "id": row[0],
+                "type": row[1],
+                "data": load_payload(row[1], row[2], row[4], row[5]),
+                "timestamp": format_timestamp(row[3])
+            }
+            for row in rows
+        ],
+        "count": len(rows),
+        "next_before": next_before
+    }
+
+def event_record(row) -> dict:
+    """JSON form of a select_events row"""
+    return {
+        "id": row[0],
+        "session_id": row[1],
+        "type": row[2],
+        "data": load_payload(row[2], row[3], row[5], row[6]),
+        "timestamp": format_timestamp(row[4])
+    }
+
+def event_filters(session_id, types, since, until) -> dict:
+    """select_events keyword arguments from query parameters (since/until in epoch ms)"""
+    return {
+        "session_id": session_id,
+        "event_types": types,
+        "since": since,
+        "until": until
+    }
+
+@app.get("/api/events")
+async def list_events(
+    session_id: Optional[str] = None,
+    type: Optional[List[str]] = Query(None),
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = 100
+):
+    """List events in id order, one keyset page at a time (`after` is the previous page's next_after)"""
+    limit = max(1, min(limit, 1000))
+    # Walks idx_events_session_id from the cursor instead of skipping with OFFSET
+    rows = await store.select_events(after_id=after, limit=limit, **event_filters(session_id, type, since, until))
+    return {
+        "events": [event_record(row) for row in rows],
+        "count": len(rows),
+        "next_after": rows[-1][0] if len(rows) == limit else None
+    }
+
+EXPORT_CHUNK_SIZE = 1000
+
+@app.get("/api/events/export")
+async def export_events(
+    format: str = "ndjson",
+    session_id: Optional[str] = None,
+    type: Optional[List[str]] = Query(None),
+    since: Optional[int] = None,
+    until: Optional[int] = None
+):
+    """Stream matching events as NDJSON or CSV"""
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    filters = event_filters(session_id, type, since, until)
+
+    def format_chunk(chunk) -> str:
+        if format == "ndjson":
+            return "".join(json.dumps(event_record(row)) + "\n" for row in chunk)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in chunk:
+            record = event_record(row)
+            writer.writerow([
+                record["id"], record["session_id"], record["type"], record["timestamp"], json.dumps(record["data"])
+            ])
+        return buffer.getvalue()
+
+    async def generate():
+        # The store steps through one snapshot in chunks, never all rows in memory
+        if format == "csv":
+            yield "id,session_id,type,timestamp,data\r\n"
+        async for chunk in store.export_events(EXPORT_CHUNK_SIZE, **filters):
+            yield await run_in_threadpool(format_chunk, chunk)
+
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    return StreamingResponse(
+        generate(),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=events.{format}"}
+    )
+
+@app.get("/api/risk-summary/consistency")
+async def check_risk_summary_consistency():
+    """Compare the in-memory event counts against a SQL count"""
+    mismatches = event_counters.check(await store.type_counts())
+    return {
+        "consistent": not mismatches,
+        "mismatches": mismatches,
+        "checked_at": datetime.now().isoformat()
+    }
+
+@app.get("/api/ingest/stats")
+async def get_ingest_stats():
+    """Events dropped as duplicates or over a session's rate limit, and the sessions sending most of them"""
+    return ingest_filter.stats()
+
+@app.get("/api/risk-config")
+async def get_risk_config():
+    """The risk weights and thresholds in use (edit RISK_CONFIG_PATH to change them)"""
+    weights = risk_config.current
+    return {
+        "version": weights.version,
+        "path": risk_config.path,
+        "loaded_at": datetime.fromtimestamp(risk_config.loaded_at).isoformat(),
+        "config": weights.config
+    }
+
+@app.post("/api/maintenance/compact")
+async def run_compaction():
+    """Run the retention/compaction job now"""
+    if EVENT_RETENTION_HOURS <= 0:
+        raise HTTPException(status_code=409, detail="Retention is disabled (EVENT_RETENTION_HOURS=0)")
+    return await store.compact()
+
+metrics.gauge("active_sessions", "Sessions with events within FEATURE_IDLE_TTL_S", lambda: len(feature_store))
+metrics.gauge("event_queue_depth", "Events waiting for the background writer", lambda: event_writer.depth if event_writer else 0)
+metrics.gauge(
+    "event_queue_dropped", "Queued events dropped after failed flushes", lambda: event_writer.dropped if event_writer else 0
+)
+metrics.gauge(
+    "keystrokes_pending", "Keystrokes waiting for the next summary flush",
+    lambda: len(keystroke_aggregator) if keystroke_aggregator else 0
+)
+metrics.gauge(
+    "event_log_lag_bytes", "Event log bytes appended but not yet stored",
+    lambda: log_consumer.lag if log_consumer else 0
+)
+metrics.gauge("risk_subscribers", "Open WebSocket/SSE risk summary streams", lambda: len(risk_broadcaster.subscribers))
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+debug_dashboard = DebugDashboard(event_counters, recent_events, ttl=DEBUG_CACHE_TTL_S)
+
+@app.get("/debug")
+async def debug_page(request: Request):
+    """Debug dashboard"""
+    etag, html = debug_dashboard.render()
+    # no-cache: browsers keep the page but revalidate it with If-None-Match
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(content=html, headers=headers)
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
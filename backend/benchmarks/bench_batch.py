@@ -0,0 +1,63 @@
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+# Run against a throwaway database in a temp directory
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(tempfile.mkdtemp(prefix="fairround-bench-"))
+# Thousands of keystrokes a second from one session would trip the rate limiter
+os.environ.setdefault("RATE_LIMIT_PER_S", "0")
+
+from app import app  # noqa: E402
+
+
+def make_event(i):
+    return {
+        "type": "PASTE_EVENT" if i % 50 == 0 else "KEYSTROKE",
+        "timestamp": int(time.time() * 1000),
+        "data": {"key": "a", "count": i}
+    }
+
+
+async def bench_single(client, n):
+    start = time.perf_counter()
+    for i in range(n):
+        response = await client.post("/api/events", json=make_event(i))
+        response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def bench_batch(client, n, batch_size):
+    start = time.perf_counter()
+    for offset in range(0, n, batch_size):
+        batch = [make_event(i) for i in range(offset, min(offset + batch_size, n))]
+        response = await client.post("/api/events/batch", json=batch)
+        response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare single-event and batched ingestion")
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            single = await bench_single(client, args.events)
+            batch = await bench_batch(client, args.events, args.batch_size)
+
+    print(f"single: {args.events / single:10.0f} events/s ({single:.2f}s)")
+    print(f"batch:  {args.events / batch:10.0f} events/s ({batch:.2f}s, batch size {args.batch_size})")
+    print(f"speedup: {single / batch:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
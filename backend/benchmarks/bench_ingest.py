@@ -0,0 +1,135 @@
+"""Per-event CPU cost of the ingestion path.
+
+Measures process time per event through the app (batch and single posts),
+and the request/response stages on their own: the previous path (json +
+pydantic List[EventData] + jsonable_encoder with datetime timestamps)
+against ingest.py's (orjson + plain type checks + EventResponse).
+
+    python benchmarks/bench_ingest.py --events 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import List
+
+import httpx
+
+# Run against a throwaway database in a temp directory
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(tempfile.mkdtemp(prefix="fairround-bench-"))
+# Thousands of keystrokes a second from one session would trip the rate limiter
+os.environ.setdefault("RATE_LIMIT_PER_S", "0")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from app import app  # noqa: E402
+from ingest import EventData, EventResponse, decode_body, parse_events  # noqa: E402
+
+
+def make_events(n, seed=0, prefix="bench"):
+    rng = random.Random(seed)
+    timestamp = int(time.time() * 1000)
+    events = []
+    for i in range(n):
+        timestamp += rng.randrange(40, 400)
+        roll = rng.random()
+        if roll < 0.03:
+            event = ("TAB_SWITCH", {"count": i, "tabId": rng.randrange(1, 10**6), "risk": "0.12"})
+        elif roll < 0.06:
+            event = ("PASTE_EVENT", {"count": i, "url": "https://example.com/problem", "length": rng.randrange(20, 3000)})
+        else:
+            event = ("KEYSTROKE", {"key": rng.choice("abcdefghijklmnopqrstuvwxyz "), "count": i})
+        events.append({"type": event[0], "timestamp": timestamp, "data": event[1], "session_id": f"{prefix}-{i % 20}"})
+    return events
+
+
+def legacy_stages(body: bytes) -> bytes:
+    """Request parsing and response rendering as the pydantic-bound route did them"""
+    events = TypeAdapter(List[EventData]).validate_python(json.loads(body))
+    times = [datetime.fromtimestamp((event.timestamp or int(time.time() * 1000)) / 1000) for event in events]
+    content = {
+        "status": "success",
+        "count": len(events),
+        "events": [{"event_id": i, "risk_score": 0.1, "timestamp": t.isoformat()} for i, t in enumerate(times)]
+    }
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def fast_stages(body: bytes) -> bytes:
+    events = parse_events(decode_body(body), batch=True)
+    content = {
+        "status": "success",
+        "count": len(events),
+        "events": [
+            {"event_id": i, "risk_score": 0.1, "timestamp": datetime.fromtimestamp(event[1] / 1000).isoformat()}
+            for i, event in enumerate(events)
+        ]
+    }
+    return EventResponse(content).body
+
+
+def bench_stages(events, batch_size, rounds=5):
+    bodies = [
+        json.dumps(events[offset:offset + batch_size]).encode()
+        for offset in range(0, len(events), batch_size)
+    ]
+    results = {}
+    for name, stages in (("legacy", legacy_stages), ("fast", fast_stages)):
+        best = None
+        for _ in range(rounds):
+            start = time.process_time()
+            for body in bodies:
+                stages(body)
+            elapsed = time.process_time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = best / len(events) * 1e6
+    return results
+
+
+async def bench_app(client, events, singles, batch_size):
+    """CPU microseconds per event for batched and single posts"""
+    start = time.process_time()
+    for offset in range(0, len(events), batch_size):
+        response = await client.post("/api/events/batch", json=events[offset:offset + batch_size])
+        response.raise_for_status()
+    batch = (time.process_time() - start) / len(events) * 1e6
+
+    start = time.process_time()
+    for event in singles:
+        response = await client.post("/api/events", json=event)
+        response.raise_for_status()
+    single = (time.process_time() - start) / len(singles) * 1e6
+    return batch, single
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Per-event CPU cost of event ingestion")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    events = make_events(args.events)
+
+    stages = bench_stages(events, args.batch_size)
+    print(f"parse + respond, legacy: {stages['legacy']:7.1f} us/event")
+    print(f"parse + respond, fast:   {stages['fast']:7.1f} us/event ({stages['legacy'] / stages['fast']:.1f}x)")
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            singles = make_events(max(1, args.events // 10), seed=1, prefix="single")
+            batch, single = await bench_app(client, events, singles, args.batch_size)
+    print(f"app, batch of {args.batch_size}: {batch:7.1f} us/event (CPU)")
+    print(f"app, single event:  {single:7.1f} us/event (CPU)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
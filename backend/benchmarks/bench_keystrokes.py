@@ -0,0 +1,105 @@
+"""Rows and bytes stored per session with KEYSTROKE_MODE=raw vs aggregate.
+
+Each mode runs in a fresh process against a throwaway database: sessions
+type for --minutes at a typing pace, with an occasional tab switch and
+paste, posted in batches like the extension does.
+
+    python benchmarks/bench_keystrokes.py --sessions 50 --minutes 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def session_events(session_id, minutes, rng, start_ms):
+    timestamp = start_ms
+    end = start_ms + minutes * 60000
+    events = []
+    while timestamp < end:
+        timestamp += rng.randrange(60, 450)
+        if rng.random() < 0.01:
+            events.append({"type": "TAB_SWITCH", "timestamp": timestamp, "data": {"tabId": 7}, "session_id": session_id})
+            timestamp += rng.randrange(500, 3000)
+            events.append({"type": "PASTE_EVENT", "timestamp": timestamp, "data": {"length": 200}, "session_id": session_id})
+        else:
+            events.append({"type": "KEYSTROKE", "timestamp": timestamp, "data": {"key": "a"}, "session_id": session_id})
+    return events
+
+
+async def run(args):
+    import httpx
+    from app import app
+
+    rng = random.Random(args.seed)
+    start_ms = int(time.time() * 1000) - args.minutes * 60000
+    sessions = [session_events(f"bench_{i}", args.minutes, rng, start_ms) for i in range(args.sessions)]
+    total = sum(len(events) for events in sessions)
+
+    transport = httpx.ASGITransport(app=app)
+    cpu = time.process_time()
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for events in sessions:
+                for offset in range(0, len(events), args.batch_size):
+                    response = await client.post("/api/events/batch", json=events[offset:offset + args.batch_size])
+                    response.raise_for_status()
+    # Shutdown flushes the pending keystroke summaries
+    cpu = time.process_time() - cpu
+
+    conn = sqlite3.connect("bench.db")
+    rows = conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+    summaries = conn.execute("SELECT COUNT(*) FROM keystroke_summaries").fetchone()[0]
+    conn.execute("VACUUM")
+    conn.close()
+    return {
+        "events": total,
+        "event_rows": rows,
+        "summary_rows": summaries,
+        "db_bytes": os.path.getsize("bench.db"),
+        "cpu_us_per_event": round(cpu / total * 1e6, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Storage cost of KEYSTROKE_MODE=raw vs aggregate")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--minutes", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        # Child process: one mode against a database in the current (temp) directory
+        sys.path.insert(0, BACKEND_DIR)
+        print(json.dumps(asyncio.run(run(args))))
+        return
+
+    results = {}
+    for mode in ("raw", "aggregate"):
+        env = dict(os.environ, KEYSTROKE_MODE=mode, DATABASE_PATH="bench.db", RATE_LIMIT_PER_S="0",
+                   EVENT_RETENTION_HOURS="0")
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--mode", mode],
+            cwd=tempfile.mkdtemp(prefix="fairround-bench-"), env=env, capture_output=True, text=True, check=True
+        ).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:>9}: {json.dumps(results[mode])}")
+
+    raw, aggregate = results["raw"], results["aggregate"]
+    stored = aggregate["event_rows"] + aggregate["summary_rows"]
+    print(f"rows: {raw['event_rows']} -> {stored} ({raw['event_rows'] / stored:.0f}x fewer), "
+          f"bytes: {raw['db_bytes']} -> {aggregate['db_bytes']} ({raw['db_bytes'] / aggregate['db_bytes']:.0f}x smaller)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from codec import get_codec, split_payload  # noqa: E402
+from db import INSERT_EVENTS_SQL, Database  # noqa: E402
+
+
+def make_events(n, seed=0):
+    """Event mix shaped like the extension's traffic"""
+    rng = random.Random(seed)
+    events = []
+    for i in range(n):
+        roll = rng.random()
+        if roll < 0.85:
+            event = ("KEYSTROKE", {"key": rng.choice("abcdefghij"), "count": i})
+        elif roll < 0.93:
+            event = ("TAB_SWITCH", {"count": i, "tabId": rng.randrange(1, 2_000_000_000), "risk": rng.random()})
+        elif roll < 0.98:
+            event = ("PASTE_EVENT", {
+                "count": i, "url": "https://leetcode.com/problems/two-sum/",
+                "length": rng.randrange(1, 5000), "risk": rng.random()
+            })
+        else:
+            event = ("WINDOW_BLUR", {})
+        events.append(event)
+    return events
+
+
+def legacy_rows(events, now):
+    # Previous layout: the whole payload as JSON text, no typed columns
+    return [(event_type, json.dumps(data), now, "bench", None, None) for event_type, data in events]
+
+
+def codec_rows(codec, events, now):
+    rows = []
+    for event_type, data in events:
+        rest, paste_length, tab_id = split_payload(event_type, data)
+        rows.append((event_type, codec.encode(rest), now, "bench", paste_length, tab_id))
+    return rows
+
+
+def run(name, build_rows, events, batch_size):
+    path = os.path.join(tempfile.mkdtemp(prefix="fairround-bench-"), "events.db")
+    db = Database(path)
+    now = int(time.time() * 1000)
+
+    start = time.perf_counter()
+    rows = build_rows(events, now)
+    encoded = time.perf_counter() - start
+    for offset in range(0, len(rows), batch_size):
+        with db.write() as conn:
+            conn.executemany(INSERT_EVENTS_SQL, rows[offset:offset + batch_size])
+    elapsed = time.perf_counter() - start
+
+    with db.write() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        payload_bytes = conn.execute("SELECT SUM(LENGTH(data)) FROM events").fetchone()[0] or 0
+        table_bytes = conn.execute(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name = 'events'"
+        ).fetchone()[0] if _has_dbstat(conn) else None
+    db.close()
+    file_bytes = os.path.getsize(path)
+
+    n = len(events)
+    result = {
+        "layout": name,
+        "events_per_s": round(n / elapsed),
+        "encode_ms": round(encoded * 1000, 1),
+        "payload_bytes_per_event": round(payload_bytes / n, 1),
+        "file_bytes_per_event": round(file_bytes / n, 1),
+    }
+    if table_bytes is not None:
+        result["table_bytes_per_event"] = round(table_bytes / n, 1)
+    return result
+
+
+def _has_dbstat(conn):
+    try:
+        conn.execute("SELECT 1 FROM dbstat LIMIT 1")
+        return True
+    except Exception:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare stored bytes and insert throughput per payload layout")
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    events = make_events(args.events)
+    layouts = [("legacy-json", legacy_rows), ("json", lambda e, now: codec_rows(get_codec("json"), e, now))]
+    try:
+        msgpack_codec = get_codec("msgpack")
+        layouts.append(("msgpack", lambda e, now: codec_rows(msgpack_codec, e, now)))
+    except ValueError as e:
+        print(f"skipping msgpack: {e}")
+
+    for name, build_rows in layouts:
+        print(json.dumps(run(name, build_rows, events, args.batch_size)))
+
+
+if __name__ == "__main__":
+    main()
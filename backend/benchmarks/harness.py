@@ -0,0 +1,229 @@
+"""In-process load test for the ingestion, summary and debug endpoints.
+
+Drives the app through httpx's ASGI transport (no network) with synthetic
+candidate sessions, then reports throughput, latency percentiles and
+database growth as JSON. Pass --compare with an earlier result file to
+flag regressions between commits.
+
+    python benchmarks/harness.py --output before.json
+    python benchmarks/harness.py --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+START_DIR = os.getcwd()
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def session_events(session_id, n, rng, start_ms):
+    """Mostly keystrokes, with bursts of tab switches and pastes like the extension sends"""
+    timestamp = start_ms
+    events = []
+    while len(events) < n:
+        if rng.random() < 0.05:
+            # Burst: leave the tab, come back and paste
+            burst = [("WINDOW_BLUR", {}), ("TAB_SWITCH", {"count": len(events), "tabId": rng.randrange(1, 10**6)})]
+            burst += [
+                ("PASTE_EVENT", {"count": len(events), "url": "https://example.com/problem", "length": rng.randrange(20, 3000)})
+                for _ in range(rng.randrange(1, 4))
+            ]
+            burst.append(("WINDOW_FOCUS", {}))
+        else:
+            burst = [("KEYSTROKE", {"key": rng.choice("abcdefghijklmnopqrstuvwxyz "), "count": len(events)})]
+        for event_type, data in burst:
+            timestamp += rng.randrange(40, 400)
+            events.append({"type": event_type, "timestamp": timestamp, "data": data, "session_id": session_id})
+    return events[:n]
+
+
+class Phase:
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self.elapsed = 0.0
+
+    async def request(self, client, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            ok = response.status_code < 400
+        except Exception:
+            ok = False
+        self.latencies.append(time.perf_counter() - start)
+        if not ok:
+            self.errors += 1
+
+    def report(self):
+        latencies = sorted(self.latencies)
+        ms = lambda value: round(value * 1000, 3) if value is not None else None  # noqa: E731
+        return {
+            "requests": len(latencies),
+            "errors": self.errors,
+            "seconds": round(self.elapsed, 3),
+            "requests_per_s": round(len(latencies) / self.elapsed, 1) if self.elapsed else None,
+            "p50_ms": ms(percentile(latencies, 50)),
+            "p95_ms": ms(percentile(latencies, 95)),
+            "p99_ms": ms(percentile(latencies, 99)),
+            "max_ms": ms(latencies[-1] if latencies else None),
+        }
+
+
+async def run_phase(phase, workers):
+    start = time.perf_counter()
+    await asyncio.gather(*workers)
+    phase.elapsed = time.perf_counter() - start
+    return phase.report()
+
+
+def db_bytes(path):
+    """Size of the database file once its WAL is checkpointed into it, so both measurements compare alike"""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+    return os.path.getsize(path)
+
+
+async def run(args):
+    from app import app, DATABASE_PATH
+
+    rng = random.Random(args.seed)
+    start_ms = int(time.time() * 1000) - args.events_per_session * 300
+    sessions = [
+        session_events(f"bench_{i}", args.events_per_session, rng, start_ms) for i in range(args.sessions)
+    ]
+    results = {}
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            size_before = db_bytes(DATABASE_PATH)
+
+            # Ingest: sessions are spread over the workers, each posting its events in order
+            ingest = Phase("ingest")
+
+            async def ingest_worker(worker):
+                for events in sessions[worker::args.concurrency]:
+                    for event in events:
+                        await ingest.request(client, "POST", "/api/events", json=event)
+
+            results["ingest"] = await run_phase(ingest, [ingest_worker(w) for w in range(args.concurrency)])
+
+            for name, url in (("risk_summary", "/api/risk-summary"), ("debug", "/debug")):
+                phase = Phase(name)
+
+                async def read_worker(worker):
+                    # The first read_requests % concurrency workers send one extra
+                    for _ in range(worker, args.read_requests, args.concurrency):
+                        await phase.request(client, "GET", url)
+
+                results[name] = await run_phase(phase, [read_worker(w) for w in range(args.concurrency)])
+
+    # Measured after shutdown, once queued events are flushed
+    total_events = args.sessions * args.events_per_session
+    size_after = db_bytes(DATABASE_PATH)
+    results["db"] = {
+        "events": total_events,
+        "bytes_before": size_before,
+        "bytes_after": size_after,
+        "bytes_per_event": round((size_after - size_before) / total_events, 1),
+    }
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, max_regression):
+    """Print per-phase changes; returns the regressions beyond max_regression"""
+    regressions = []
+    for phase, metrics in current["results"].items():
+        before = baseline.get("results", {}).get(phase)
+        if not before or "requests_per_s" not in metrics:
+            continue
+        for metric, higher_is_better in (("requests_per_s", True), ("p95_ms", False), ("p99_ms", False)):
+            old, new = before.get(metric), metrics.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = "  REGRESSION" if worse > max_regression else ""
+            print(f"{phase:>13} {metric:>15}: {old:>10} -> {new:>10} ({change:+.1%}){flag}")
+            if flag:
+                regressions.append(f"{phase}.{metric}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion, summary and debug endpoints in-process")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--events-per-session", type=int, default=200)
+    parser.add_argument("--read-requests", type=int, default=2000, help="requests per read endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results JSON here")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="fractional slowdown tolerated by --compare before exiting non-zero")
+    args = parser.parse_args()
+
+    # Run against a throwaway database in a temp directory
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(tempfile.mkdtemp(prefix="fairround-bench-"))
+
+    results = asyncio.run(run(args))
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("output", "compare", "max_regression")
+        },
+        "env": {key: value for key, value in os.environ.items() if key in (
+            "INGEST_MODE", "PAYLOAD_CODEC", "SQLITE_SYNCHRONOUS", "EVENT_FLUSH_INTERVAL_MS", "EVENT_FLUSH_MAX_BATCH"
+        )},
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(os.path.join(START_DIR, args.output), "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(os.path.join(START_DIR, args.compare)) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {baseline.get('commit')} ({args.compare}):")
+        regressions = compare(baseline, report, args.max_regression)
+        if regressions:
+            sys.exit(f"Regressions beyond {args.max_regression:.0%}: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import json
+import os
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:  # optional; payloads fall back to JSON text
+    msgpack = None
+
+# Payload fields promoted to real columns, per event type: {payload key: column}
+HOT_FIELDS = {
+    "PASTE_EVENT": {"length": "paste_length"},
+    "TAB_SWITCH": {"tabId": "tab_id"},
+}
+HOT_COLUMNS = ("paste_length", "tab_id")
+
+
+def split_payload(event_type: str, data: Dict) -> Tuple[Dict, Optional[int], Optional[int]]:
+    """Move hot fields out of the payload; returns (rest, paste_length, tab_id)"""
+    fields = HOT_FIELDS.get(event_type)
+    columns = {}
+    if fields and data:
+        for key, column in fields.items():
+            value = data.get(key)
+            # Only plain integers round-trip exactly through an INTEGER column
+            if type(value) is int:
+                columns[column] = value
+        if columns:
+            data = {key: value for key, value in data.items() if fields.get(key) not in columns}
+    return data, columns.get("paste_length"), columns.get("tab_id")
+
+
+def join_payload(event_type: str, data: Dict, paste_length: Optional[int], tab_id: Optional[int]) -> Dict:
+    """Inverse of split_payload"""
+    fields = HOT_FIELDS.get(event_type)
+    if fields:
+        columns = {"paste_length": paste_length, "tab_id": tab_id}
+        for key, column in fields.items():
+            if columns[column] is not None:
+                data = {**data, key: columns[column]}
+    return data
+
+
+class JsonCodec:
+    name = "json"
+
+    def encode(self, data: Dict):
+        return json.dumps(data, separators=(",", ":")) if data else None
+
+
+class MsgpackCodec:
+    name = "msgpack"
+
+    def encode(self, data: Dict):
+        return msgpack.packb(data) if data else None
+
+
+def decode(value) -> Dict:
+    """Decode a stored payload written by any codec (TEXT is JSON, BLOB is msgpack)"""
+    if value is None:
+        return {}
+    if isinstance(value, bytes):
+        return msgpack.unpackb(value)
+    return json.loads(value)
+
+
+def load_payload(event_type: str, data, paste_length: Optional[int], tab_id: Optional[int]) -> Dict:
+    """Rebuild the original event payload from a stored row's columns"""
+    return join_payload(event_type, decode(data), paste_length, tab_id)
+
+
+def format_timestamp(timestamp_ms: Optional[int]) -> Optional[str]:
+    """API form of a stored epoch-ms timestamp ("YYYY-MM-DD HH:MM:SS.ffffff", local time)"""
+    return datetime.fromtimestamp(timestamp_ms / 1000).isoformat(" ") if timestamp_ms is not None else None
+
+
+def parse_timestamp(value) -> Optional[int]:
+    """Epoch ms of a timestamp stored as text by older versions"""
+    if value is None or isinstance(value, int):
+        return value
+    return round(datetime.fromisoformat(value).timestamp() * 1000)
+
+
+CODECS = {"json": JsonCodec, "msgpack": MsgpackCodec}
+
+
+def get_codec(name: Optional[str] = None):
+    """Codec named by PAYLOAD_CODEC (msgpack when installed, otherwise json)"""
+    name = name or os.environ.get("PAYLOAD_CODEC") or ("msgpack" if msgpack is not None else "json")
+    if name not in CODECS:
+        raise ValueError(f"Unknown payload codec {name!r}, expected one of {', '.join(CODECS)}")
+    if name == "msgpack" and msgpack is None:
+        raise ValueError("PAYLOAD_CODEC=msgpack needs the msgpack package installed")
+    return CODECS[name]()
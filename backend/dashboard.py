@@ -0,0 +1,108 @@
+import html
+import json
+import threading
+import time
+from string import Template
+from typing import Dict, Tuple
+
+from aggregates import EventCounters, RecentEvents
+from codec import format_timestamp, load_payload
+
+PAGE = Template("""<!DOCTYPE html>
+<html>
+<head>
+    <title>Debug - AI Interview Monitor</title>
+    <style>
+        body { font-family: Arial; padding: 20px; }
+        table { border-collapse: collapse; width: 100%; }
+        th, td { border: 1px solid #ddd; padding: 8px; }
+        th { background-color: #667eea; color: white; }
+    </style>
+</head>
+<body>
+    <h1>AI Interview Monitor - Debug</h1>
+    <p>Total Events: $total_events</p>
+
+    <h3>Event Counts:</h3>
+    <table>
+        <tr><th>Event Type</th><th>Count</th></tr>
+        $count_rows
+    </table>
+
+    <h3>Recent Events:</h3>
+    <table>
+        <tr><th>ID</th><th>Type</th><th>Data</th><th>Timestamp</th></tr>
+        $event_rows
+    </table>
+    <script>
+        // Reload when the backend pushes a change instead of on a fixed timer
+        if (window.EventSource) {
+            const updates = new EventSource("/api/risk-summary/stream");
+            let first = true;
+            updates.onmessage = () => {
+                if (first) { first = false; return; }
+                updates.close();
+                setTimeout(() => location.reload(), 1000);
+            };
+        } else {
+            setTimeout(() => location.reload(), 5000);
+        }
+    </script>
+</body>
+</html>
+""")
+COUNT_ROW = Template("<tr><td>$event_type</td><td>$count</td></tr>")
+EVENT_ROW = Template("<tr><td>$id</td><td>$event_type</td><td><pre>$data</pre></td><td>$timestamp</td></tr>")
+
+
+class DebugDashboard:
+    """Renders /debug from the in-memory counters and recent events.
+
+    The rendered page is reused for `ttl` seconds, and after that only
+    re-rendered when a new event has arrived or the counts changed (keystroke
+    summaries add counts without adding events). Its ETag is the newest
+    event id plus the total count, so reloading tabs can be answered with
+    304 Not Modified.
+    """
+
+    def __init__(self, counters: EventCounters, recent: RecentEvents, ttl: float = 2.0):
+        self.counters = counters
+        self.recent = recent
+        self.ttl = ttl
+        self._cached = None  # (etag, html)
+        self._cached_at = 0.0
+        self._lock = threading.Lock()
+
+    def render(self) -> Tuple[str, str]:
+        """Return (etag, html) for the current state"""
+        now = time.monotonic()
+        with self._lock:
+            if self._cached is not None and now - self._cached_at < self.ttl:
+                return self._cached
+            counts = self.counters.snapshot()
+            # Counts only grow, so their total changes whenever any of them does
+            etag = f'"{self.recent.latest_id}-{sum(counts.values())}"'
+            if self._cached is None or self._cached[0] != etag:
+                self._cached = (etag, self._build(counts))
+            self._cached_at = now
+            return self._cached
+
+    def _build(self, counts: Dict[str, int]) -> str:
+        counts = sorted(counts.items())
+        count_rows = "".join(
+            COUNT_ROW.substitute(event_type=html.escape(event_type), count=count) for event_type, count in counts
+        )
+        event_rows = "".join(
+            EVENT_ROW.substitute(
+                id=event_id,
+                event_type=html.escape(event_type),
+                data=html.escape(json.dumps(load_payload(event_type, data, paste_length, tab_id))),
+                timestamp=format_timestamp(timestamp)
+            )
+            for event_id, event_type, data, timestamp, paste_length, tab_id in self.recent.snapshot()
+        )
+        return PAGE.substitute(
+            total_events=sum(count for _, count in counts),
+            count_rows=count_rows,
+            event_rows=event_rows
+        )
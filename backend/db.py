@@ -0,0 +1,517 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from codec import HOT_COLUMNS, load_payload, parse_timestamp, split_payload
+from keystrokes import HISTOGRAM_COLUMNS, SUMMARY_COLUMNS, SUMMED_COLUMNS
+
+# Connection tuning
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", 20000))
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_READ_POOL_SIZE = int(os.environ.get("SQLITE_READ_POOL_SIZE", 4))
+
+
+def init_schema(conn: sqlite3.Connection):
+    """Create the events table and its indexes"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event_type TEXT NOT NULL,
+        data TEXT,
+        timestamp INTEGER,  -- epoch milliseconds (see migrate_timestamps)
+        session_id TEXT DEFAULT 'default'
+    )
+    ''')
+    # Hot payload fields promoted to typed columns (see codec.HOT_FIELDS)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(events)")}
+    for column in HOT_COLUMNS:
+        if column not in columns:
+            conn.execute(f"ALTER TABLE events ADD COLUMN {column} INTEGER")
+
+    # Per-session queries: time-ordered listings and per-type counts. The type
+    # index carries the timestamp so counts above the compaction watermark
+    # stay index-only.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_session_time ON events (session_id, timestamp)")
+    conn.execute("DROP INDEX IF EXISTS idx_events_session_type")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_events_session_type_time ON events (session_id, event_type, timestamp)"
+    )
+    # Keyset pagination for the event listing and export
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_session_id ON events (session_id, id)")
+
+    # Per-session, per-minute, per-type counts backing the windowed summaries
+    has_rollups = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'event_rollups'"
+    ).fetchone()
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS event_rollups (
+        session_id TEXT NOT NULL,
+        minute INTEGER NOT NULL,
+        event_type TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (session_id, minute, event_type)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_event_rollups_minute ON event_rollups (minute)")
+    if not has_rollups:
+        backfill_rollups(conn)
+
+    # Per-session, per-minute keystroke summaries (KEYSTROKE_MODE=aggregate, see keystrokes.py)
+    histogram = "".join(f"        {column} INTEGER NOT NULL DEFAULT 0,\n" for column in HISTOGRAM_COLUMNS)
+    conn.execute(f'''
+    CREATE TABLE IF NOT EXISTS keystroke_summaries (
+        session_id TEXT NOT NULL,
+        minute INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        first_timestamp INTEGER NOT NULL,
+        last_timestamp INTEGER NOT NULL,
+        interval_count INTEGER NOT NULL,
+        interval_sum REAL NOT NULL,
+        interval_sumsq REAL NOT NULL,
+        gap_count INTEGER NOT NULL,
+        gap_sum REAL NOT NULL,
+        gap_sumsq REAL NOT NULL,
+{histogram}        PRIMARY KEY (session_id, minute)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_keystroke_summaries_minute ON keystroke_summaries (minute)")
+
+    # Bookkeeping for the maintenance job (e.g. the compaction watermark)
+    conn.execute("CREATE TABLE IF NOT EXISTS maintenance_state (key TEXT PRIMARY KEY, value)")
+    conn.commit()
+
+
+def compacted_before(conn: sqlite3.Connection) -> int:
+    """Minute before which raw events are covered by event_rollups only (0 = none)"""
+    row = conn.execute("SELECT value FROM maintenance_state WHERE key = 'compacted_before_minute'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def log_checkpoint(conn: sqlite3.Connection) -> int:
+    """Event log offset materialized into this database (0 = none)"""
+    row = conn.execute("SELECT value FROM maintenance_state WHERE key = 'event_log_offset'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def event_type_counts(conn: sqlite3.Connection, session_id: Optional[str] = None) -> Dict[str, int]:
+    """All-time per-type counts: rollups below the compaction watermark plus raw and summarized events above it"""
+    watermark = compacted_before(conn)
+    since = watermark * 60000
+    if session_id is None:
+        raw = conn.execute(
+            "SELECT event_type, COUNT(*) FROM events WHERE timestamp >= ? GROUP BY event_type", (since,)
+        ).fetchall()
+        rolled = conn.execute(
+            "SELECT event_type, SUM(count) FROM event_rollups WHERE minute < ? GROUP BY event_type", (watermark,)
+        ).fetchall()
+    else:
+        raw = conn.execute(
+            "SELECT event_type, COUNT(*) FROM events WHERE session_id = ? AND timestamp >= ? GROUP BY event_type",
+            (session_id, since)
+        ).fetchall()
+        rolled = conn.execute(
+            "SELECT event_type, SUM(count) FROM event_rollups WHERE session_id = ? AND minute < ? GROUP BY event_type",
+            (session_id, watermark)
+        ).fetchall()
+    # Aggregated keystrokes above the watermark live in keystroke_summaries, not events
+    if session_id is None:
+        summarized = conn.execute(
+            "SELECT SUM(count) FROM keystroke_summaries WHERE minute >= ?", (watermark,)
+        ).fetchone()[0]
+    else:
+        summarized = conn.execute(
+            "SELECT SUM(count) FROM keystroke_summaries WHERE session_id = ? AND minute >= ?", (session_id, watermark)
+        ).fetchone()[0]
+    counts = dict(raw)
+    for event_type, count in rolled:
+        counts[event_type] = counts.get(event_type, 0) + count
+    if summarized:
+        counts["KEYSTROKE"] = counts.get("KEYSTROKE", 0) + summarized
+    return counts
+
+
+# Rows are (event_type, payload, timestamp, session_id, paste_length, tab_id)
+INSERT_EVENTS_SQL = (
+    "INSERT INTO events (event_type, data, timestamp, session_id, paste_length, tab_id) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+
+def select_events(
+    conn: sqlite3.Connection,
+    session_id: Optional[str] = None,
+    event_types: Optional[List[str]] = None,
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None
+) -> sqlite3.Cursor:
+    """Filtered events in id order (since/until in epoch ms), as an unread cursor for the caller to page through"""
+    clauses, params = [], []
+    if session_id is not None:
+        clauses.append("session_id = ?")
+        params.append(session_id)
+    if event_types:
+        clauses.append(f"event_type IN ({', '.join('?' * len(event_types))})")
+        params.extend(event_types)
+    if since is not None:
+        clauses.append("timestamp >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("timestamp < ?")
+        params.append(until)
+    if after_id is not None:
+        clauses.append("id > ?")
+        params.append(after_id)
+    sql = "SELECT id, session_id, event_type, data, timestamp, paste_length, tab_id FROM events"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY id"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return conn.execute(sql, params)
+
+
+def max_event_id(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+
+def rollup_totals(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Per-type totals over event_rollups, which covers raw and compacted events"""
+    return dict(conn.execute("SELECT event_type, SUM(count) FROM event_rollups GROUP BY event_type").fetchall())
+
+
+def select_rollups(conn: sqlite3.Connection, since_minute: int, session_id: Optional[str] = None) -> list:
+    """(session_id, minute, event_type, count) rollups after since_minute, oldest first"""
+    if session_id is None:
+        return conn.execute(
+            "SELECT session_id, minute, event_type, count FROM event_rollups WHERE minute > ? ORDER BY minute",
+            (since_minute,)
+        ).fetchall()
+    return conn.execute(
+        "SELECT session_id, minute, event_type, count FROM event_rollups "
+        "WHERE session_id = ? AND minute > ? ORDER BY minute",
+        (session_id, since_minute)
+    ).fetchall()
+
+
+def latest_events(conn: sqlite3.Connection, limit: int) -> list:
+    """(id, event_type, data, timestamp, paste_length, tab_id) of the newest events, newest first"""
+    return conn.execute(
+        "SELECT id, event_type, data, timestamp, paste_length, tab_id FROM events ORDER BY id DESC LIMIT ?",
+        (limit,)
+    ).fetchall()
+
+
+def active_sessions(conn: sqlite3.Connection, since: int) -> list:
+    """(session_id, last timestamp) of sessions with events (or keystroke summaries) since `since`"""
+    # Index-only scan of idx_events_session_time
+    return conn.execute(
+        "SELECT session_id, MAX(last) FROM ("
+        "SELECT session_id, MAX(timestamp) AS last FROM events GROUP BY session_id "
+        "UNION ALL SELECT session_id, MAX(last_timestamp) FROM keystroke_summaries GROUP BY session_id"
+        ") GROUP BY session_id HAVING MAX(last) >= ?",
+        (since,)
+    ).fetchall()
+
+
+def session_timeline(conn: sqlite3.Connection, session_id: str) -> list:
+    """(event_type, timestamp) of a session's events in time order"""
+    return conn.execute(
+        "SELECT event_type, timestamp FROM events WHERE session_id = ? ORDER BY timestamp",
+        (session_id,)
+    ).fetchall()
+
+
+def select_keystroke_summaries(
+    conn: sqlite3.Connection, session_id: Optional[str] = None, since_minute: Optional[int] = None
+) -> list:
+    """Keystroke summary rows (in keystrokes.SUMMARY_COLUMNS order), oldest minute first"""
+    clauses, params = [], []
+    if session_id is not None:
+        clauses.append("session_id = ?")
+        params.append(session_id)
+    if since_minute is not None:
+        clauses.append("minute >= ?")
+        params.append(since_minute)
+    sql = f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM keystroke_summaries"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    return conn.execute(sql + " ORDER BY minute", params).fetchall()
+
+
+def session_events(
+    conn: sqlite3.Connection, session_id: str, before: Optional[int] = None, limit: int = 50,
+    before_id: Optional[int] = None
+) -> list:
+    """(id, event_type, data, timestamp, paste_length, tab_id) of a session's events, newest first.
+
+    Pages are keyed on (timestamp, id): with before_id, the page resumes
+    inside the `before` millisecond instead of skipping the rest of it.
+    """
+    # Walks idx_events_session_time (which ends in the rowid, i.e. id) backwards
+    sql = "SELECT id, event_type, data, timestamp, paste_length, tab_id FROM events WHERE session_id = ?"
+    params = [session_id]
+    if before is not None and before_id is not None:
+        sql += " AND (timestamp < ? OR (timestamp = ? AND id < ?))"
+        params += [before, before, before_id]
+    elif before is not None:
+        sql += " AND timestamp < ?"
+        params.append(before)
+    return conn.execute(sql + " ORDER BY timestamp DESC, id DESC LIMIT ?", params + [limit]).fetchall()
+
+
+def insert_rows(db: "Database", rows, log_offset: Optional[int] = None, summaries=()) -> Tuple[int, list]:
+    """Insert event rows and their rollups in one transaction; returns (first id, rollup increments).
+
+    log_offset is the event log checkpoint (see eventlog.py) to commit along
+    with them, and summaries any keystroke summaries of the same log records.
+    """
+    increments = rollup_rows(rows)
+    with db.write() as conn:
+        conn.executemany(INSERT_EVENTS_SQL, rows)
+        # AUTOINCREMENT ids are contiguous inside the transaction
+        last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        add_rollups(conn, increments)
+        if summaries:
+            conn.executemany(UPSERT_KEYSTROKE_SUMMARIES_SQL, summaries)
+            add_rollups(conn, summary_rollups(summaries))
+        if log_offset is not None:
+            conn.execute(
+                "INSERT INTO maintenance_state (key, value) VALUES ('event_log_offset', ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (log_offset,)
+            )
+    return last_id - len(rows) + 1, increments
+
+
+# Every summary field is a sum, min or max, so upserts merge partial minutes
+UPSERT_KEYSTROKE_SUMMARIES_SQL = (
+    f"INSERT INTO keystroke_summaries ({', '.join(SUMMARY_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(SUMMARY_COLUMNS))}) "
+    "ON CONFLICT (session_id, minute) DO UPDATE SET "
+    "first_timestamp = MIN(first_timestamp, excluded.first_timestamp), "
+    "last_timestamp = MAX(last_timestamp, excluded.last_timestamp), "
+    + ", ".join(
+        f"{column} = {column} + excluded.{column}" for column in ("count",) + SUMMED_COLUMNS
+    )
+)
+
+
+def summary_rollups(summaries) -> list:
+    """Rollup increments for keystroke summary rows (minutes with only a gap have none)"""
+    return [(row[0], row[1], "KEYSTROKE", row[2]) for row in summaries if row[2]]
+
+
+def insert_keystroke_summaries(db: "Database", summaries) -> list:
+    """Merge keystroke summaries and their rollups in one transaction; returns the rollup increments"""
+    increments = summary_rollups(summaries)
+    with db.write() as conn:
+        conn.executemany(UPSERT_KEYSTROKE_SUMMARIES_SQL, summaries)
+        add_rollups(conn, increments)
+    return increments
+
+
+def rollup_rows(rows):
+    """Group event rows into rollup increments"""
+    increments = {}
+    for row in rows:
+        key = (row[3], row[2] // 60000, row[0])
+        increments[key] = increments.get(key, 0) + 1
+    return [(session_id, minute, event_type, count) for (session_id, minute, event_type), count in increments.items()]
+
+
+def add_rollups(conn: sqlite3.Connection, increments):
+    conn.executemany(
+        "INSERT INTO event_rollups (session_id, minute, event_type, count) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (session_id, minute, event_type) DO UPDATE SET count = count + excluded.count",
+        increments
+    )
+
+
+def replace_rollups(db: "Database", increments):
+    """Swap event_rollups for the given (session_id, minute, event_type, count) rows in one transaction"""
+    with db.write() as conn:
+        conn.execute("DELETE FROM event_rollups")
+        add_rollups(conn, increments)
+
+
+def backfill_rollups(conn: sqlite3.Connection, chunk_size: int = 10000):
+    """One-time migration: build event_rollups from the events already stored"""
+    rows = conn.execute(
+        "SELECT event_type, data, timestamp, COALESCE(session_id, 'default') FROM events "
+        "WHERE timestamp IS NOT NULL"
+    )
+    while True:
+        chunk = rows.fetchmany(chunk_size)
+        if not chunk:
+            break
+        # Databases this old still have text timestamps
+        add_rollups(conn, rollup_rows([
+            (event_type, data, parse_timestamp(timestamp), session_id) for event_type, data, timestamp, session_id in chunk
+        ]))
+
+
+def migrate_payloads(db: "Database", codec, chunk_size: int = 5000) -> int:
+    """Re-encode stored payloads with `codec` and fill the hot columns.
+
+    Runs once per codec change (tracked in maintenance_state), in id-ordered
+    chunks so each transaction stays short.
+    """
+    with db.read() as conn:
+        row = conn.execute("SELECT value FROM maintenance_state WHERE key = 'payload_codec'").fetchone()
+    if row and row[0] == codec.name:
+        return 0
+
+    migrated = 0
+    last_id = 0
+    while True:
+        with db.write() as conn:
+            chunk = conn.execute(
+                "SELECT id, event_type, data, paste_length, tab_id FROM events WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, chunk_size)
+            ).fetchall()
+            if not chunk:
+                conn.execute(
+                    "INSERT INTO maintenance_state (key, value) VALUES ('payload_codec', ?) "
+                    "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                    (codec.name,)
+                )
+                return migrated
+            updates = []
+            for event_id, event_type, data, paste_length, tab_id in chunk:
+                payload = load_payload(event_type, data, paste_length, tab_id)
+                rest, paste_length, tab_id = split_payload(event_type, payload)
+                updates.append((codec.encode(rest), paste_length, tab_id, event_id))
+            conn.executemany("UPDATE events SET data = ?, paste_length = ?, tab_id = ? WHERE id = ?", updates)
+            migrated += len(updates)
+            last_id = chunk[-1][0]
+
+
+def migrate_timestamps(db: "Database", chunk_size: int = 5000) -> int:
+    """Convert timestamps stored as text by older versions to epoch milliseconds.
+
+    Runs once (tracked in maintenance_state), in id-ordered chunks.
+    """
+    with db.read() as conn:
+        row = conn.execute("SELECT value FROM maintenance_state WHERE key = 'timestamp_format'").fetchone()
+    if row and row[0] == "epoch_ms":
+        return 0
+
+    migrated = 0
+    last_id = 0
+    while True:
+        with db.write() as conn:
+            chunk = conn.execute(
+                "SELECT id, timestamp FROM events WHERE id > ? ORDER BY id LIMIT ?", (last_id, chunk_size)
+            ).fetchall()
+            if not chunk:
+                conn.execute(
+                    "INSERT INTO maintenance_state (key, value) VALUES ('timestamp_format', 'epoch_ms') "
+                    "ON CONFLICT (key) DO UPDATE SET value = excluded.value"
+                )
+                return migrated
+            updates = [
+                (parse_timestamp(timestamp), event_id) for event_id, timestamp in chunk if isinstance(timestamp, str)
+            ]
+            conn.executemany("UPDATE events SET timestamp = ? WHERE id = ?", updates)
+            migrated += len(updates)
+            last_id = chunk[-1][0]
+
+
+def _tune(conn: sqlite3.Connection):
+    conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size = {-SQLITE_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+
+class Database:
+    """One dedicated writer connection plus a pool of read-only connections.
+
+    The file runs in WAL mode, so readers see the last committed state and
+    never wait on an in-progress write. `observe(op, seconds)`, if given, is
+    called with write lock wait, execute and commit times and read pool waits.
+    With writable=False only the read pool is opened (e.g. in web workers
+    when a separate writer process owns the file).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        read_pool_size: int = SQLITE_READ_POOL_SIZE,
+        observe: Optional[Callable[[str, float], None]] = None,
+        writable: bool = True
+    ):
+        self.path = path
+        self.observe = observe
+        self.writer = None
+        if writable:
+            self.writer = sqlite3.connect(path, check_same_thread=False)
+            if self.writer.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                # Lets the maintenance job hand freed pages back in small steps;
+                # existing files need one full VACUUM for the setting to apply
+                self.writer.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                self.writer.execute("VACUUM")
+            self.writer.execute("PRAGMA journal_mode = WAL")
+            _tune(self.writer)
+            init_schema(self.writer)
+        self._write_lock = threading.Lock()
+
+        self._readers: queue.Queue = queue.Queue()
+        for _ in range(max(1, read_pool_size)):
+            self._readers.put(self.open_reader())
+
+    def open_reader(self) -> sqlite3.Connection:
+        """A new read-only connection, for long reads that shouldn't hold a pooled one"""
+        reader = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        _tune(reader)
+        return reader
+
+    @contextmanager
+    def write(self):
+        """Exclusive access to the writer connection; commits on success"""
+        if self.writer is None:
+            raise RuntimeError("Database was opened read-only")
+        start = time.perf_counter()
+        with self._write_lock:
+            acquired = time.perf_counter()
+            try:
+                yield self.writer
+                executed = time.perf_counter()
+                self.writer.commit()
+            except Exception:
+                self.writer.rollback()
+                raise
+            if self.observe is not None:
+                self.observe("write_lock_wait", acquired - start)
+                self.observe("execute", executed - acquired)
+                self.observe("commit", time.perf_counter() - executed)
+
+    @contextmanager
+    def read(self):
+        """Borrow a read-only connection from the pool"""
+        start = time.perf_counter()
+        reader = self._readers.get()
+        if self.observe is not None:
+            self.observe("read_pool_wait", time.perf_counter() - start)
+        try:
+            yield reader
+        finally:
+            self._readers.put(reader)
+
+    def close(self):
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+        # Closed last so it can checkpoint the WAL back into the main file
+        with self._write_lock:
+            if self.writer is not None:
+                self.writer.close()
@@ -0,0 +1,361 @@
+"""Durable append-only event log (INGEST_MODE=log).
+
+Ingestion appends event rows to the log and answers once they are fsynced.
+A LogConsumer then materializes them into the database. Records are stored
+in segment files named after the byte offset they start at
+(00000000000000000000.log, ...). Each record is a 4-byte length, a CRC32
+and the encoded row, and an offset is a position in the concatenation of
+all segments. Appends arriving within EVENT_LOG_FSYNC_INTERVAL_MS share one
+fsync. The consumer's checkpoint, the offset it has materialized up to, is
+committed with the rows it inserts (maintenance_state 'event_log_offset'),
+so every record reaches the database exactly once, even across crashes.
+"""
+import asyncio
+import logging
+import os
+import struct
+import threading
+import zlib
+from collections import deque
+from typing import Awaitable, Callable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOG_DIR = os.environ.get("EVENT_LOG_DIR", "event_log")
+EVENT_LOG_SEGMENT_MB = float(os.environ.get("EVENT_LOG_SEGMENT_MB", 64))
+# Appends within this window share an fsync (0 syncs as soon as the previous fsync is done)
+EVENT_LOG_FSYNC_INTERVAL_MS = float(os.environ.get("EVENT_LOG_FSYNC_INTERVAL_MS", 2))
+# Oldest fully materialized segments beyond this many are deleted (0 keeps all, for replay)
+EVENT_LOG_MAX_SEGMENTS = int(os.environ.get("EVENT_LOG_MAX_SEGMENTS", 0))
+
+_HEADER = struct.Struct(">II")  # payload length, CRC32 of the payload
+# timestamp, paste_length, tab_id, flags, then the lengths of event_type, session_id, payload
+_ROW = struct.Struct(">qqqBHHI")
+_NO_PASTE_LENGTH, _NO_TAB_ID, _BINARY_PAYLOAD, _NO_PAYLOAD = 1, 2, 4, 8
+
+
+def encode_row(row: tuple) -> bytes:
+    """An events table row (event_type, payload, timestamp, session_id, paste_length, tab_id) as record bytes"""
+    event_type, payload, timestamp, session_id, paste_length, tab_id = row
+    flags = 0
+    if paste_length is None:
+        flags |= _NO_PASTE_LENGTH
+    if tab_id is None:
+        flags |= _NO_TAB_ID
+    if payload is None:
+        flags |= _NO_PAYLOAD
+        payload = b""
+    elif isinstance(payload, str):
+        payload = payload.encode()
+    else:
+        flags |= _BINARY_PAYLOAD
+    event_type, session_id = event_type.encode(), session_id.encode()
+    return _ROW.pack(
+        timestamp, paste_length or 0, tab_id or 0, flags, len(event_type), len(session_id), len(payload)
+    ) + event_type + session_id + payload
+
+
+def decode_row(data: bytes) -> tuple:
+    timestamp, paste_length, tab_id, flags, type_len, session_len, payload_len = _ROW.unpack_from(data)
+    start = _ROW.size
+    event_type = data[start:start + type_len].decode()
+    start += type_len
+    session_id = data[start:start + session_len].decode()
+    start += session_len
+    payload = data[start:start + payload_len]
+    if flags & _NO_PAYLOAD:
+        payload = None
+    elif not flags & _BINARY_PAYLOAD:
+        payload = payload.decode()
+    return (
+        event_type,
+        payload,
+        timestamp,
+        session_id,
+        None if flags & _NO_PASTE_LENGTH else paste_length,
+        None if flags & _NO_TAB_ID else tab_id
+    )
+
+
+def _segment_name(base: int) -> str:
+    return f"{base:020d}.log"
+
+
+def _valid_length(path: str) -> int:
+    """Bytes of whole, checksummed records at the start of a segment file"""
+    valid = 0
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return valid
+            length, crc = _HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length or zlib.crc32(data) != crc:
+                return valid
+            valid += _HEADER.size + length
+
+
+class SegmentLog:
+    """The log's segment files: appends with group fsync, and reads by offset"""
+
+    def __init__(
+        self,
+        directory: str = EVENT_LOG_DIR,
+        segment_bytes: int = int(EVENT_LOG_SEGMENT_MB * 1024 * 1024),
+        fsync_interval: float = EVENT_LOG_FSYNC_INTERVAL_MS / 1000,
+        max_segments: int = EVENT_LOG_MAX_SEGMENTS
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.max_segments = max_segments
+        self.bases: List[int] = []
+        self.end = 0  # offset after the last appended record
+        self.synced = 0  # offset up to which records are fsynced
+        self.checkpoint = 0  # offset materialized by the consumer (for segment deletion)
+        self._file = None
+        self._sync_lock = threading.Lock()
+        self._dirty: Optional[asyncio.Event] = None
+        self._synced_event: Optional[asyncio.Event] = None
+        self._waiters: deque = deque()
+        self._task: Optional[asyncio.Task] = None
+
+    def open(self, start_offset: int = 0):
+        """Open the segments, dropping a torn record at the tail; an empty log starts at start_offset"""
+        os.makedirs(self.directory, exist_ok=True)
+        self.bases = sorted(
+            int(name[:-4]) for name in os.listdir(self.directory) if name.endswith(".log") and name[:-4].isdigit()
+        )
+        if not self.bases:
+            self.bases = [start_offset]
+            open(self._path(start_offset), "ab").close()
+        last = self._path(self.bases[-1])
+        valid = _valid_length(last)
+        if valid < os.path.getsize(last):
+            logger.warning("Truncating %d bytes of a partly written record in %s", os.path.getsize(last) - valid, last)
+            with open(last, "r+b") as f:
+                f.truncate(valid)
+                os.fsync(f.fileno())
+        self.end = self.synced = self.bases[-1] + valid
+        self._file = open(last, "ab", buffering=0)
+
+    def _path(self, base: int) -> str:
+        return os.path.join(self.directory, _segment_name(base))
+
+    @property
+    def start(self) -> int:
+        return self.bases[0]
+
+    def start_syncing(self):
+        self._dirty = asyncio.Event()
+        self._synced_event = asyncio.Event()
+        self._task = asyncio.ensure_future(self._sync_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        # Whatever was written reaches the disk before the file is closed
+        await asyncio.to_thread(self._fsync)
+        self.synced = self.end
+        while self._waiters:
+            waiter = self._waiters.popleft()[1]
+            if not waiter.done():
+                waiter.set_result(None)
+        with self._sync_lock:
+            self._file.close()
+
+    def write(self, rows: List[tuple]) -> int:
+        """Append rows to the current segment (not yet durable); returns the offset after them"""
+        records = []
+        for row in rows:
+            data = encode_row(row)
+            records.append(_HEADER.pack(len(data), zlib.crc32(data)))
+            records.append(data)
+        buffer = memoryview(b"".join(records))
+        size, position = len(buffer), self.end - self.bases[-1]
+        try:
+            while buffer:
+                buffer = buffer[self._file.write(buffer):]
+        except OSError:
+            # Don't leave part of a record in front of the next append
+            os.ftruncate(self._file.fileno(), position)
+            raise
+        self.end += size
+        if self.end - self.bases[-1] >= self.segment_bytes:
+            try:
+                self._fsync()
+            except OSError as e:
+                self._discard_unsynced(e)
+                raise
+            self._rotate()
+        return self.end
+
+    async def append(self, rows: List[tuple]) -> int:
+        """Append rows and wait until they are fsynced; returns the offset after them"""
+        end = self.write(rows)
+        if end > self.synced:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append((end, waiter))
+            self._dirty.set()
+            await waiter
+        return end
+
+    def _rotate(self):
+        with self._sync_lock:
+            self._file.close()
+            self.bases.append(self.end)
+            self._file = open(self._path(self.end), "ab", buffering=0)
+        # The finished segment is durable, and so is the directory entry for the new one
+        self._fsync_directory()
+        self.synced = max(self.synced, self.end)
+        self._delete_old_segments()
+
+    def _fsync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _delete_old_segments(self):
+        while self.max_segments and len(self.bases) > self.max_segments and self.bases[1] <= self.checkpoint:
+            os.unlink(self._path(self.bases.pop(0)))
+
+    def _fsync(self):
+        with self._sync_lock:
+            os.fsync(self._file.fileno())
+
+    def _discard_unsynced(self, error: Exception):
+        """After a failed fsync: cut the segment back to the synced offset and fail the appends past it"""
+        # The clients retry these appends, so the records must not be materialized as well
+        # (a rotation fsyncs the finished segment, so synced is never before the current one)
+        logger.error("Event log fsync failed; dropping %d unsynced bytes after offset %d", self.end - self.synced, self.synced)
+        try:
+            with self._sync_lock:
+                os.ftruncate(self._file.fileno(), self.synced - self.bases[-1])
+            self.end = self.synced
+        except OSError:
+            logger.exception("Could not truncate the event log after a failed fsync")
+        while self._waiters:
+            waiter = self._waiters.popleft()[1]
+            if not waiter.done():
+                waiter.set_exception(error)
+
+    async def _sync_loop(self):
+        while True:
+            await self._dirty.wait()
+            if self.fsync_interval:
+                # Gather the appends arriving meanwhile into this fsync
+                await asyncio.sleep(self.fsync_interval)
+            self._dirty.clear()
+            end = self.end
+            if end > self.synced:
+                try:
+                    await asyncio.to_thread(self._fsync)
+                except Exception as e:
+                    self._discard_unsynced(e)
+                    continue
+                self.synced = max(self.synced, end)
+            while self._waiters and self._waiters[0][0] <= self.synced:
+                waiter = self._waiters.popleft()[1]
+                if not waiter.done():
+                    waiter.set_result(None)
+            self._synced_event.set()
+
+    async def wait_for_records(self, offset: int, timeout: float):
+        """Wait until records past offset are durable, or for timeout seconds"""
+        if self.synced > offset:
+            return
+        self._synced_event.clear()
+        try:
+            await asyncio.wait_for(self._synced_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def read(self, offset: int, max_records: int, until: Optional[int] = None) -> Tuple[List[tuple], int]:
+        """Up to max_records rows from offset (up to `until`, default the fsynced end); returns (rows, next offset)"""
+        until = self.synced if until is None else until
+        if offset < self.start:
+            raise ValueError(f"Offset {offset} was deleted from the event log (it starts at {self.start})")
+        rows = []
+        while offset < until and len(rows) < max_records:
+            index = max(i for i, base in enumerate(self.bases) if base <= offset)
+            base = self.bases[index]
+            segment_end = self.bases[index + 1] if index + 1 < len(self.bases) else until
+            with open(self._path(base), "rb") as f:
+                f.seek(offset - base)
+                while offset < min(segment_end, until) and len(rows) < max_records:
+                    length, crc = _HEADER.unpack(f.read(_HEADER.size))
+                    data = f.read(length)
+                    if zlib.crc32(data) != crc:
+                        raise ValueError(f"Corrupt event log record at offset {offset}")
+                    rows.append(decode_row(data))
+                    offset += _HEADER.size + length
+        return rows, offset
+
+    def scan(self, offset: Optional[int] = None, batch: int = 5000) -> Iterator[Tuple[List[tuple], int]]:
+        """(rows, next offset) batches from offset (default the start) to the end of the log"""
+        offset = self.start if offset is None else offset
+        while offset < self.end:
+            rows, offset = self.read(offset, batch, until=self.end)
+            yield rows, offset
+
+
+class LogConsumer:
+    """Materializes durable log records into the database, resuming from its checkpoint"""
+
+    def __init__(
+        self,
+        log: SegmentLog,
+        materialize: Callable[[List[tuple], int], Awaitable],
+        checkpoint: int,
+        max_batch: int = 500,
+        poll_interval: float = 0.2
+    ):
+        self.log = log
+        self.materialize = materialize
+        self.checkpoint = log.checkpoint = checkpoint
+        self.max_batch = max_batch
+        self.poll_interval = poll_interval
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    @property
+    def lag(self) -> int:
+        """Bytes appended but not yet materialized"""
+        return self.log.end - self.checkpoint
+
+    def start(self):
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Materialize what is already durable, then stop"""
+        if self._task is not None:
+            self._closing = True
+            await self._task
+            self._task = None
+
+    async def _run(self):
+        while True:
+            if self.checkpoint >= self.log.synced:
+                if self._closing:
+                    return
+                await self.log.wait_for_records(self.checkpoint, self.poll_interval)
+                continue
+            rows, offset = await asyncio.to_thread(self.log.read, self.checkpoint, self.max_batch)
+            try:
+                # Commits the rows together with the new checkpoint
+                await self.materialize(rows, offset)
+            except Exception:
+                if self._closing:
+                    logger.exception("Leaving %d bytes of the event log for the next start", self.lag)
+                    return
+                # e.g. the database is locked: the records stay in the log, retry them
+                logger.exception("Failed to materialize %d logged events, retrying", len(rows))
+                await asyncio.sleep(self.poll_interval)
+                continue
+            self.checkpoint = self.log.checkpoint = offset
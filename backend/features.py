@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+# Column order the model was trained with (see ml/train_behavior.py); both
+# variances are in ms^2, the counts are plain counts
+FEATURE_NAMES = ["typing_variance", "paste_count", "tab_switch_count", "response_time_variance"]
+
+
+class SessionFeatures:
+    """Running behavior statistics for one session.
+
+    Intervals are in milliseconds (so the variances are in ms^2, the unit
+    the model is trained on) and use Welford's update, so every event costs
+    O(1) and no history is kept.
+    """
+
+    __slots__ = (
+        "last_keystroke", "typing_n", "typing_mean", "typing_m2",
+        "last_event", "gap_n", "gap_mean", "gap_m2",
+        "paste_count", "tab_switch_count", "last_seen"
+    )
+
+    def __init__(self):
+        self.last_keystroke = None
+        self.typing_n = 0
+        self.typing_mean = 0.0
+        self.typing_m2 = 0.0
+        self.last_event = None
+        self.gap_n = 0
+        self.gap_mean = 0.0
+        self.gap_m2 = 0.0
+        self.paste_count = 0
+        self.tab_switch_count = 0
+        self.last_seen = 0.0
+
+    def update(self, event_type: str, timestamp_ms: float):
+        # Out-of-order events still count, but don't contribute an interval
+        if self.last_event is not None and timestamp_ms >= self.last_event:
+            gap = timestamp_ms - self.last_event
+            self.gap_n += 1
+            delta = gap - self.gap_mean
+            self.gap_mean += delta / self.gap_n
+            self.gap_m2 += delta * (gap - self.gap_mean)
+        if self.last_event is None or timestamp_ms >= self.last_event:
+            self.last_event = timestamp_ms
+
+        if event_type == "KEYSTROKE":
+            if self.last_keystroke is not None and timestamp_ms >= self.last_keystroke:
+                interval = timestamp_ms - self.last_keystroke
+                self.typing_n += 1
+                delta = interval - self.typing_mean
+                self.typing_mean += delta / self.typing_n
+                self.typing_m2 += delta * (interval - self.typing_mean)
+            if self.last_keystroke is None or timestamp_ms >= self.last_keystroke:
+                self.last_keystroke = timestamp_ms
+        else:
+            self.count(event_type)
+
+    def count(self, event_type: str):
+        if event_type == "PASTE_EVENT":
+            self.paste_count += 1
+        elif event_type == "TAB_SWITCH":
+            self.tab_switch_count += 1
+
+    def add_timing(self, summary: tuple):
+        """Merge a keystroke summary row's interval and gap sums (see keystrokes.py)"""
+        self.typing_n, self.typing_mean, self.typing_m2 = _merge(
+            self.typing_n, self.typing_mean, self.typing_m2, summary[5], summary[6], summary[7]
+        )
+        self.gap_n, self.gap_mean, self.gap_m2 = _merge(
+            self.gap_n, self.gap_mean, self.gap_m2, summary[8], summary[9], summary[10]
+        )
+
+    def vector(self) -> List[float]:
+        return [
+            self.typing_m2 / self.typing_n if self.typing_n > 1 else 0.0,
+            float(self.paste_count),
+            float(self.tab_switch_count),
+            self.gap_m2 / self.gap_n if self.gap_n > 1 else 0.0
+        ]
+
+
+def _merge(n: int, mean: float, m2: float, count: int, total: float, sumsq: float):
+    """Combine Welford statistics with a batch given as count, sum and sum of squares (Chan et al.)"""
+    if not count:
+        return n, mean, m2
+    batch_mean = total / count
+    batch_m2 = max(sumsq - total * batch_mean, 0.0)
+    merged = n + count
+    delta = batch_mean - mean
+    return merged, mean + delta * count / merged, m2 + batch_m2 + delta * delta * n * count / merged
+
+
+class FeatureStore:
+    """Per-session SessionFeatures with idle eviction and a size cap.
+
+    With summarized_timing (KEYSTROKE_MODE=aggregate) updates only count
+    events, and the interval statistics come from keystroke summaries.
+    """
+
+    def __init__(self, idle_ttl: float = 3600, max_sessions: int = 10000, summarized_timing: bool = False):
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.summarized_timing = summarized_timing
+        self._sessions: "OrderedDict[str, SessionFeatures]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _session(self, session_id: str) -> SessionFeatures:
+        features = self._sessions.get(session_id)
+        if features is None:
+            features = self._sessions[session_id] = SessionFeatures()
+        else:
+            self._sessions.move_to_end(session_id)
+        return features
+
+    def update(self, session_id: str, event_type: str, timestamp_ms: float):
+        now = time.time()
+        with self._lock:
+            features = self._session(session_id)
+            if self.summarized_timing:
+                features.count(event_type)
+            else:
+                features.update(event_type, timestamp_ms)
+            features.last_seen = now
+            self._evict(now)
+
+    def add_timing(self, summaries: List[tuple]):
+        """Merge flushed keystroke summary rows into their sessions"""
+        now = time.time()
+        with self._lock:
+            for summary in summaries:
+                features = self._session(summary[0])
+                features.add_timing(summary)
+                features.last_seen = now
+            self._evict(now)
+
+    def _evict(self, now: float):
+        # Least recently updated sessions sit at the front
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if len(self._sessions) <= self.max_sessions and now - oldest.last_seen < self.idle_ttl:
+                break
+            self._sessions.popitem(last=False)
+
+    def features(self, session_id: str) -> Optional[List[float]]:
+        with self._lock:
+            features = self._sessions.get(session_id)
+            return features.vector() if features is not None else None
+
+    async def _load(self, reader, session_id: str) -> SessionFeatures:
+        features = SessionFeatures()
+        timeline = await reader.session_timeline(session_id)
+        summaries = await reader.keystroke_summaries(session_id)
+        if not summaries:
+            for event_type, timestamp in timeline:
+                features.update(event_type, timestamp)
+            return features
+        # Stored with KEYSTROKE_MODE=aggregate: timing from the summaries, counts from the events
+        for event_type, _ in timeline:
+            features.count(event_type)
+        for summary in summaries:
+            features.add_timing(summary)
+        return features
+
+    async def load_session(self, reader, session_id: str) -> List[float]:
+        """Recompute one session (e.g. after eviction) from its stored events"""
+        return (await self._load(reader, session_id)).vector()
+
+    async def rebuild(self, reader):
+        """Reload sessions active within idle_ttl from the stored events (used at startup)"""
+        since = int((time.time() - self.idle_ttl) * 1000)
+        active = await reader.active_sessions(since)
+        sessions = []
+        for session_id, last_timestamp in sorted(active, key=lambda row: row[1])[-self.max_sessions:]:
+            features = await self._load(reader, session_id)
+            features.last_seen = last_timestamp / 1000
+            sessions.append((session_id, features))
+        with self._lock:
+            self._sessions = OrderedDict(sessions)
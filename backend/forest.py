@@ -0,0 +1,98 @@
+import struct
+import zipfile
+from typing import Dict
+
+import numpy as np
+
+# Arrays stored in a flat forest artifact (an uncompressed .npz)
+ARRAY_NAMES = ("feature", "threshold", "left", "right", "value", "roots", "max_depth")
+
+
+def _mmap_npz(path: str) -> Dict[str, np.ndarray]:
+    """Memory-map every member of an uncompressed .npz.
+
+    np.load ignores mmap_mode for .npz files, so locate each member's .npy
+    payload inside the zip and map it directly. Pages are then shared by
+    every process that loads the same file.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                arrays[name] = np.load(archive.open(info))
+                continue
+            # Local file header: 30 fixed bytes, then the name and extra field
+            f.seek(info.header_offset)
+            header = f.read(30)
+            name_length, extra_length = struct.unpack("<HH", header[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            arrays[name] = np.memmap(
+                path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                order="F" if fortran_order else "C"
+            )
+    return arrays
+
+
+class FlatForest:
+    """A tree ensemble flattened into node arrays, evaluated with NumPy only.
+
+    Node i of the concatenated trees tests X[:, feature[i]] <= threshold[i]
+    and continues at left[i] or right[i]; leaves have feature == -1 and carry
+    the positive-class probability in value[i]. roots holds each tree's first
+    node.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.max_depth = int(arrays["max_depth"])
+
+    @classmethod
+    def load(cls, path: str) -> "FlatForest":
+        return cls(_mmap_npz(path))
+
+    def save(self, path: str):
+        np.savez(
+            path,
+            feature=np.asarray(self.feature, dtype=np.int32),
+            threshold=np.asarray(self.threshold, dtype=np.float64),
+            left=np.asarray(self.left, dtype=np.int32),
+            right=np.asarray(self.right, dtype=np.int32),
+            value=np.asarray(self.value, dtype=np.float64),
+            roots=np.asarray(self.roots, dtype=np.int32),
+            max_depth=np.asarray(self.max_depth, dtype=np.int32)
+        )
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    def predict_proba(self, X) -> np.ndarray:
+        """Positive-class probability for each row, averaged over all trees"""
+        # Match scikit-learn, which compares float32 inputs against the thresholds
+        X = np.asarray(X, dtype=np.float32)
+        n_samples = len(X)
+        # One cursor per (sample, tree) pair; only pairs still on an internal
+        # node are advanced, so shallow branches stop costing work early
+        node = np.tile(np.asarray(self.roots, dtype=np.int64), n_samples)
+        sample = np.repeat(np.arange(n_samples), self.n_trees)
+        active = np.flatnonzero(self.feature[node] >= 0)
+        for _ in range(self.max_depth):
+            if not len(active):
+                break
+            current = node[active]
+            goes_left = X[sample[active], self.feature[current]] <= self.threshold[current]
+            current = np.where(goes_left, self.left[current], self.right[current])
+            node[active] = current
+            active = active[self.feature[current] >= 0]
+        return self.value[node].reshape(n_samples, self.n_trees).mean(axis=1)
@@ -0,0 +1,157 @@
+"""Request parsing for the event ingestion endpoints.
+
+Bodies are read raw and decoded with orjson when it is installed. Events
+whose fields already have the declared types (nearly all of them) are
+accepted after plain type checks; anything else goes through the pydantic
+models, which coerce what they can and produce the usual 422 errors.
+Parsed events are (type, timestamp, data, session_id) tuples.
+"""
+import json
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, get_args
+
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError
+
+try:
+    import orjson
+except ImportError:  # optional; falls back to the json module
+    orjson = None
+
+if orjson is not None:
+    from fastapi.responses import ORJSONResponse as EventResponse
+    _loads = orjson.loads
+else:
+    EventResponse = JSONResponse
+    _loads = json.loads
+
+
+# Timestamps must convert to a datetime (in any local timezone) when read back
+MAX_TIMESTAMP_MS = int(datetime(9999, 12, 30, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+class EventData(BaseModel):
+    type: str
+    timestamp: Optional[int] = Field(None, ge=0, le=MAX_TIMESTAMP_MS)  # epoch milliseconds
+    data: Dict = {}
+    session_id: Optional[str] = None
+
+
+class PastePayload(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    length: Optional[int] = None
+    count: Optional[int] = None
+    url: Optional[str] = None
+
+
+class TabSwitchPayload(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    tabId: Optional[int] = None
+    count: Optional[int] = None
+
+
+# Payload models per event type; other types keep a free-form dict. Fields
+# not declared here (such as the extension's "risk", a toFixed() string)
+# are passed through unchanged.
+PAYLOAD_MODELS = {
+    "PASTE_EVENT": PastePayload,
+    "TAB_SWITCH": TabSwitchPayload,
+}
+
+# {event_type: {field: type}} for the fast-path checks
+_PAYLOAD_TYPES = {
+    event_type: {
+        name: next(arg for arg in get_args(field.annotation) if arg is not type(None))
+        for name, field in model.model_fields.items()
+    }
+    for event_type, model in PAYLOAD_MODELS.items()
+}
+
+_EVENT = TypeAdapter(EventData)
+_BATCH = TypeAdapter(List[EventData])
+
+EVENT_SCHEMA = EventData.model_json_schema()
+BATCH_SCHEMA = {"type": "array", "items": EVENT_SCHEMA}
+
+
+def decode_body(body: bytes):
+    """Decode a JSON request body, raising the same 422 FastAPI gives for bad JSON"""
+    if not body:
+        raise RequestValidationError([{"type": "missing", "loc": ("body",), "msg": "Field required", "input": None}])
+    try:
+        return _loads(body)
+    except ValueError as e:
+        raise RequestValidationError([{
+            "type": "json_invalid",
+            "loc": ("body", getattr(e, "pos", 0)),
+            "msg": "JSON decode error",
+            "input": {},
+            "ctx": {"error": getattr(e, "msg", str(e))}
+        }])
+
+
+def _plain(event) -> Optional[tuple]:
+    """The parsed event if it needs no coercion, otherwise None"""
+    if type(event) is not dict:
+        return None
+    event_type = event.get("type")
+    timestamp = event.get("timestamp")
+    data = event.get("data", {})
+    session_id = event.get("session_id")
+    if (
+        type(event_type) is not str
+        or type(data) is not dict
+        or (timestamp is not None and (type(timestamp) is not int or not 0 <= timestamp <= MAX_TIMESTAMP_MS))
+        or (session_id is not None and type(session_id) is not str)
+    ):
+        return None
+    fields = _PAYLOAD_TYPES.get(event_type)
+    if fields and data:
+        for name, expected in fields.items():
+            value = data.get(name)
+            if value is not None and type(value) is not expected:
+                return None
+    return (event_type, timestamp, data, session_id)
+
+
+def _errors(error: ValidationError, prefix: tuple) -> list:
+    return [{**e, "loc": prefix + tuple(e["loc"])} for e in error.errors(include_url=False)]
+
+
+def _validate(value, batch: bool) -> List[tuple]:
+    try:
+        events = _BATCH.validate_python(value) if batch else [_EVENT.validate_python(value)]
+    except ValidationError as e:
+        raise RequestValidationError(_errors(e, ("body",)))
+    parsed = []
+    errors = []
+    for i, event in enumerate(events):
+        data = event.data
+        model = PAYLOAD_MODELS.get(event.type)
+        if model is not None:
+            try:
+                data = model.model_validate(data).model_dump(exclude_unset=True)
+            except ValidationError as e:
+                errors.extend(_errors(e, ("body", i, "data") if batch else ("body", "data")))
+                continue
+        parsed.append((event.type, event.timestamp, data, event.session_id))
+    if errors:
+        raise RequestValidationError(errors)
+    return parsed
+
+
+def parse_events(value, batch: bool = False) -> List[tuple]:
+    """Validate a decoded body (one event, or a list of them when batch is set)"""
+    if batch:
+        if type(value) is list:
+            parsed = [_plain(event) for event in value]
+            if None not in parsed:
+                return parsed
+    else:
+        event = _plain(value)
+        if event is not None:
+            return [event]
+    return _validate(value, batch)
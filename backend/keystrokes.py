@@ -0,0 +1,216 @@
+"""KEYSTROKE aggregation (KEYSTROKE_MODE=aggregate).
+
+Instead of one events row per keystroke, each session's timing is folded
+into one keystroke_summaries row per minute: the keystroke count, the
+inter-key intervals ending in that minute as a count, sum, sum of squares
+and a fixed-bucket histogram, and the same sums for the gaps between
+consecutive events of any type (the model's response time feature). Every
+field is a sum, min or max, so a minute flushed twice (or events arriving
+late) merges with a plain upsert, and the variance over any set of minutes
+follows from the summed fields.
+"""
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, List, Tuple
+
+from aggregates import minute_of
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the inter-key interval buckets; the last bucket is open-ended
+INTERVAL_BUCKETS_MS = (50, 100, 150, 200, 300, 500, 1000)
+HISTOGRAM_COLUMNS = tuple(f"hist_{i}" for i in range(len(INTERVAL_BUCKETS_MS) + 1))
+
+# Column order of a summary row; timestamps are of any event in the minute
+SUMMARY_COLUMNS = (
+    "session_id", "minute", "count", "first_timestamp", "last_timestamp",
+    "interval_count", "interval_sum", "interval_sumsq", "gap_count", "gap_sum", "gap_sumsq"
+) + HISTOGRAM_COLUMNS
+# Columns merged by addition (the rest are the key and min/max timestamps)
+SUMMED_COLUMNS = SUMMARY_COLUMNS[5:]
+_HISTOGRAM = SUMMARY_COLUMNS.index(HISTOGRAM_COLUMNS[0])
+
+
+def bucket_of(interval_ms: float) -> int:
+    for i, bound in enumerate(INTERVAL_BUCKETS_MS):
+        if interval_ms < bound:
+            return i
+    return len(INTERVAL_BUCKETS_MS)
+
+
+def interval_variance(n: int, total: float, sumsq: float) -> float:
+    """Population variance of n intervals from their sum and sum of squares"""
+    if n < 2:
+        return 0.0
+    return max(sumsq - total * total / n, 0.0) / n
+
+
+def summary_record(row: tuple) -> dict:
+    """JSON form of a summary row"""
+    n, total, sumsq = row[5], row[6], row[7]
+    return {
+        "minute": row[1],
+        "count": row[2],
+        "first_timestamp": row[3],
+        "last_timestamp": row[4],
+        "intervals": n,
+        "interval_mean_ms": round(total / n, 1) if n else None,
+        "interval_variance": round(interval_variance(n, total, sumsq), 1),
+        "histogram": dict(zip(histogram_labels(), row[_HISTOGRAM:])),
+        "gaps": row[8],
+        "gap_variance": round(interval_variance(row[8], row[9], row[10]), 1)
+    }
+
+
+def histogram_labels() -> List[str]:
+    labels, low = [], 0
+    for bound in INTERVAL_BUCKETS_MS:
+        labels.append(f"{low}-{bound}ms")
+        low = bound
+    labels.append(f"{low}ms+")
+    return labels
+
+
+class KeystrokeAggregator:
+    """Pending per-session, per-minute summaries, drained on each flush.
+
+    Every admitted row goes through add(): keystrokes are counted and
+    dropped, other rows only contribute their gap and are stored as usual.
+    The session's previous keystroke and event are remembered across
+    flushes (for up to max_sessions sessions), so intervals spanning two
+    minutes or two flushes aren't lost.
+    """
+
+    def __init__(self, max_sessions: int = 10000):
+        self.max_sessions = max_sessions
+        # (session_id, minute) -> summary row as a list, in SUMMARY_COLUMNS order
+        self._pending: Dict[Tuple[str, int], list] = {}
+        # session_id -> [latest keystroke timestamp, latest event timestamp]
+        self._last: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Keystrokes waiting to be flushed"""
+        with self._lock:
+            return sum(summary[2] for summary in self._pending.values())
+
+    def add(self, rows: Iterable[tuple]):
+        """Fold events table rows into the pending summaries"""
+        with self._lock:
+            self._fold(rows, self._pending, self._session)
+
+    def summarize(self, rows: Iterable[tuple]) -> Tuple[List[tuple], Dict[str, list]]:
+        """Summaries of rows alone, leaving pending ones and session state untouched.
+
+        Also returns the sessions' state after the rows; pass it to advance()
+        once the summaries are stored, so a failed write can be retried as is.
+        """
+        pending: Dict[Tuple[str, int], list] = {}
+        sessions: Dict[str, list] = {}
+
+        def session(session_id: str) -> list:
+            last = sessions.get(session_id)
+            if last is None:
+                last = sessions[session_id] = list(self._last.get(session_id) or (None, None))
+            return last
+
+        with self._lock:
+            self._fold(rows, pending, session)
+        return [tuple(summary) for summary in pending.values()], sessions
+
+    def advance(self, sessions: Dict[str, list]):
+        """Adopt the session state returned by summarize()"""
+        with self._lock:
+            for session_id, last in sessions.items():
+                self._session(session_id)[:] = last
+
+    def _session(self, session_id: str) -> list:
+        last = self._last.get(session_id)
+        if last is None:
+            last = self._last[session_id] = [None, None]
+            if len(self._last) > self.max_sessions:
+                self._last.popitem(last=False)
+        else:
+            self._last.move_to_end(session_id)
+        return last
+
+    @staticmethod
+    def _fold(rows: Iterable[tuple], pending: Dict[Tuple[str, int], list], session: Callable[[str], list]):
+        for row in rows:
+            event_type, timestamp, session_id = row[0], row[2], row[3]
+            last = session(session_id)
+
+            # Like SessionFeatures, out-of-order events count but add no interval
+            gap = interval = None
+            if last[1] is None or timestamp >= last[1]:
+                if last[1] is not None:
+                    gap = timestamp - last[1]
+                last[1] = timestamp
+            if event_type == "KEYSTROKE" and (last[0] is None or timestamp >= last[0]):
+                if last[0] is not None:
+                    interval = timestamp - last[0]
+                last[0] = timestamp
+            if event_type != "KEYSTROKE" and gap is None:
+                continue
+
+            key = (session_id, minute_of(timestamp))
+            summary = pending.get(key)
+            if summary is None:
+                summary = pending[key] = [session_id, key[1], 0, timestamp, timestamp] + [0 for _ in SUMMED_COLUMNS]
+            summary[3] = min(summary[3], timestamp)
+            summary[4] = max(summary[4], timestamp)
+            if event_type == "KEYSTROKE":
+                summary[2] += 1
+            if interval is not None:
+                summary[5] += 1
+                summary[6] += interval
+                summary[7] += interval * interval
+                summary[_HISTOGRAM + bucket_of(interval)] += 1
+            if gap is not None:
+                summary[8] += 1
+                summary[9] += gap
+                summary[10] += gap * gap
+
+    def drain(self) -> List[tuple]:
+        """Take the pending summary rows"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return [tuple(summary) for summary in pending.values()]
+
+    def restore(self, rows: List[tuple]):
+        """Put drained rows back after a failed flush, merged with anything added since"""
+        with self._lock:
+            for row in rows:
+                key = (row[0], row[1])
+                summary = self._pending.get(key)
+                if summary is None:
+                    self._pending[key] = list(row)
+                    continue
+                summary[2] += row[2]
+                summary[3] = min(summary[3], row[3])
+                summary[4] = max(summary[4], row[4])
+                for i in range(5, len(row)):
+                    summary[i] += row[i]
+
+    async def flush(self, write: Callable[[List[tuple]], Awaitable[None]]) -> int:
+        """Write the pending summaries with `write`; returns the keystrokes flushed"""
+        rows = self.drain()
+        if not rows:
+            return 0
+        try:
+            await write(rows)
+        except BaseException:
+            self.restore(rows)
+            raise
+        return sum(row[2] for row in rows)
+
+    async def run(self, write: Callable[[List[tuple]], Awaitable[None]], interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush(write)
+            except Exception:
+                logger.exception("Keystroke summary flush failed, will retry")
+
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from aggregates import minute_of
+from db import Database, compacted_before
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionJob:
+    """Compacts raw events (and keystroke summaries) older than the retention age into event_rollups.
+
+    Rollups are written alongside every insert, so compaction only has to
+    advance the watermark (after which readers count those minutes from
+    event_rollups) and then delete the raw rows below it in small
+    transactions, pausing between batches so ingestion keeps the writer.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        retention_hours: float,
+        batch_size: int = 5000,
+        batch_pause: float = 0.05,
+        vacuum_pages: int = 1000
+    ):
+        self.db = db
+        self.retention_hours = retention_hours
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.vacuum_pages = vacuum_pages
+        self.last_run = None
+
+    def run_once(self) -> dict:
+        start = time.perf_counter()
+        watermark = minute_of((time.time() - self.retention_hours * 3600) * 1000)
+        with self.db.write() as conn:
+            if watermark > compacted_before(conn):
+                conn.execute(
+                    "INSERT INTO maintenance_state (key, value) VALUES ('compacted_before_minute', ?) "
+                    "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                    (watermark,)
+                )
+            watermark = compacted_before(conn)
+
+        deleted = self._purge(watermark * 60000)
+        with self.db.write() as conn:
+            # Keystroke summaries are per minute and few, so one statement does
+            deleted_summaries = conn.execute(
+                "DELETE FROM keystroke_summaries WHERE minute < ?", (watermark,)
+            ).rowcount
+        with self.db.write() as conn:
+            conn.execute(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)})")
+
+        self.last_run = {
+            "compacted_before": datetime.fromtimestamp(watermark * 60).isoformat(),
+            "deleted_events": deleted,
+            "deleted_keystroke_summaries": deleted_summaries,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+            "finished_at": datetime.now().isoformat()
+        }
+        return self.last_run
+
+    def _purge(self, cutoff: int) -> int:
+        """Delete raw events older than cutoff (epoch ms) in id-ordered batches"""
+        deleted = 0
+        with self.db.read() as conn:
+            next_id = conn.execute("SELECT MIN(id) FROM events").fetchone()[0]
+        while next_id is not None:
+            end = next_id + self.batch_size
+            with self.db.write() as conn:
+                deleted += conn.execute(
+                    "DELETE FROM events WHERE id >= ? AND id < ? AND timestamp < ?",
+                    (next_id, end, cutoff)
+                ).rowcount
+                remaining = conn.execute(
+                    "SELECT COUNT(*) FROM events WHERE id >= ? AND id < ?", (next_id, end)
+                ).fetchone()[0]
+            if remaining:
+                # Reached events newer than the cutoff; anything older that
+                # arrived late is already ignored by readers below the watermark
+                break
+            with self.db.read() as conn:
+                next_id = conn.execute("SELECT MIN(id) FROM events WHERE id >= ?", (end,)).fetchone()[0]
+            time.sleep(self.batch_pause)
+        return deleted
+
+    async def run_forever(self, interval: float):
+        await run_periodically(lambda: asyncio.to_thread(self.run_once), interval)
+
+
+async def run_periodically(compact: Callable[[], Awaitable[dict]], interval: float):
+    """Run a retention job every interval seconds, logging its result (or failure)"""
+    while True:
+        try:
+            result = await compact()
+            logger.info("Retention job: %s", result)
+        except Exception:
+            logger.exception("Retention job failed")
+        await asyncio.sleep(interval)
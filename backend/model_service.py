@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import os
+import warnings
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.environ.get(
+    "MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "ml_models", "behavior_model.npz")
+)
+
+
+class BehaviorModel:
+    """Loads the trained classifier once, off the import path, on first use.
+
+    The flat .npz export (see ml/export_model.py) is memory-mapped and scored
+    with NumPy alone; a .pkl path still loads the scikit-learn object.
+    """
+
+    def __init__(self, path: str = MODEL_PATH):
+        self.path = path
+        self.model = None
+        self.error: Optional[str] = None
+        self._loading: Optional[asyncio.Task] = None
+
+    @property
+    def available(self) -> bool:
+        return self.model is not None
+
+    def _load(self):
+        try:
+            if self.path.endswith(".npz"):
+                from forest import FlatForest
+                self.model = FlatForest.load(self.path)
+            else:
+                import joblib
+                self.model = joblib.load(self.path)
+            logger.info("Loaded behavior model from %s", self.path)
+        except Exception as e:
+            # numpy (and scikit-learn for .pkl) are optional; scoring falls back to the static weights
+            self.error = str(e)
+            logger.warning("Behavior model unavailable: %s", e)
+
+    async def ensure_loaded(self) -> bool:
+        if self.model is None and self.error is None:
+            if self._loading is None:
+                self._loading = asyncio.ensure_future(asyncio.to_thread(self._load))
+            await asyncio.shield(self._loading)
+        return self.available
+
+    def predict_proba(self, rows):
+        """Probability of the AI-assisted class for each feature row"""
+        import numpy as np
+        if not hasattr(self.model, "classes_"):
+            return self.model.predict_proba(rows)
+        with warnings.catch_warnings():
+            # The forest was fitted on a DataFrame; plain arrays are fine
+            warnings.simplefilter("ignore", UserWarning)
+            return self.model.predict_proba(np.asarray(rows, dtype=np.float64))[:, 1]
+
+
+class PredictionBatcher:
+    """Collects concurrent scoring requests into a single predict_proba call"""
+
+    def __init__(self, model: BehaviorModel, max_batch: int = 1024, max_delay: float = 0.005):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending: List[tuple] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    async def score(self, features: List[float]) -> Optional[float]:
+        """AI-assisted probability for one feature vector, or None without a model"""
+        if not await self.model.ensure_loaded():
+            return None
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((features, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._predict(batch))
+
+    async def _predict(self, batch):
+        try:
+            probabilities = await asyncio.to_thread(
+                self.model.predict_proba, [features for features, _ in batch]
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), probability in zip(batch, probabilities):
+            if not future.done():
+                future.set_result(float(probability))
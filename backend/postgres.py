@@ -0,0 +1,437 @@
+"""Postgres/TimescaleDB event store (DATABASE_URL=postgresql://...).
+
+Same tables as the SQLite database. Batches are written with COPY, and
+when the timescaledb extension is installed `events` becomes a hypertable
+partitioned on timestamp (one-day chunks of epoch milliseconds).
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+try:
+    import asyncpg
+except ImportError:  # optional; only needed with a postgres DATABASE_URL
+    asyncpg = None
+
+from aggregates import minute_of
+from db import rollup_rows, summary_rollups
+from keystrokes import HISTOGRAM_COLUMNS, SUMMARY_COLUMNS, SUMMED_COLUMNS
+from storage import EventReader, EventStore
+
+POSTGRES_POOL_MIN_SIZE = int(os.environ.get("POSTGRES_POOL_MIN_SIZE", 2))
+POSTGRES_POOL_MAX_SIZE = int(os.environ.get("POSTGRES_POOL_MAX_SIZE", 10))
+# Smaller batches use a plain INSERT; COPY has a fixed setup cost per call
+POSTGRES_COPY_MIN_ROWS = int(os.environ.get("POSTGRES_COPY_MIN_ROWS", 50))
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS events (
+        id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+        event_type TEXT NOT NULL,
+        data BYTEA,
+        "timestamp" BIGINT NOT NULL,  -- epoch milliseconds
+        session_id TEXT DEFAULT 'default',
+        paste_length BIGINT,
+        tab_id BIGINT,
+        -- TimescaleDB needs the partitioning column in every unique index
+        PRIMARY KEY (id, "timestamp")
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_events_session_time ON events (session_id, "timestamp")',
+    'CREATE INDEX IF NOT EXISTS idx_events_session_type_time ON events (session_id, event_type, "timestamp")',
+    "CREATE INDEX IF NOT EXISTS idx_events_session_id ON events (session_id, id)",
+    '''
+    CREATE TABLE IF NOT EXISTS event_rollups (
+        session_id TEXT NOT NULL,
+        minute BIGINT NOT NULL,
+        event_type TEXT NOT NULL,
+        count BIGINT NOT NULL,
+        PRIMARY KEY (session_id, minute, event_type)
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_event_rollups_minute ON event_rollups (minute)",
+    f'''
+    CREATE TABLE IF NOT EXISTS keystroke_summaries (
+        session_id TEXT NOT NULL,
+        minute BIGINT NOT NULL,
+        count BIGINT NOT NULL,
+        first_timestamp BIGINT NOT NULL,
+        last_timestamp BIGINT NOT NULL,
+        interval_count BIGINT NOT NULL,
+        interval_sum DOUBLE PRECISION NOT NULL,
+        interval_sumsq DOUBLE PRECISION NOT NULL,
+        gap_count BIGINT NOT NULL,
+        gap_sum DOUBLE PRECISION NOT NULL,
+        gap_sumsq DOUBLE PRECISION NOT NULL,
+        {"".join(f"{column} BIGINT NOT NULL DEFAULT 0, " for column in HISTOGRAM_COLUMNS)}
+        PRIMARY KEY (session_id, minute)
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_keystroke_summaries_minute ON keystroke_summaries (minute)",
+    "CREATE TABLE IF NOT EXISTS maintenance_state (key TEXT PRIMARY KEY, value BIGINT)",
+]
+
+EVENT_COLUMNS = ("id", "event_type", "data", "timestamp", "session_id", "paste_length", "tab_id")
+
+UPSERT_ROLLUPS_SQL = (
+    "INSERT INTO event_rollups (session_id, minute, event_type, count) VALUES ($1, $2, $3, $4) "
+    "ON CONFLICT (session_id, minute, event_type) DO UPDATE SET count = event_rollups.count + EXCLUDED.count"
+)
+
+UPSERT_KEYSTROKE_SUMMARIES_SQL = (
+    f"INSERT INTO keystroke_summaries ({', '.join(SUMMARY_COLUMNS)}) "
+    f"VALUES ({', '.join(f'${i}' for i in range(1, len(SUMMARY_COLUMNS) + 1))}) "
+    "ON CONFLICT (session_id, minute) DO UPDATE SET "
+    "first_timestamp = LEAST(keystroke_summaries.first_timestamp, EXCLUDED.first_timestamp), "
+    "last_timestamp = GREATEST(keystroke_summaries.last_timestamp, EXCLUDED.last_timestamp), "
+    + ", ".join(
+        f"{column} = keystroke_summaries.{column} + EXCLUDED.{column}" for column in ("count",) + SUMMED_COLUMNS
+    )
+)
+
+
+def _stored(data):
+    # One BYTEA column holds both codecs: JSON text always starts with "{",
+    # which no msgpack map does, so it can be told apart on the way out
+    return data.encode() if isinstance(data, str) else data
+
+
+def _loaded(data):
+    return data.decode() if data is not None and data[:1] == b"{" else data
+
+
+def _select_events_sql(
+    session_id=None, event_types=None, since=None, until=None, after_id=None, limit=None
+):
+    clauses, params = [], []
+    for clause, value in (
+        ("session_id = ${}", session_id),
+        ("event_type = ANY(${})", event_types or None),
+        ('"timestamp" >= ${}', since),
+        ('"timestamp" < ${}', until),
+        ("id > ${}", after_id),
+    ):
+        if value is not None:
+            params.append(value)
+            clauses.append(clause.format(len(params)))
+    sql = 'SELECT id, session_id, event_type, data, "timestamp", paste_length, tab_id FROM events'
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY id"
+    if limit is not None:
+        params.append(limit)
+        sql += f" LIMIT ${len(params)}"
+    return sql, params
+
+
+def _event_row(record) -> tuple:
+    return (record[0], record[1], record[2], _loaded(record[3]), record[4], record[5], record[6])
+
+
+def _stored_event(record) -> tuple:
+    # (id, event_type, data, timestamp, paste_length, tab_id)
+    return (record[0], record[1], _loaded(record[2]), record[3], record[4], record[5])
+
+
+class _PostgresQueries(EventReader):
+    """EventReader over asyncpg; subclasses decide which connection runs each query"""
+
+    def _connection(self):
+        raise NotImplementedError
+
+    async def _fetch(self, sql: str, *args) -> list:
+        async with self._connection() as conn:
+            return await conn.fetch(sql, *args)
+
+    async def max_event_id(self) -> int:
+        return (await self._fetch("SELECT COALESCE(MAX(id), 0) FROM events"))[0][0]
+
+    async def type_counts(self, session_id: Optional[str] = None) -> Dict[str, int]:
+        async with self._connection() as conn:
+            watermark = await conn.fetchval(
+                "SELECT value FROM maintenance_state WHERE key = 'compacted_before_minute'"
+            ) or 0
+            since = watermark * 60000
+            if session_id is None:
+                raw = await conn.fetch(
+                    'SELECT event_type, COUNT(*) FROM events WHERE "timestamp" >= $1 GROUP BY event_type', since
+                )
+                rolled = await conn.fetch(
+                    "SELECT event_type, SUM(count)::BIGINT FROM event_rollups WHERE minute < $1 GROUP BY event_type",
+                    watermark
+                )
+            else:
+                raw = await conn.fetch(
+                    'SELECT event_type, COUNT(*) FROM events WHERE session_id = $1 AND "timestamp" >= $2 '
+                    "GROUP BY event_type",
+                    session_id, since
+                )
+                rolled = await conn.fetch(
+                    "SELECT event_type, SUM(count)::BIGINT FROM event_rollups WHERE session_id = $1 AND minute < $2 "
+                    "GROUP BY event_type",
+                    session_id, watermark
+                )
+            # Aggregated keystrokes above the watermark live in keystroke_summaries, not events
+            if session_id is None:
+                summarized = await conn.fetchval(
+                    "SELECT SUM(count)::BIGINT FROM keystroke_summaries WHERE minute >= $1", watermark
+                )
+            else:
+                summarized = await conn.fetchval(
+                    "SELECT SUM(count)::BIGINT FROM keystroke_summaries WHERE session_id = $1 AND minute >= $2",
+                    session_id, watermark
+                )
+        counts = {event_type: count for event_type, count in raw}
+        for event_type, count in rolled:
+            counts[event_type] = counts.get(event_type, 0) + count
+        if summarized:
+            counts["KEYSTROKE"] = counts.get("KEYSTROKE", 0) + summarized
+        return counts
+
+    async def rollup_totals(self) -> Dict[str, int]:
+        rows = await self._fetch("SELECT event_type, SUM(count)::BIGINT FROM event_rollups GROUP BY event_type")
+        return {event_type: count for event_type, count in rows}
+
+    async def rollups(self, since_minute: int, session_id: Optional[str] = None) -> list:
+        if session_id is None:
+            rows = await self._fetch(
+                "SELECT session_id, minute, event_type, count FROM event_rollups WHERE minute > $1 ORDER BY minute",
+                since_minute
+            )
+        else:
+            rows = await self._fetch(
+                "SELECT session_id, minute, event_type, count FROM event_rollups "
+                "WHERE session_id = $1 AND minute > $2 ORDER BY minute",
+                session_id, since_minute
+            )
+        return [tuple(row) for row in rows]
+
+    async def latest_events(self, limit: int) -> list:
+        rows = await self._fetch(
+            'SELECT id, event_type, data, "timestamp", paste_length, tab_id FROM events ORDER BY id DESC LIMIT $1',
+            limit
+        )
+        return [_stored_event(row) for row in rows]
+
+    async def active_sessions(self, since: int) -> list:
+        rows = await self._fetch(
+            "SELECT session_id, MAX(last) FROM ("
+            'SELECT session_id, MAX("timestamp") AS last FROM events GROUP BY session_id '
+            "UNION ALL SELECT session_id, MAX(last_timestamp) FROM keystroke_summaries GROUP BY session_id"
+            ") AS sessions GROUP BY session_id HAVING MAX(last) >= $1",
+            since
+        )
+        return [tuple(row) for row in rows]
+
+    async def session_timeline(self, session_id: str) -> list:
+        rows = await self._fetch(
+            'SELECT event_type, "timestamp" FROM events WHERE session_id = $1 ORDER BY "timestamp"', session_id
+        )
+        return [tuple(row) for row in rows]
+
+    async def session_events(
+        self, session_id: str, before: Optional[int] = None, limit: int = 50, before_id: Optional[int] = None
+    ) -> list:
+        sql = 'SELECT id, event_type, data, "timestamp", paste_length, tab_id FROM events WHERE session_id = $1'
+        params = [session_id]
+        if before is not None and before_id is not None:
+            sql += ' AND ("timestamp" < $2 OR ("timestamp" = $2 AND id < $3))'
+            params += [before, before_id]
+        elif before is not None:
+            sql += ' AND "timestamp" < $2'
+            params.append(before)
+        rows = await self._fetch(sql + f' ORDER BY "timestamp" DESC, id DESC LIMIT ${len(params) + 1}', *params, limit)
+        return [_stored_event(row) for row in rows]
+
+    async def keystroke_summaries(self, session_id: Optional[str] = None, since_minute: Optional[int] = None) -> list:
+        clauses, params = [], []
+        for clause, value in (("session_id = ${}", session_id), ("minute >= ${}", since_minute)):
+            if value is not None:
+                params.append(value)
+                clauses.append(clause.format(len(params)))
+        sql = f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM keystroke_summaries"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        return [tuple(row) for row in await self._fetch(sql + " ORDER BY minute", *params)]
+
+    async def select_events(self, **filters) -> list:
+        sql, params = _select_events_sql(**filters)
+        return [_event_row(row) for row in await self._fetch(sql, *params)]
+
+
+class _PostgresSnapshot(_PostgresQueries):
+    def __init__(self, conn):
+        self.conn = conn
+
+    @asynccontextmanager
+    async def _connection(self):
+        yield self.conn
+
+
+class PostgresEventStore(_PostgresQueries, EventStore):
+    """Events in Postgres through an asyncpg connection pool"""
+
+    def __init__(
+        self,
+        url: str,
+        observe: Optional[Callable[[str, float], None]] = None,
+        retention_hours: float = 0,
+        maintenance_batch_size: int = 5000,
+        min_size: int = POSTGRES_POOL_MIN_SIZE,
+        max_size: int = POSTGRES_POOL_MAX_SIZE,
+        copy_min_rows: int = POSTGRES_COPY_MIN_ROWS
+    ):
+        if asyncpg is None:
+            raise ValueError("A postgres DATABASE_URL needs the asyncpg package installed")
+        self.url = url
+        self.observe = observe
+        self.retention_hours = retention_hours
+        self.maintenance_batch_size = maintenance_batch_size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.copy_min_rows = copy_min_rows
+        self.pool = None
+
+    async def open(self):
+        self.pool = await asyncpg.create_pool(self.url, min_size=self.min_size, max_size=self.max_size)
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # Serialize schema setup between processes starting together
+                await conn.execute("SELECT pg_advisory_xact_lock(hashtext('events_schema'))")
+                for statement in SCHEMA:
+                    await conn.execute(statement)
+                if await conn.fetchval("SELECT 1 FROM pg_extension WHERE extname = 'timescaledb'"):
+                    await conn.execute(
+                        "SELECT create_hypertable('events', 'timestamp', chunk_time_interval => 86400000, "
+                        "if_not_exists => TRUE, migrate_data => TRUE)"
+                    )
+
+    async def close(self):
+        await self.pool.close()
+
+    @asynccontextmanager
+    async def _connection(self):
+        start = time.perf_counter()
+        async with self.pool.acquire() as conn:
+            if self.observe is not None:
+                self.observe("read_pool_wait", time.perf_counter() - start)
+            yield conn
+
+    @asynccontextmanager
+    async def snapshot(self):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                yield _PostgresSnapshot(conn)
+
+    async def insert(self, rows: List[tuple], log_offset: Optional[int] = None, summaries: List[tuple] = ()) -> List[int]:
+        # Sorted so concurrent writers take the rollup row locks in the same order
+        increments = sorted(rollup_rows(rows))
+        start = time.perf_counter()
+        async with self.pool.acquire() as conn:
+            acquired = time.perf_counter()
+            async with conn.transaction():
+                ids = [
+                    row[0] for row in await conn.fetch(
+                        "SELECT nextval(pg_get_serial_sequence('events', 'id')) FROM generate_series(1, $1)", len(rows)
+                    )
+                ]
+                records = [
+                    (event_id, row[0], _stored(row[1]), row[2], row[3], row[4], row[5])
+                    for event_id, row in zip(ids, rows)
+                ]
+                if len(records) >= self.copy_min_rows:
+                    await conn.copy_records_to_table("events", records=records, columns=EVENT_COLUMNS)
+                else:
+                    await conn.executemany(
+                        'INSERT INTO events (id, event_type, data, "timestamp", session_id, paste_length, tab_id) '
+                        "VALUES ($1, $2, $3, $4, $5, $6, $7)",
+                        records
+                    )
+                await conn.executemany(UPSERT_ROLLUPS_SQL, increments)
+                if summaries:
+                    summaries = sorted(summaries)
+                    await conn.executemany(UPSERT_KEYSTROKE_SUMMARIES_SQL, summaries)
+                    await conn.executemany(UPSERT_ROLLUPS_SQL, summary_rollups(summaries))
+                if log_offset is not None:
+                    await conn.execute(
+                        "INSERT INTO maintenance_state (key, value) VALUES ('event_log_offset', $1) "
+                        "ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value",
+                        log_offset
+                    )
+                executed = time.perf_counter()
+            if self.observe is not None:
+                self.observe("write_lock_wait", acquired - start)
+                self.observe("execute", executed - acquired)
+                self.observe("commit", time.perf_counter() - executed)
+        return ids
+
+    async def insert_keystroke_summaries(self, summaries: List[tuple]):
+        # Sorted, like insert(), so concurrent writers lock rows in the same order
+        summaries = sorted(summaries)
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany(UPSERT_KEYSTROKE_SUMMARIES_SQL, summaries)
+                await conn.executemany(UPSERT_ROLLUPS_SQL, summary_rollups(summaries))
+
+    async def log_checkpoint(self) -> int:
+        return await self.pool.fetchval("SELECT value FROM maintenance_state WHERE key = 'event_log_offset'") or 0
+
+    async def replace_rollups(self, increments: List[tuple]):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("DELETE FROM event_rollups")
+                await conn.copy_records_to_table(
+                    "event_rollups", records=increments, columns=("session_id", "minute", "event_type", "count")
+                )
+
+    async def export_events(self, chunk_size: int = 1000, **filters) -> AsyncIterator[list]:
+        sql, params = _select_events_sql(**filters)
+        async with self.pool.acquire() as conn:
+            # Server-side cursor; asyncpg requires one to run inside a transaction
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                cursor = await conn.cursor(sql, *params)
+                while True:
+                    chunk = await cursor.fetch(chunk_size)
+                    if not chunk:
+                        break
+                    yield [_event_row(row) for row in chunk]
+
+    async def compact(self) -> dict:
+        """Advance the compaction watermark, then delete raw events (in batches) and keystroke summaries below it"""
+        start = time.perf_counter()
+        watermark = minute_of((time.time() - self.retention_hours * 3600) * 1000)
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "INSERT INTO maintenance_state (key, value) VALUES ('compacted_before_minute', $1) "
+                    "ON CONFLICT (key) DO UPDATE SET value = GREATEST(maintenance_state.value, EXCLUDED.value)",
+                    watermark
+                )
+                watermark = await conn.fetchval(
+                    "SELECT value FROM maintenance_state WHERE key = 'compacted_before_minute'"
+                )
+            cutoff = watermark * 60000
+            deleted = 0
+            while True:
+                status = await conn.execute(
+                    'DELETE FROM events WHERE id IN (SELECT id FROM events WHERE "timestamp" < $1 LIMIT $2)',
+                    cutoff, self.maintenance_batch_size
+                )
+                count = int(status.split()[-1])
+                deleted += count
+                if count < self.maintenance_batch_size:
+                    break
+                await asyncio.sleep(0.05)
+            status = await conn.execute("DELETE FROM keystroke_summaries WHERE minute < $1", watermark)
+            deleted_summaries = int(status.split()[-1])
+
+        return {
+            "compacted_before": datetime.fromtimestamp(watermark * 60).isoformat(),
+            "deleted_events": deleted,
+            "deleted_keystroke_summaries": deleted_summaries,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+            "finished_at": datetime.now().isoformat()
+        }
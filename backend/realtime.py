@@ -0,0 +1,92 @@
+import asyncio
+import time
+from typing import Callable, Dict, Optional, Set
+
+
+class Subscriber:
+    """One connected dashboard; holds only the latest pending update"""
+
+    def __init__(self):
+        self._updates: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self.last_counts: Optional[Dict[str, int]] = None
+
+    def offer(self, message: dict):
+        # Coalesce: fold an unread update into the new one so a slow consumer
+        # gets a single message that still carries every changed count
+        if self._updates.full():
+            pending = self._updates.get_nowait()
+            message = {
+                **message,
+                "type": pending["type"] if pending["type"] == "snapshot" else message["type"],
+                "event_counts": {**pending["event_counts"], **message["event_counts"]}
+            }
+        self._updates.put_nowait(message)
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[dict]:
+        try:
+            return await asyncio.wait_for(self._updates.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class RiskBroadcaster:
+    """Pushes risk summary deltas to subscribers, at most max_rate times per second"""
+
+    def __init__(self, build_summary: Callable[[], dict], max_rate: float = 4):
+        self.build_summary = build_summary
+        self.min_interval = 1 / max_rate
+        self.subscribers: Set[Subscriber] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._scheduled = False
+        self._last_push = 0.0
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+
+    def stop(self):
+        self._loop = None
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber()
+        self.subscribers.add(subscriber)
+        subscriber.offer(self._message_for(subscriber, self.build_summary()))
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def notify(self):
+        """Signal that new events were stored; safe to call from any thread"""
+        loop = self._loop
+        if loop is not None and self.subscribers:
+            loop.call_soon_threadsafe(self._schedule)
+
+    def _schedule(self):
+        if self._scheduled:
+            return
+        self._scheduled = True
+        delay = max(0.0, self._last_push + self.min_interval - time.monotonic())
+        self._loop.call_later(delay, self._push)
+
+    def _push(self):
+        self._scheduled = False
+        self._last_push = time.monotonic()
+        summary = self.build_summary()
+        for subscriber in self.subscribers:
+            subscriber.offer(self._message_for(subscriber, summary))
+
+    @staticmethod
+    def _message_for(subscriber: Subscriber, summary: dict) -> dict:
+        counts = summary["event_counts"]
+        previous = subscriber.last_counts
+        subscriber.last_counts = counts
+        if previous is None:
+            return {"type": "snapshot", **summary}
+        return {
+            "type": "delta",
+            **summary,
+            "event_counts": {
+                event_type: count for event_type, count in counts.items()
+                if previous.get(event_type) != count
+            }
+        }
@@ -0,0 +1,126 @@
+"""Rebuild state from the event log (INGEST_MODE=log, see eventlog.py).
+
+    # A new database from every logged event (then point DATABASE_PATH at it)
+    python replay.py db --output rebuilt.db
+    python replay.py db --database-url postgresql://...   # an empty Postgres database
+
+    # Recompute event_rollups from the log: compare, then --apply
+    python replay.py aggregates
+    python replay.py aggregates --apply
+
+Stop the server first: it keeps in-memory aggregates that are only rebuilt
+at startup. Risk weights and thresholds are applied when summaries are
+read, so changing them (risk_config.json) needs no replay.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from typing import Dict
+
+from db import rollup_rows
+from eventlog import EVENT_LOG_DIR, SegmentLog
+from keystrokes import KeystrokeAggregator
+from postgres import PostgresEventStore
+from storage import EventStore, SQLiteEventStore
+
+
+def open_log(directory: str) -> SegmentLog:
+    if not os.path.isdir(directory):
+        raise SystemExit(f"No event log at {directory}")
+    log = SegmentLog(directory)
+    log.open()
+    if log.start > 0:
+        print(f"Warning: the log starts at offset {log.start}; older segments were deleted", file=sys.stderr)
+    return log
+
+
+def create_store(database_url: str, database_path: str) -> EventStore:
+    if database_url.startswith(("postgres://", "postgresql://")):
+        return PostgresEventStore(database_url)
+    return SQLiteEventStore(database_path)
+
+
+async def replay_db(args):
+    """Materialize every logged event into an empty database, checkpointing as the consumer does"""
+    if not args.database_url:
+        if not args.output:
+            raise SystemExit("Pass --output (a new SQLite file) or --database-url")
+        if os.path.exists(args.output):
+            raise SystemExit(f"{args.output} already exists")
+    log = open_log(args.log_dir)
+    store = create_store(args.database_url, args.output)
+    await store.open()
+    try:
+        if await store.max_event_id():
+            raise SystemExit("The target database already has events")
+        aggregator = KeystrokeAggregator() if args.keystroke_mode == "aggregate" else None
+        total = 0
+        for rows, offset in log.scan(batch=args.batch_size):
+            total += len(rows)
+            if aggregator is None:
+                await store.insert(rows, offset)
+                continue
+            # As the live consumer does: summaries commit with the rows and the checkpoint
+            summaries, sessions = aggregator.summarize(rows)
+            await store.insert([row for row in rows if row[0] != "KEYSTROKE"], offset, summaries)
+            aggregator.advance(sessions)
+        print(f"Replayed {total} events (log offsets {log.start}-{log.end})")
+    finally:
+        await store.close()
+
+
+async def replay_aggregates(args):
+    """Recompute event_rollups from the log, replacing the stored ones with --apply"""
+    log = open_log(args.log_dir)
+    increments: Dict[tuple, int] = {}
+    for rows, _ in log.scan(batch=args.batch_size):
+        for session_id, minute, event_type, count in rollup_rows(rows):
+            key = (session_id, minute, event_type)
+            increments[key] = increments.get(key, 0) + count
+    from_log: Dict[str, int] = {}
+    for (_, _, event_type), count in increments.items():
+        from_log[event_type] = from_log.get(event_type, 0) + count
+
+    store = create_store(args.database_url, args.database_path)
+    await store.open()
+    try:
+        stored = await store.rollup_totals()
+        print(f"{'type':<16}{'database':>12}{'log':>12}")
+        for event_type in sorted(set(stored) | set(from_log)):
+            print(f"{event_type:<16}{stored.get(event_type, 0):>12}{from_log.get(event_type, 0):>12}")
+        if not args.apply:
+            print("Dry run; pass --apply to replace event_rollups with the log's")
+            return
+        # Events stored before log mode was enabled (or from deleted segments) would be dropped
+        missing = log.start > 0 or any(count > from_log.get(event_type, 0) for event_type, count in stored.items())
+        if missing and not args.force:
+            raise SystemExit("The database counts events the log doesn't have; pass --force to replace anyway")
+        await store.replace_rollups([key + (count,) for key, count in increments.items()])
+        print(f"Replaced event_rollups with {len(increments)} rows")
+    finally:
+        await store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the database or its aggregates from the event log")
+    parser.add_argument("--log-dir", default=EVENT_LOG_DIR)
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL", ""))
+    parser.add_argument("--batch-size", type=int, default=5000)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    db = commands.add_parser("db", help="materialize the whole log into a new database")
+    db.add_argument("--output", help="new SQLite file to create (unless --database-url is a postgres URL)")
+    db.add_argument("--keystroke-mode", default=os.environ.get("KEYSTROKE_MODE", "raw"), choices=("raw", "aggregate"))
+
+    aggregates = commands.add_parser("aggregates", help="recompute event_rollups from the log")
+    aggregates.add_argument("--database-path", default=os.environ.get("DATABASE_PATH", "interview_data.db"))
+    aggregates.add_argument("--apply", action="store_true", help="replace the stored rollups (default: compare only)")
+    aggregates.add_argument("--force", action="store_true", help="replace even if the log lacks stored events")
+
+    args = parser.parse_args()
+    asyncio.run(replay_db(args) if args.command == "db" else replay_aggregates(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Risk weights and thresholds from one JSON file (risk_config.json by default).
+
+The file is compiled into a RiskWeights: a list of weights indexed by
+interned ids of the configured event types, plus the summary thresholds.
+RiskConfig reloads it when the file changes, so new weights apply without a
+restart; summaries are recomputed from the in-memory counts, not the events
+table.
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "risk_config.json")
+
+
+class EventTypeIds:
+    """Small integer ids for the event type names configured in a risk config.
+
+    Only configured types get ids: client-supplied types are looked up
+    without being registered, so arbitrary types can't grow the table.
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self.names: List[str] = []
+        self._lock = threading.Lock()
+
+    def get(self, event_type: str) -> Optional[int]:
+        return self._ids.get(event_type)
+
+    def register(self, event_type: str) -> int:
+        type_id = self._ids.get(event_type)
+        if type_id is None:
+            with self._lock:
+                type_id = self._ids.get(event_type)
+                if type_id is None:
+                    type_id = self._ids[sys.intern(event_type)] = len(self.names)
+                    self.names.append(event_type)
+        return type_id
+
+
+event_type_ids = EventTypeIds()
+
+
+class RiskWeights:
+    """One loaded configuration, compiled for lookups by event type id"""
+
+    def __init__(self, config: dict, version: int = 1):
+        weights = config.get("weights") or {}
+        thresholds = config.get("thresholds") or {}
+        self.version = version
+        self.config = config
+        self.default_weight = float(config.get("default_weight", 0.2))
+        self.per_type_cap = float(config.get("per_type_cap", 1.0))
+        self.normalizer = float(config.get("normalizer", 0.5))
+        # Highest threshold first; a score above it gets that level
+        self.levels = sorted(((float(value), level) for level, value in thresholds.items()), reverse=True)
+        if self.normalizer <= 0:
+            raise ValueError("normalizer must be positive")
+        for event_type in weights:
+            event_type_ids.register(event_type)
+        self._table = [float(weights.get(name, self.default_weight)) for name in list(event_type_ids.names)]
+
+    def weight(self, event_type: str) -> float:
+        type_id = event_type_ids.get(event_type)
+        table = self._table
+        # Unknown types, and types configured only by a later config, get the default
+        if type_id is None or type_id >= len(table):
+            return self.default_weight
+        return table[type_id]
+
+    def level(self, score: float) -> str:
+        for threshold, level in self.levels:
+            if score > threshold:
+                return level
+        return "LOW"
+
+
+def load_weights(path: str, version: int = 1) -> RiskWeights:
+    with open(path) as f:
+        return RiskWeights(json.load(f), version)
+
+
+class RiskConfig:
+    """The current RiskWeights, reloaded when the file's mtime or size changes"""
+
+    def __init__(self, path: str = DEFAULT_CONFIG_PATH):
+        self.path = path
+        self._stat = self._file_stat()
+        self.current = load_weights(path)
+        self.loaded_at = time.time()
+
+    def _file_stat(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload_if_changed(self) -> bool:
+        """Load the file again if it changed; a broken file keeps the previous weights"""
+        try:
+            stat = self._file_stat()
+            if stat == self._stat:
+                return False
+            self._stat = stat
+            weights = load_weights(self.path, self.current.version + 1)
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            logger.error("Keeping risk config version %d, reload of %s failed: %s", self.current.version, self.path, e)
+            return False
+        self.current = weights
+        self.loaded_at = time.time()
+        logger.info("Loaded risk config version %d from %s", weights.version, self.path)
+        return True
+
+    async def watch(self, interval: float, on_change: Optional[Callable[[], None]] = None):
+        while True:
+            await asyncio.sleep(interval)
+            if self.reload_if_changed() and on_change is not None:
+                on_change()
@@ -0,0 +1,231 @@
+"""Per-session detection of event sequences such as "tab switch, then a large
+paste within 3 seconds".
+
+Rules are compiled into a dispatch table from event type to the rule steps
+it can advance. Each session keeps, per rule and step, the start and last
+timestamps of the most recent partial match, so an event costs a lookup
+plus one check per step that mentions its type, however long the session.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from aggregates import RollingWindows, minute_of
+
+# Used unless SEQUENCE_RULES_PATH points at a JSON file with the same shape
+DEFAULT_RULES = [
+    {
+        "name": "tab_switch_then_paste",
+        "steps": [{"type": "TAB_SWITCH"}, {"type": "PASTE_EVENT", "min_paste_length": 100}],
+        "within_ms": 3000,
+        "weight": 0.8
+    },
+    {
+        "name": "blur_then_paste",
+        "steps": [{"type": "WINDOW_BLUR"}, {"type": "PASTE_EVENT", "min_paste_length": 100}],
+        "within_ms": 5000,
+        "weight": 0.6
+    },
+    {
+        "name": "paste_burst",
+        "steps": [{"type": "PASTE_EVENT"}, {"type": "PASTE_EVENT"}, {"type": "PASTE_EVENT"}],
+        "within_ms": 10000,
+        "weight": 0.5
+    },
+]
+
+
+class SequenceRule:
+    __slots__ = ("name", "steps", "within_ms", "weight")
+
+    def __init__(self, name: str, steps: List[Tuple[str, int]], within_ms: int, weight: float):
+        self.name = name
+        self.steps = steps  # (event_type, min_paste_length)
+        self.within_ms = within_ms
+        self.weight = weight
+
+
+def parse_rules(config: List[dict]) -> List[SequenceRule]:
+    """Validate rule dicts (see DEFAULT_RULES)"""
+    rules = []
+    for entry in config:
+        name = entry.get("name")
+        steps = entry.get("steps") or []
+        if not name or not steps or any(not step.get("type") for step in steps):
+            raise ValueError(f"Sequence rule needs a name and steps with a type: {entry!r}")
+        if name in {rule.name for rule in rules}:
+            raise ValueError(f"Duplicate sequence rule {name!r}")
+        rules.append(SequenceRule(
+            name,
+            [(step["type"], int(step.get("min_paste_length", 0))) for step in steps],
+            int(entry.get("within_ms", 3000)),
+            float(entry.get("weight", 0.5))
+        ))
+    return rules
+
+
+def load_rules(path: Optional[str] = None) -> List[SequenceRule]:
+    if not path:
+        return parse_rules(DEFAULT_RULES)
+    with open(path) as f:
+        return parse_rules(json.load(f))
+
+
+class SessionSequences:
+    """Partial matches and finding counts for one session"""
+
+    __slots__ = ("partials", "findings", "last_seen")
+
+    def __init__(self, rules: List[SequenceRule]):
+        # partials[rule][step] = (start timestamp, last timestamp) or None
+        self.partials = [[None] * len(rule.steps) for rule in rules]
+        self.findings: Dict[str, int] = {}
+        self.last_seen = 0.0
+
+
+class SequenceAnalyzer:
+    """Runs the sequence rules over every stored event, per session.
+
+    Sessions are bounded like the FeatureStore (idle eviction and a size
+    cap). A session's findings cover its whole stored history; the overall
+    findings are a running total over every stored event, which eviction
+    doesn't reduce (a restart recomputes it from the stored raw events).
+    Findings are also counted per minute in a RollingWindows for ?window=
+    and decayed risk.
+    """
+
+    def __init__(self, rules: List[SequenceRule], idle_ttl: float = 3600, max_sessions: int = 10000,
+                 horizon_minutes: int = 60):
+        self.rules = rules
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.weights = {rule.name: rule.weight for rule in rules}
+        # {event_type: [(rule index, step index, min_paste_length)]}, later steps
+        # first so one event never advances the same rule twice
+        self._dispatch: Dict[str, List[Tuple[int, int, int]]] = {}
+        for r, rule in enumerate(rules):
+            for s in reversed(range(len(rule.steps))):
+                event_type, min_length = rule.steps[s]
+                self._dispatch.setdefault(event_type, []).append((r, s, min_length))
+        self._sessions: "OrderedDict[str, SessionSequences]" = OrderedDict()
+        self._totals: Dict[str, int] = {}
+        self.windows = RollingWindows(horizon_minutes=horizon_minutes, max_sessions=max_sessions)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _advance(self, session: SessionSequences, event_type: str, timestamp_ms: int,
+                 paste_length: Optional[int]) -> List[str]:
+        matched = []
+        done = -1
+        for r, s, min_length in self._dispatch.get(event_type, ()):
+            if r == done or (min_length and (paste_length or 0) < min_length):
+                continue
+            partial = session.partials[r]
+            if s == 0:
+                partial[0] = (timestamp_ms, timestamp_ms)
+                continue
+            previous = partial[s - 1]
+            if previous is None or timestamp_ms < previous[1] or timestamp_ms - previous[0] > self.rules[r].within_ms:
+                continue
+            if s == len(partial) - 1:
+                rule = self.rules[r].name
+                session.findings[rule] = session.findings.get(rule, 0) + 1
+                matched.append(rule)
+                partial[:] = [None] * len(partial)
+                done = r
+            else:
+                partial[s] = (previous[0], timestamp_ms)
+        return matched
+
+    def update(self, session_id: str, event_type: str, timestamp_ms: int,
+               paste_length: Optional[int] = None) -> List[str]:
+        """Feed one stored event; returns the names of the rules it completed"""
+        if event_type not in self._dispatch:
+            return []
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = SessionSequences(self.rules)
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_seen = now
+            matched = self._advance(session, event_type, timestamp_ms, paste_length)
+            for rule in matched:
+                self._totals[rule] = self._totals.get(rule, 0) + 1
+            self._evict(now)
+        for rule in matched:
+            self.windows.add(session_id, rule, minute_of(timestamp_ms))
+        return matched
+
+    def _evict(self, now: float):
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if len(self._sessions) <= self.max_sessions and now - oldest.last_seen < self.idle_ttl:
+                break
+            self._sessions.popitem(last=False)
+
+    def findings(self, session_id: Optional[str] = None) -> Optional[Dict[str, int]]:
+        """Finding counts for a session (None if it isn't held), or over all sessions"""
+        with self._lock:
+            if session_id is None:
+                return dict(self._totals)
+            session = self._sessions.get(session_id)
+            return dict(session.findings) if session is not None else None
+
+    def risk(self, findings: Dict[str, float]) -> float:
+        """Risk implied by finding counts: each rule adds count * weight, capped at 1"""
+        return min(sum(count * self.weights.get(rule, 0.0) for rule, count in findings.items()), 1.0)
+
+    async def _replay(self, reader, **filters):
+        """Stored events of the types the rules use, in id order, a page at a time"""
+        if not self._dispatch:
+            return
+        after_id = None
+        while True:
+            rows = await reader.select_events(
+                event_types=sorted(self._dispatch), after_id=after_id, limit=5000, **filters
+            )
+            for row in rows:
+                yield row
+            if len(rows) < 5000:
+                return
+            after_id = rows[-1][0]
+
+    async def load_session(self, reader, session_id: str) -> Dict[str, int]:
+        """Recompute one session's findings (e.g. after eviction) from its stored events"""
+        session = SessionSequences(self.rules)
+        async for _, _, event_type, _, timestamp, paste_length, _ in self._replay(reader, session_id=session_id):
+            self._advance(session, event_type, timestamp, paste_length)
+        return session.findings
+
+    async def rebuild(self, reader):
+        """Replay the stored events into the overall findings, holding the sessions active within idle_ttl (at startup)"""
+        since = int((time.time() - self.idle_ttl) * 1000)
+        # Least recently active first, so eviction order matches a running server
+        active = sorted(await reader.active_sessions(since), key=lambda row: row[1])[-self.max_sessions:]
+        held = {session_id for session_id, _ in active}
+        windows = RollingWindows(horizon_minutes=self.windows.horizon, max_sessions=self.max_sessions)
+        states: Dict[str, SessionSequences] = {}
+        totals: Dict[str, int] = {}
+        async for _, session_id, event_type, _, timestamp, paste_length, _ in self._replay(reader):
+            session = states.get(session_id)
+            if session is None:
+                session = states[session_id] = SessionSequences(self.rules)
+            for rule in self._advance(session, event_type, timestamp, paste_length):
+                totals[rule] = totals.get(rule, 0) + 1
+                if session_id in held:
+                    windows.add(session_id, rule, minute_of(timestamp))
+        now = time.time()
+        sessions: "OrderedDict[str, SessionSequences]" = OrderedDict()
+        for session_id, _ in active:
+            session = sessions[session_id] = states.get(session_id) or SessionSequences(self.rules)
+            session.last_seen = now
+        with self._lock:
+            self._sessions = sessions
+            self._totals = totals
+        self.windows = windows
@@ -0,0 +1,76 @@
+"""Run the API with several uvicorn workers sharing one writer process.
+
+    WEB_CONCURRENCY=4 python serve.py
+
+The writer process owns the SQLite file and group commits the rows every
+worker sends it; workers read through their own read-only connections.
+With WEB_CONCURRENCY=1 (the default) this is the same as running
+`uvicorn app:app` directly.
+"""
+import multiprocessing
+import os
+import secrets
+import tempfile
+
+import uvicorn
+
+import writer_service
+
+
+def main():
+    port = int(os.environ.get("PORT", 8000))
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    if workers <= 1:
+        uvicorn.run("app:app", host="0.0.0.0", port=port)
+        return
+    if os.environ.get("DATABASE_URL", "").startswith(("postgres://", "postgresql://")):
+        # The writer process and shared totals are built around the SQLite file
+        raise SystemExit("WEB_CONCURRENCY > 1 is only supported with the SQLite database")
+    if os.environ.get("INGEST_MODE") == "log":
+        # Each worker would append to, and consume, its own log
+        raise SystemExit("WEB_CONCURRENCY > 1 is not supported with INGEST_MODE=log")
+    if os.environ.get("KEYSTROKE_MODE", "raw") == "aggregate":
+        # Workers follow each other through the events table, which keystroke summaries bypass
+        raise SystemExit("WEB_CONCURRENCY > 1 is not supported with KEYSTROKE_MODE=aggregate")
+
+    runtime_dir = tempfile.mkdtemp(prefix="fairround-")
+    address = os.environ.get("WRITER_SOCKET") or os.path.join(runtime_dir, "writer.sock")
+    if os.path.exists(address):
+        os.unlink(address)  # left over from a previous run
+    authkey = secrets.token_bytes(32)
+    aggregates_path = os.environ.get("SHARED_AGGREGATES_PATH") or os.path.join(runtime_dir, "aggregates")
+
+    ready = multiprocessing.Event()
+    writer = multiprocessing.Process(
+        target=writer_service.run,
+        name="event-writer",
+        kwargs={
+            "ready": ready,
+            "database_path": os.environ.get("DATABASE_PATH", "interview_data.db"),
+            "address": address,
+            "authkey": authkey,
+            "aggregates_path": aggregates_path,
+            "retention_hours": float(os.environ.get("EVENT_RETENTION_HOURS", 168)),
+            "maintenance_interval": float(os.environ.get("MAINTENANCE_INTERVAL_S", 3600)),
+            "maintenance_batch_size": int(os.environ.get("MAINTENANCE_BATCH_SIZE", 5000)),
+        },
+    )
+    writer.start()
+    # Workers open the database read-only, so the writer has to create it first
+    while not ready.wait(0.5):
+        if not writer.is_alive():
+            raise SystemExit("Writer process failed to start")
+
+    # Inherited by the worker processes uvicorn spawns
+    os.environ["WRITER_SOCKET"] = address
+    os.environ["WRITER_AUTHKEY"] = authkey.hex()
+    os.environ["SHARED_AGGREGATES_PATH"] = aggregates_path
+    try:
+        uvicorn.run("app:app", host="0.0.0.0", port=port, workers=workers)
+    finally:
+        writer.terminate()
+        writer.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Dict, Optional, Tuple
+
+from aggregates import EventCounters
+
+logger = logging.getLogger(__name__)
+
+# Header: sequence number (odd while the writer is mid-update), last committed event id, slots in use
+_HEADER = struct.Struct("<QqI4x")
+# Slot: utf-8 event type (NUL padded), count
+NAME_BYTES = 64
+_SLOT = struct.Struct(f"<{NAME_BYTES}sq")
+MAX_TYPES = 256
+# Types that don't fit (too many, or names too long) are counted here
+OVERFLOW_TYPE = "OTHER"
+SIZE = _HEADER.size + MAX_TYPES * _SLOT.size
+
+
+class SharedAggregates:
+    """Per-type event totals and the last committed event id in a memory-mapped file.
+
+    One process (the writer) publishes; any number of workers read. Readers
+    never lock: they retry if the sequence number was odd or changed while
+    they were copying (a seqlock).
+    """
+
+    def __init__(self, path: str, create: bool = False):
+        self.path = path
+        flags = os.O_RDWR | (os.O_CREAT | os.O_TRUNC if create else 0)
+        fd = os.open(path, flags, 0o600)
+        try:
+            if create:
+                os.ftruncate(fd, SIZE)
+            self._map = mmap.mmap(fd, SIZE)
+        finally:
+            os.close(fd)
+        self._slots: Dict[str, int] = {}
+
+    @classmethod
+    def create(cls, path: str) -> "SharedAggregates":
+        return cls(path, create=True)
+
+    @classmethod
+    def attach(cls, path: str) -> "SharedAggregates":
+        return cls(path)
+
+    def _slot(self, event_type: str, used: int) -> Tuple[int, int]:
+        """Slot index for event_type, claiming a new one if needed; returns (slot, slots in use)"""
+        slot = self._slots.get(event_type)
+        if slot is not None:
+            return slot, used
+        name = event_type.encode()
+        if event_type != OVERFLOW_TYPE and (len(name) > NAME_BYTES or used >= MAX_TYPES - 1):
+            # The last slot is kept free for the overflow bucket
+            logger.warning("Counting event type %r as %s in shared aggregates", event_type, OVERFLOW_TYPE)
+            slot, used = self._slot(OVERFLOW_TYPE, used)
+            self._slots[event_type] = slot
+            return slot, used
+        slot = self._slots[event_type] = used
+        _SLOT.pack_into(self._map, _HEADER.size + slot * _SLOT.size, name, 0)
+        return slot, used + 1
+
+    def publish(self, last_id: int, increments: Dict[str, int]):
+        """Writer side: add per-type increments and advance the committed id"""
+        seq, _, used = _HEADER.unpack_from(self._map, 0)
+        _HEADER.pack_into(self._map, 0, seq + 1, last_id, used)
+        for event_type, count in increments.items():
+            slot, used = self._slot(event_type, used)
+            offset = _HEADER.size + slot * _SLOT.size
+            name, current = _SLOT.unpack_from(self._map, offset)
+            _SLOT.pack_into(self._map, offset, name, current + count)
+        _HEADER.pack_into(self._map, 0, seq + 2, last_id, used)
+
+    def read(self):
+        """Reader side: (last committed id, {event_type: count})"""
+        while True:
+            seq, last_id, used = _HEADER.unpack_from(self._map, 0)
+            if seq % 2 == 0:
+                counts = {}
+                for slot in range(min(used, MAX_TYPES)):
+                    name, count = _SLOT.unpack_from(self._map, _HEADER.size + slot * _SLOT.size)
+                    counts[name.rstrip(b"\0").decode()] = count
+                if _HEADER.unpack_from(self._map, 0)[0] == seq:
+                    return last_id, counts
+            time.sleep(0)
+
+    @property
+    def last_id(self) -> int:
+        return _HEADER.unpack_from(self._map, 0)[1]
+
+    def close(self):
+        self._map.close()
+
+
+class SharedEventCounters(EventCounters):
+    """EventCounters backed by the writer process's SharedAggregates.
+
+    Counts are maintained by the writer, so add(), add_count() and rebuild() do
+    nothing here.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.shared: Optional[SharedAggregates] = None
+
+    def attach(self, shared: SharedAggregates):
+        self.shared = shared
+
+    async def rebuild(self, reader):
+        pass
+
+    def add(self, event_types):
+        pass
+
+    def add_count(self, event_type, count):
+        pass
+
+    def snapshot(self) -> Dict[str, int]:
+        return self.shared.read()[1] if self.shared is not None else {}
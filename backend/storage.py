@@ -0,0 +1,255 @@
+"""Event storage behind one async interface.
+
+The API only talks to an EventStore: SQLiteEventStore (below) keeps the
+single-file database, and PostgresEventStore (postgres.py) stores the same
+tables in Postgres or TimescaleDB. Rows passed to insert() are
+(event_type, payload, timestamp, session_id, paste_length, tab_id).
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from codec import get_codec
+from db import (
+    Database, active_sessions, event_type_counts, insert_keystroke_summaries, insert_rows, latest_events,
+    log_checkpoint, max_event_id, migrate_payloads, migrate_timestamps, replace_rollups, rollup_totals,
+    select_events, select_keystroke_summaries, select_rollups, session_events, session_timeline
+)
+from maintenance import RetentionJob
+
+
+class EventReader:
+    """Read queries, served by an EventStore or by one of its snapshots.
+
+    Timestamps, in and out, are integer epoch milliseconds.
+    """
+
+    async def max_event_id(self) -> int:
+        raise NotImplementedError
+
+    async def type_counts(self, session_id: Optional[str] = None) -> Dict[str, int]:
+        """All-time per-type counts: rollups below the compaction watermark plus raw events above it"""
+        raise NotImplementedError
+
+    async def rollup_totals(self) -> Dict[str, int]:
+        """Per-type totals over the rollups, which cover raw and compacted events"""
+        raise NotImplementedError
+
+    async def rollups(self, since_minute: int, session_id: Optional[str] = None) -> list:
+        """(session_id, minute, event_type, count) after since_minute, oldest first"""
+        raise NotImplementedError
+
+    async def latest_events(self, limit: int) -> list:
+        """(id, event_type, data, timestamp, paste_length, tab_id), newest first"""
+        raise NotImplementedError
+
+    async def active_sessions(self, since: int) -> list:
+        """(session_id, last timestamp) of sessions with events since `since`"""
+        raise NotImplementedError
+
+    async def session_timeline(self, session_id: str) -> list:
+        """(event_type, timestamp) of a session's events in time order"""
+        raise NotImplementedError
+
+    async def session_events(
+        self, session_id: str, before: Optional[int] = None, limit: int = 50, before_id: Optional[int] = None
+    ) -> list:
+        """(id, event_type, data, timestamp, paste_length, tab_id) of a session, newest first by (timestamp, id)"""
+        raise NotImplementedError
+
+    async def keystroke_summaries(self, session_id: Optional[str] = None, since_minute: Optional[int] = None) -> list:
+        """Keystroke summary rows (in keystrokes.SUMMARY_COLUMNS order), oldest minute first"""
+        raise NotImplementedError
+
+    async def select_events(
+        self,
+        session_id: Optional[str] = None,
+        event_types: Optional[List[str]] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> list:
+        """(id, session_id, event_type, data, timestamp, paste_length, tab_id) in id order"""
+        raise NotImplementedError
+
+
+class EventStore(EventReader):
+    """Persistence used by the API. Read queries each see the latest committed state."""
+
+    async def open(self):
+        raise NotImplementedError
+
+    async def close(self):
+        raise NotImplementedError
+
+    def snapshot(self):
+        """Async context manager yielding an EventReader over one consistent snapshot"""
+        raise NotImplementedError
+
+    async def insert(self, rows: List[tuple], log_offset: Optional[int] = None, summaries: List[tuple] = ()) -> List[int]:
+        """Store rows, their rollups, any keystroke summaries and the event log checkpoint in one transaction"""
+        raise NotImplementedError
+
+    async def log_checkpoint(self) -> int:
+        """Event log offset materialized so far (see eventlog.py)"""
+        raise NotImplementedError
+
+    async def replace_rollups(self, increments: List[tuple]):
+        """Swap all of event_rollups for (session_id, minute, event_type, count) rows (see replay.py)"""
+        raise NotImplementedError
+
+    async def insert_keystroke_summaries(self, summaries: List[tuple]):
+        """Merge keystroke summary rows into keystroke_summaries, and their counts into the rollups"""
+        raise NotImplementedError
+
+    def export_events(self, chunk_size: int = 1000, **filters) -> AsyncIterator[list]:
+        """select_events rows in chunks, from one snapshot, without loading them all"""
+        raise NotImplementedError
+
+    async def compact(self) -> dict:
+        """Run the retention/compaction job once"""
+        raise NotImplementedError
+
+
+class _SQLiteQueries(EventReader):
+    """EventReader over sqlite3; subclasses decide which connection runs each query"""
+
+    async def _run(self, query, *args):
+        raise NotImplementedError
+
+    async def max_event_id(self) -> int:
+        return await self._run(max_event_id)
+
+    async def type_counts(self, session_id: Optional[str] = None) -> Dict[str, int]:
+        return await self._run(event_type_counts, session_id)
+
+    async def rollup_totals(self) -> Dict[str, int]:
+        return await self._run(rollup_totals)
+
+    async def rollups(self, since_minute: int, session_id: Optional[str] = None) -> list:
+        return await self._run(select_rollups, since_minute, session_id)
+
+    async def latest_events(self, limit: int) -> list:
+        return await self._run(latest_events, limit)
+
+    async def active_sessions(self, since: int) -> list:
+        return await self._run(active_sessions, since)
+
+    async def session_timeline(self, session_id: str) -> list:
+        return await self._run(session_timeline, session_id)
+
+    async def session_events(
+        self, session_id: str, before: Optional[int] = None, limit: int = 50, before_id: Optional[int] = None
+    ) -> list:
+        return await self._run(session_events, session_id, before, limit, before_id)
+
+    async def keystroke_summaries(self, session_id: Optional[str] = None, since_minute: Optional[int] = None) -> list:
+        return await self._run(select_keystroke_summaries, session_id, since_minute)
+
+    async def select_events(self, **filters) -> list:
+        return await self._run(lambda conn: select_events(conn, **filters).fetchall())
+
+
+class _SQLiteSnapshot(_SQLiteQueries):
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def _run(self, query, *args):
+        return await asyncio.to_thread(query, self.conn, *args)
+
+
+class SQLiteEventStore(_SQLiteQueries, EventStore):
+    """The single-file SQLite database (see db.Database).
+
+    With a writer_client (multi-worker mode, see serve.py) the file is opened
+    read-only and inserts and compaction go to the writer process instead.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        observe: Optional[Callable[[str, float], None]] = None,
+        writer_client=None,
+        retention_hours: float = 0,
+        maintenance_batch_size: int = 5000
+    ):
+        self.path = path
+        self.observe = observe
+        self.writer_client = writer_client
+        self.retention_hours = retention_hours
+        self.maintenance_batch_size = maintenance_batch_size
+        self.db: Optional[Database] = None
+        self.retention_job: Optional[RetentionJob] = None
+
+    def _open(self):
+        if self.writer_client is not None:
+            self.db = Database(self.path, observe=self.observe, writable=False)
+        else:
+            self.db = Database(self.path, observe=self.observe)
+            migrate_timestamps(self.db)
+            migrate_payloads(self.db, get_codec())
+            self.retention_job = RetentionJob(self.db, self.retention_hours, batch_size=self.maintenance_batch_size)
+
+    async def open(self):
+        await asyncio.to_thread(self._open)
+
+    async def close(self):
+        if self.writer_client is not None:
+            self.writer_client.close()
+        await asyncio.to_thread(self.db.close)
+
+    async def _run(self, query, *args):
+        def run():
+            with self.db.read() as conn:
+                return query(conn, *args)
+        return await asyncio.to_thread(run)
+
+    @asynccontextmanager
+    async def snapshot(self):
+        # A connection of its own, so a cancelled caller can't strand a pooled one
+        conn = await asyncio.to_thread(self.db.open_reader)
+        try:
+            conn.execute("BEGIN")
+            yield _SQLiteSnapshot(conn)
+        finally:
+            conn.close()
+
+    async def insert(self, rows: List[tuple], log_offset: Optional[int] = None, summaries: List[tuple] = ()) -> List[int]:
+        if self.writer_client is not None:
+            if log_offset is not None or summaries:
+                raise RuntimeError("INGEST_MODE=log and KEYSTROKE_MODE=aggregate are not supported in multi-worker mode")
+            first_id = await asyncio.to_thread(self.writer_client.insert, rows)
+        else:
+            first_id, _ = await asyncio.to_thread(insert_rows, self.db, rows, log_offset, summaries)
+        return list(range(first_id, first_id + len(rows)))
+
+    async def log_checkpoint(self) -> int:
+        return await self._run(log_checkpoint)
+
+    async def replace_rollups(self, increments: List[tuple]):
+        await asyncio.to_thread(replace_rollups, self.db, increments)
+
+    async def insert_keystroke_summaries(self, summaries: List[tuple]):
+        if self.writer_client is not None:
+            # Workers follow each other through the events table, which summaries bypass
+            raise RuntimeError("KEYSTROKE_MODE=aggregate is not supported in multi-worker mode")
+        await asyncio.to_thread(insert_keystroke_summaries, self.db, summaries)
+
+    async def export_events(self, chunk_size: int = 1000, **filters) -> AsyncIterator[list]:
+        # The cursor (and its snapshot) lives on a dedicated connection for the whole export
+        conn = await asyncio.to_thread(self.db.open_reader)
+        try:
+            rows = await asyncio.to_thread(select_events, conn, **filters)
+            while True:
+                chunk = await asyncio.to_thread(rows.fetchmany, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            conn.close()
+
+    async def compact(self) -> dict:
+        if self.writer_client is not None:
+            return await asyncio.to_thread(self.writer_client.call, "compact")
+        return await asyncio.to_thread(self.retention_job.run_once)
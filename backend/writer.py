@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class EventWriter:
+    """Write-behind queue that drains event rows into the database in batches.
+
+    A batch that still fails after max_retries retries is logged and dropped,
+    so one bad batch can't stall the queue behind it; on_drop is then called
+    with the keys the rows were submitted with.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List[tuple]], Awaitable],
+        flush_interval: float = 0.2,
+        max_batch: int = 500,
+        max_queue: int = 10000,
+        max_retries: int = 5,
+        on_drop: Optional[Callable[[list], None]] = None
+    ):
+        self.flush = flush
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.on_drop = on_drop
+        # Created in start(), on the event loop that drains it
+        self.queue: Optional[asyncio.Queue] = None
+        self.dropped = 0
+        self._task: Optional[asyncio.Task] = None
+        # (row, key) pairs taken off the queue
+        self._pending: List[tuple] = []
+        self._closing = False
+
+    @property
+    def depth(self) -> int:
+        return (self.queue.qsize() if self.queue is not None else 0) + len(self._pending)
+
+    def has_room(self, count: int = 1) -> bool:
+        return self.queue is not None and self.queue.maxsize - self.queue.qsize() >= count
+
+    def submit(self, row: tuple, key=None):
+        """Enqueue a row; raises asyncio.QueueFull when the queue is at capacity"""
+        self.queue.put_nowait((row, key))
+
+    def start(self):
+        if self._task is None:
+            self._closing = False
+            self.queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued, then stop the background task"""
+        if self._task is not None:
+            self._closing = True
+            await self._task
+            self._task = None
+
+    def _drain_into_pending(self, limit: int):
+        while len(self._pending) < limit:
+            try:
+                self._pending.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+
+    async def _run(self):
+        failures = 0
+        while True:
+            if not self._pending:
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    if self._closing:
+                        return
+                    continue
+                self._pending.append(item)
+
+            # Collect until the batch is full or the flush interval has passed
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._pending) < self.max_batch:
+                self._drain_into_pending(self.max_batch)
+                remaining = deadline - time.monotonic()
+                if len(self._pending) >= self.max_batch or remaining <= 0 or self._closing:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                self._pending.append(item)
+
+            batch = self._pending[:self.max_batch]
+            try:
+                await self.flush([row for row, _ in batch])
+            except Exception:
+                if self._closing:
+                    logger.exception("Dropping %d events that failed to flush on shutdown", len(batch))
+                    self._drop(batch)
+                elif failures < self.max_retries:
+                    # Keep the batch and retry on the next cycle
+                    failures += 1
+                    logger.exception(
+                        "Failed to flush %d events, retry %d of %d", len(batch), failures, self.max_retries
+                    )
+                    await asyncio.sleep(self.flush_interval)
+                    continue
+                else:
+                    logger.exception("Dropping %d events after %d failed retries", len(batch), self.max_retries)
+                    self._drop(batch)
+            failures = 0
+            del self._pending[:len(batch)]
+
+    def _drop(self, batch: List[tuple]):
+        self.dropped += len(batch)
+        if self.on_drop is not None:
+            self.on_drop([key for _, key in batch])
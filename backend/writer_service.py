@@ -0,0 +1,198 @@
+"""Single writer process for multi-worker deployments.
+
+Web workers open the database read-only and send event rows here over an
+authenticated Unix socket. Rows arriving from all workers are group
+committed, and the per-type totals and last committed id are published to
+a SharedAggregates file the workers read.
+"""
+import asyncio
+import logging
+import queue
+import threading
+from multiprocessing.connection import Client, Listener
+from typing import Callable, List, Optional
+
+from codec import get_codec
+from db import Database, insert_rows, max_event_id, migrate_payloads, migrate_timestamps, rollup_totals
+from maintenance import RetentionJob
+from shared import SharedAggregates
+
+logger = logging.getLogger(__name__)
+
+
+class WriterClient:
+    """Connections from a web worker to the writer process, one per concurrent caller"""
+
+    def __init__(self, address: str, authkey: bytes, observe: Optional[Callable[[str, float], None]] = None):
+        self.address = address
+        self.authkey = authkey
+        self.observe = observe
+        self._idle: queue.Queue = queue.Queue()
+
+    def call(self, command: str, *args):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+        try:
+            conn.send((command, args))
+            ok, result = conn.recv()
+        except (EOFError, OSError):
+            # The writer restarted; the next call opens a fresh connection
+            conn.close()
+            raise
+        self._idle.put(conn)
+        if not ok:
+            raise RuntimeError(f"Writer process failed: {result}")
+        return result
+
+    def insert(self, rows: List[tuple]) -> int:
+        """Store rows; returns the id of the first one (ids are contiguous)"""
+        first_id, timings = self.call("insert", rows)
+        if self.observe is not None:
+            for op, seconds in timings:
+                self.observe(op, seconds)
+        return first_id
+
+    def close(self):
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+
+class _Pending:
+    __slots__ = ("rows", "done", "result", "error")
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class WriterService:
+    """Accepts rows from web workers and group commits them on one connection"""
+
+    def __init__(
+        self,
+        database_path: str,
+        address: str,
+        authkey: bytes,
+        aggregates_path: str,
+        max_batch: int = 5000,
+        retention_hours: float = 0,
+        maintenance_interval: float = 3600,
+        maintenance_batch_size: int = 5000
+    ):
+        self.address = address
+        self.authkey = authkey
+        self.max_batch = max_batch
+        self._timings = []
+        self._flush_thread = threading.Thread(target=self._flush_loop, name="writer-flush", daemon=True)
+        self.db = Database(database_path, observe=self._observe)
+        migrate_timestamps(self.db)
+        migrate_payloads(self.db, get_codec())
+
+        # Publish the current totals before any worker reads them
+        with self.db.read() as conn:
+            totals = rollup_totals(conn)
+            last_id = max_event_id(conn)
+        self.aggregates = SharedAggregates.create(aggregates_path)
+        self.aggregates.publish(last_id, totals)
+
+        self.retention_job = None
+        if retention_hours > 0:
+            self.retention_job = RetentionJob(self.db, retention_hours, batch_size=maintenance_batch_size)
+            self.maintenance_interval = maintenance_interval
+        self._pending: queue.Queue = queue.Queue()
+
+    def _observe(self, op: str, seconds: float):
+        # Timings of the flush thread's transactions are passed back to the workers
+        if threading.current_thread() is self._flush_thread:
+            self._timings.append((op, seconds))
+
+    def _flush_loop(self):
+        while True:
+            batch = [self._pending.get()]
+            count = len(batch[0].rows)
+            while count < self.max_batch:
+                try:
+                    item = self._pending.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+                count += len(item.rows)
+            self._flush(batch)
+
+    def _flush(self, batch: List[_Pending]):
+        rows = [row for item in batch for row in item.rows]
+        self._timings = []
+        try:
+            first_id, _ = insert_rows(self.db, rows)
+        except Exception as e:
+            logger.exception("Failed to store %d events", len(rows))
+            for item in batch:
+                item.error = e
+                item.done.set()
+            return
+
+        increments = {}
+        for row in rows:
+            increments[row[0]] = increments.get(row[0], 0) + 1
+        self.aggregates.publish(first_id + len(rows) - 1, increments)
+
+        timings = self._timings
+        for item in batch:
+            item.result = (first_id, timings)
+            first_id += len(item.rows)
+            item.done.set()
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    command, args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if command == "insert":
+                        pending = _Pending(args[0])
+                        self._pending.put(pending)
+                        pending.done.wait()
+                        if pending.error is not None:
+                            raise pending.error
+                        reply = (True, pending.result)
+                    elif command == "compact":
+                        if self.retention_job is None:
+                            raise RuntimeError("Retention is disabled (EVENT_RETENTION_HOURS=0)")
+                        reply = (True, self.retention_job.run_once())
+                    else:
+                        raise ValueError(f"Unknown command {command!r}")
+                except Exception as e:
+                    reply = (False, str(e))
+                conn.send(reply)
+
+    def serve_forever(self, ready: Optional[threading.Event] = None):
+        self._flush_thread.start()
+        if self.retention_job is not None:
+            threading.Thread(
+                target=asyncio.run, args=(self.retention_job.run_forever(self.maintenance_interval),),
+                name="writer-retention", daemon=True
+            ).start()
+        with Listener(self.address, family="AF_UNIX", authkey=self.authkey) as listener:
+            logger.info("Writer process listening on %s", self.address)
+            if ready is not None:
+                ready.set()
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception:
+                    # Typically a failed authentication; keep serving the others
+                    logger.exception("Rejected writer connection")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+
+def run(ready=None, **kwargs):
+    """Process entry point (see serve.py)"""
+    logging.basicConfig(level=logging.INFO)
+    WriterService(**kwargs).serve_forever(ready)
@@ -201,6 +201,7 @@ class InterviewMonitor {
       data: {
         count: this.pasteCount,
         url: sender.tab?.url || 'unknown',
+        length: message.length || 0,
         risk: this.calculateRisk()
       }
     });
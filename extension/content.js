@@ -60,6 +60,7 @@ document.addEventListener('paste', (event) => {
     chrome.runtime.sendMessage({
         type: 'PASTE_EVENT',
         url: window.location.href,
+        length: event.clipboardData ? event.clipboardData.getData('text').length : 0,
         timestamp: Date.now()
     }).catch(error => {
         // Background script might not be ready, that's ok
@@ -513,7 +513,7 @@
 
 // export default App;
 
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, PieChart, Pie, Cell, ResponsiveContainer, BarChart, Bar } from 'recharts';
 import { Activity, RefreshCw, Trash2, AlertCircle, Shield, TrendingUp, Eye } from 'lucide-react';
 import './App.css';
@@ -522,6 +522,8 @@ const API_BASE_URL = process.env.NODE_ENV === 'production'
   ? process.env.REACT_APP_API_URL || 'https://ai-interview-monitor-backend.onrender.com' 
   : 'http://localhost:8000';
 
+const WS_BASE_URL = API_BASE_URL.replace(/^http/, 'ws');
+
 function App() {
   const [riskData, setRiskData] = useState([]);
   const [events, setEvents] = useState([]);
@@ -529,38 +531,64 @@ function App() {
   const [isLoading, setIsLoading] = useState(true);
   const [lastUpdated, setLastUpdated] = useState(null);
   const [totalEvents, setTotalEvents] = useState(0);
+  const eventCounts = useRef({});
 
   const COLORS = ['#3B82F6', '#8B5CF6', '#EC4899', '#F59E0B', '#10B981', '#06B6D4'];
 
   useEffect(() => {
-    fetchRiskData();
-    const interval = setInterval(fetchRiskData, 5000);
-    return () => clearInterval(interval);
+    // Live updates: WebSocket first, then server-sent events, then polling
+    let socket = null;
+    let source = null;
+    let interval = null;
+    let stopped = false;
+
+    const startPolling = () => {
+      if (stopped || interval) return;
+      fetchRiskData();
+      interval = setInterval(fetchRiskData, 5000);
+    };
+
+    const startStream = () => {
+      if (stopped) return;
+      if (!window.EventSource) {
+        startPolling();
+        return;
+      }
+      source = new EventSource(`${API_BASE_URL}/api/risk-summary/stream`);
+      source.onmessage = (message) => applyUpdate(JSON.parse(message.data));
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) startPolling();
+      };
+    };
+
+    socket = new WebSocket(`${WS_BASE_URL}/ws/risk`);
+    socket.onmessage = (message) => applyUpdate(JSON.parse(message.data));
+    socket.onclose = () => startStream();
+
+    return () => {
+      stopped = true;
+      if (socket) socket.close();
+      if (source) source.close();
+      if (interval) clearInterval(interval);
+    };
   }, []);
 
+  const applyUpdate = (update) => {
+    // Deltas only carry the counts that changed since the previous message
+    eventCounts.current = update.type === 'delta'
+      ? { ...eventCounts.current, ...update.event_counts }
+      : update.event_counts;
+    applySummary({ ...update, event_counts: eventCounts.current });
+    setIsLoading(false);
+  };
+
   const fetchRiskData = async () => {
     try {
       setIsLoading(true);
       const response = await fetch(`${API_BASE_URL}/api/risk-summary`);
       const data = await response.json();
-      
-      setOverallRisk(data.overall_risk);
-      setTotalEvents(data.total_events || 0);
-      setLastUpdated(new Date().toLocaleTimeString());
-
-      const eventEntries = Object.entries(data.event_counts || {});
-      const chartData = eventEntries.map(([name, value]) => ({
-        name: name.replace('_', ' ').toUpperCase(),
-        value,
-        originalName: name
-      }));
-      setEvents(chartData);
-
-      const newRiskPoint = {
-        time: new Date().toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' }),
-        risk: data.overall_risk * 100
-      };
-      setRiskData(prev => [...prev, newRiskPoint].slice(-10));
+      eventCounts.current = data.event_counts || {};
+      applySummary(data);
     } catch (error) {
       console.error('Error fetching data:', error);
     } finally {
@@ -568,6 +596,26 @@ function App() {
     }
   };
 
+  const applySummary = (data) => {
+    setOverallRisk(data.overall_risk);
+    setTotalEvents(data.total_events || 0);
+    setLastUpdated(new Date().toLocaleTimeString());
+
+    const eventEntries = Object.entries(data.event_counts || {});
+    const chartData = eventEntries.map(([name, value]) => ({
+      name: name.replace('_', ' ').toUpperCase(),
+      value,
+      originalName: name
+    }));
+    setEvents(chartData);
+
+    const newRiskPoint = {
+      time: new Date().toLocaleTimeString([], { hour: '2-digit', minute: '2-digit', second: '2-digit' }),
+      risk: data.overall_risk * 100
+    };
+    setRiskData(prev => [...prev, newRiskPoint].slice(-10));
+  };
+
   const getRiskColor = (risk) => {
     if (risk > 0.7) return 'high';
     if (risk > 0.4) return 'medium';
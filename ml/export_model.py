@@ -0,0 +1,96 @@
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import joblib
+
+# The evaluator lives with the backend so the server never needs scikit-learn
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from forest import FlatForest  # noqa: E402
+
+DEFAULT_MODEL = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'ml_models', 'behavior_model.pkl'
+)
+
+
+def flatten_forest(model):
+    """Flatten a fitted RandomForestClassifier into FlatForest node arrays"""
+    classes = list(model.classes_)
+    positive = classes.index(1) if 1 in classes else len(classes) - 1
+
+    feature, threshold, left, right, value, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        leaf = tree.children_left == -1
+        counts = tree.value[:, 0, :]
+
+        feature.append(np.where(leaf, -1, tree.feature))
+        threshold.append(tree.threshold)
+        left.append(np.where(leaf, -1, tree.children_left + offset))
+        right.append(np.where(leaf, -1, tree.children_right + offset))
+        value.append(counts[:, positive] / counts.sum(axis=1))
+        roots.append(offset)
+
+        offset += tree.node_count
+        max_depth = max(max_depth, tree.max_depth)
+
+    return FlatForest({
+        'feature': np.concatenate(feature).astype(np.int32),
+        'threshold': np.concatenate(threshold).astype(np.float64),
+        'left': np.concatenate(left).astype(np.int32),
+        'right': np.concatenate(right).astype(np.int32),
+        'value': np.concatenate(value).astype(np.float64),
+        'roots': np.asarray(roots, dtype=np.int32),
+        'max_depth': np.asarray(max_depth, dtype=np.int32)
+    })
+
+
+def check_parity(model, forest, n_samples=10000, seed=0):
+    """Largest difference between the sklearn and flattened probabilities"""
+    rng = np.random.default_rng(seed)
+    n_features = model.n_features_in_
+    # Cover the training ranges plus values well outside them
+    X = rng.uniform(-50, 600, size=(n_samples, n_features))
+    X[: n_samples // 2, 1:3] = np.round(X[: n_samples // 2, 1:3] / 60)
+    # The variance columns are in ms^2 (see train_behavior.py)
+    X[:, [0, 3]] *= np.abs(X[:, [0, 3]])
+    with warnings.catch_warnings():
+        # The forest was fitted on a DataFrame; plain arrays are fine
+        warnings.simplefilter('ignore', UserWarning)
+        expected = model.predict_proba(X)[:, list(model.classes_).index(1) if 1 in model.classes_ else -1]
+    actual = forest.predict_proba(X)
+    return float(np.max(np.abs(expected - actual)))
+
+
+def export(model_path, output_path, tolerance=1e-9):
+    model = joblib.load(model_path)
+    forest = flatten_forest(model)
+    forest.save(output_path)
+
+    loaded = FlatForest.load(output_path)
+    error = check_parity(model, loaded)
+    print(f"Exported {loaded.n_trees} trees ({len(loaded.feature):,} nodes) to {output_path}")
+    print(f"Max probability difference vs scikit-learn: {error:.2e}")
+    if error > tolerance:
+        raise SystemExit(f"Parity check failed: {error:.2e} > {tolerance:.0e}")
+
+    start = time.perf_counter()
+    FlatForest.load(output_path)
+    print(f"Load time: {(time.perf_counter() - start) * 1000:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the behavior model to a flat NumPy artifact")
+    parser.add_argument('--model', default=DEFAULT_MODEL)
+    parser.add_argument('--output', help="defaults to the model path with a .npz suffix")
+    args = parser.parse_args()
+    export(args.model, args.output or os.path.splitext(args.model)[0] + '.npz')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,43 +1,80 @@
+import argparse
+import os
+import time
+
 import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 import joblib
 
-# Generate synthetic data
-def generate_synthetic_data(n_samples=1000):
-    data = []
-    for _ in range(n_samples):
-        # Genuine user
-        data.append({
-            'typing_variance': np.random.uniform(50, 200),
-            'paste_count': np.random.randint(0, 2),
-            'tab_switch_count': np.random.randint(0, 3),
-            'response_time_variance': np.random.uniform(100, 500),
-            'is_ai_assisted': 0
-        })
-        # AI-assisted user
-        data.append({
-            'typing_variance': np.random.uniform(10, 50),  # More consistent
-            'paste_count': np.random.randint(2, 5),
-            'tab_switch_count': np.random.randint(3, 8),
-            'response_time_variance': np.random.uniform(10, 100),  # Less variance
-            'is_ai_assisted': 1
-        })
-    return pd.DataFrame(data)
-
-# Train model
-df = generate_synthetic_data(500)
-X = df[['typing_variance', 'paste_count', 'tab_switch_count', 'response_time_variance']]
-y = df['is_ai_assisted']
-
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2)
-
-model = RandomForestClassifier(n_estimators=100, random_state=42)
-model.fit(X_train, y_train)
-
-print(f"Model accuracy: {model.score(X_test, y_test):.2f}")
-
-# Save model
-joblib.dump(model, '../backend/ml_models/behavior_model.pkl')
-print("Model saved!")
\ No newline at end of file
+from export_model import export
+
+FEATURES = ['typing_variance', 'paste_count', 'tab_switch_count', 'response_time_variance']
+DEFAULT_OUTPUT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'ml_models', 'behavior_model.pkl'
+)
+
+# Generate synthetic data: n_samples genuine users followed by n_samples AI-assisted users
+def generate_synthetic_data(n_samples=1000, seed=42):
+    rng = np.random.default_rng(seed)
+    n = 2 * n_samples
+    genuine = np.arange(n) < n_samples
+
+    def column(genuine_low, genuine_high, ai_low, ai_high, integer=False):
+        low = np.where(genuine, genuine_low, ai_low)
+        high = np.where(genuine, genuine_high, ai_high)
+        if integer:
+            return rng.integers(low, high)
+        return rng.uniform(low, high)
+
+    # The variances are in ms^2, as backend/features.py serves them: of the
+    # intervals between keystrokes and between consecutive events. They are
+    # drawn as standard deviations in ms and squared.
+    return pd.DataFrame({
+        'typing_variance': column(50, 200, 10, 50) ** 2,  # AI-assisted typing is more consistent
+        'paste_count': column(0, 2, 2, 5, integer=True),
+        'tab_switch_count': column(0, 3, 3, 8, integer=True),
+        'response_time_variance': column(100, 500, 10, 100) ** 2,  # Less variance
+        'is_ai_assisted': (~genuine).astype(np.int64)
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the behavior model on synthetic data")
+    parser.add_argument('--samples', type=int, default=500,
+                        help="rows per class (total rows = 2 x samples)")
+    parser.add_argument('--n-estimators', type=int, default=100)
+    parser.add_argument('--n-jobs', type=int, default=-1,
+                        help="cores used to fit the forest (-1 = all)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--no-export', action='store_true',
+                        help="skip writing the flat .npz artifact the backend serves")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    df = generate_synthetic_data(args.samples, seed=args.seed)
+    print(f"Generated {len(df):,} rows in {time.perf_counter() - start:.2f}s")
+
+    X = df[FEATURES]
+    y = df['is_ai_assisted']
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=args.seed)
+
+    # Train model
+    model = RandomForestClassifier(n_estimators=args.n_estimators, n_jobs=args.n_jobs, random_state=args.seed)
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    print(f"Fitted {args.n_estimators} trees in {time.perf_counter() - start:.2f}s (n_jobs={args.n_jobs})")
+
+    print(f"Model accuracy: {model.score(X_test, y_test):.2f}")
+
+    # Save model
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    joblib.dump(model, args.output)
+    print(f"Model saved to {args.output}")
+
+    if not args.no_export:
+        export(args.output, os.path.splitext(args.output)[0] + '.npz')
+
+if __name__ == '__main__':
+    main()